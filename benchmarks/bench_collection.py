@@ -0,0 +1,77 @@
+"""Compares the steps/s of the collection modes (see config.Collection) on the example contracts.
+
+Run it with:
+
+    poetry run python3 benchmarks/bench_collection.py
+
+ERC20.cairo and contract_final.cairo need the openzeppelin cairo contracts to be installed. The
+loop row runs a plain cairo program without Starknet to show the cost per step of each mode.
+"""
+import asyncio
+from time import perf_counter
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.starknet.testing.starknet import Starknet
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.config import Collection
+
+try:
+    from benchmarks.bench_finalize import LOOP_PROGRAM
+    from benchmarks.workloads import WORKLOADS
+except ImportError:
+    from bench_finalize import LOOP_PROGRAM  # type: ignore
+    from workloads import WORKLOADS  # type: ignore
+
+TRANSACTIONS = 20
+LOOP_ITERATIONS = 20_000
+
+
+def measure_loop(mode: str):
+    """Runs the loop program with the given collection mode and returns its steps/s."""
+    cairo_coverage.configure(collection=mode)
+    cairo_coverage.reset()
+    program = compile_cairo(
+        [(LOOP_PROGRAM, "loop.cairo")], prime=DEFAULT_PRIME, debug_info=True
+    )
+    runner = CairoFunctionRunner(program, layout="plain")
+    start = perf_counter()
+    runner.run("loop", LOOP_ITERATIONS)
+    duration = perf_counter() - start
+    cairo_coverage.report_runs(print_summary=False)
+    return runner.vm.current_step / duration
+
+
+async def measure(workload, mode: str):
+    """Runs the workload with the given collection mode and returns its steps/s."""
+    cairo_coverage.configure(collection=mode)
+    cairo_coverage.reset()
+    transaction = await workload(await Starknet.empty())
+    start = perf_counter()
+    steps = 0
+    for _ in range(TRANSACTIONS):
+        steps += await transaction()
+    duration = perf_counter() - start
+    cairo_coverage.report_runs(print_summary=False)
+    return steps / duration
+
+
+async def main():
+    modes = [Collection.WRAP, Collection.TRACE]
+    print(f"{'Workload':<16}" + "".join(f"{mode + ' (steps/s)':>20}" for mode in modes))
+    print(f"{'loop':<16}" + "".join(f"{measure_loop(mode):>20.0f}" for mode in modes))
+    for name, workload in WORKLOADS.items():
+        try:
+            results = [await measure(workload, mode) for mode in modes]
+        except Exception as exc:  # Missing dependency (e.g. openzeppelin).
+            print(f"{name:<16} skipped: {str(exc).splitlines()[0]}")
+            continue
+        print(f"{name:<16}" + "".join(f"{result:>20.0f}" for result in results))
+    cairo_coverage.configure(collection=Collection.WRAP)
+
+
+if __name__ == "__main__":
+    with cairo_coverage.covering():
+        asyncio.run(main())
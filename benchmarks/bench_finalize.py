@@ -0,0 +1,54 @@
+"""Measures how long the coverage finalization (cover_file) takes depending on the number of steps.
+
+Run it with:
+
+    poetry run python3 benchmarks/bench_finalize.py
+
+The finalization should stay flat when the number of steps grows since it only depends on the
+size of the program.
+"""
+from time import perf_counter
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+
+from cairo_coverage import cairo_coverage
+
+LOOP_PROGRAM = """
+func loop(n: felt) -> (res: felt) {
+    if (n == 0) {
+        return (res=0);
+    }
+    let (res) = loop(n - 1);
+    return (res=res + 1);
+}
+"""
+ITERATIONS = [10, 100, 1_000, 10_000, 50_000]
+
+
+def run(program, iterations: int):
+    """Runs the loop and returns the number of steps and the finalization time."""
+    runner = CairoFunctionRunner(program, layout="plain")
+    runner.run("loop", iterations)
+    vm = runner.vm
+    start = perf_counter()
+    vm.cover_file()
+    return vm.current_step, perf_counter() - start
+
+
+def main():
+    program = compile_cairo(
+        [(LOOP_PROGRAM, "loop.cairo")], prime=DEFAULT_PRIME, debug_info=True
+    )
+    print(f"{'Steps':>10} {'Finalize (ms)':>14}")
+    for iterations in ITERATIONS:
+        cairo_coverage.reset()
+        steps, duration = run(program, iterations)
+        print(f"{steps:>10} {duration * 1000:>14.3f}")
+    cairo_coverage.reset()
+
+
+if __name__ == "__main__":
+    with cairo_coverage.covering():
+        main()
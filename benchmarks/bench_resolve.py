@@ -0,0 +1,79 @@
+"""Compares the mapping of the pending pcs to lines (config.report_jobs) in the report process and
+in a pool of forked processes, depending on the number of programs.
+
+Run it with:
+
+    poetry run python3 benchmarks/bench_resolve.py --jobs 4
+
+Each program is a copy of a generated program of --functions functions with all its pcs run. The
+pool only sends the positions of the programs to its processes, it's faster than the report
+process when the programs have more pcs than session.PARALLEL_MIN_PCS and the machine has the
+cores for the jobs. Under the cutoff the report keeps mapping them itself ("auto" column).
+"""
+from argparse import ArgumentParser
+from array import array
+from dataclasses import replace
+from os import cpu_count
+from time import perf_counter
+
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+
+from cairo_coverage import session
+from cairo_coverage.program_index import ProgramIndex
+from cairo_coverage.session import CoverageSession
+
+FUNCTION = """
+func f{i}(n: felt) -> (res: felt) {{
+    if (n == 0) {{
+        return (res={i});
+    }}
+    let a = n * {i};
+    let b = a + n;
+    return (res=a + b);
+}}
+"""
+PROGRAMS = [4, 16, 64]
+
+
+def measure(index: ProgramIndex, size: int, programs: int, jobs: int, hits: bool) -> float:
+    """Time to resolve the pcs of the copies of the program with jobs processes."""
+    data = CoverageSession()
+    for number in range(programs):
+        copy = replace(index, key=(index.key, number))  # Another program for the session.
+        if hits:
+            data.add_pending_pcs(copy, None, array("Q", [1]) * size)
+        else:
+            data.add_pending_pcs(copy, b"\x01" * size, None)
+    start = perf_counter()
+    data.resolve(jobs)
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--functions", type=int, default=300)
+    args = parser.parse_args()
+    source = "".join(FUNCTION.format(i=i) for i in range(args.functions))
+    program = compile_cairo([(source, "bench.cairo")], prime=DEFAULT_PRIME, debug_info=True)
+    index = ProgramIndex.from_program(program)
+    size = len(program.data)
+    cutoff = session.PARALLEL_MIN_PCS
+    print(f"{size} pcs per program, {args.jobs} jobs, {cpu_count()} cores, cutoff {cutoff} pcs")
+    print(f"{'Mode':>8} {'Programs':>9} {'Serial (ms)':>12} {'Pool (ms)':>10} {'Auto (ms)':>10}")
+    for hits in (False, True):
+        for programs in PROGRAMS:
+            serial = measure(index, size, programs, 1, hits)
+            session.PARALLEL_MIN_PCS = 0  # Always the pool.
+            pool = measure(index, size, programs, args.jobs, hits)
+            session.PARALLEL_MIN_PCS = cutoff
+            auto = measure(index, size, programs, args.jobs, hits)
+            print(
+                f"{'hits' if hits else 'lines':>8} {programs:>9} {serial * 1000:>12.1f} "
+                f"{pool * 1000:>10.1f} {auto * 1000:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
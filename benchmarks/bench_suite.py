@@ -0,0 +1,311 @@
+"""Measures what the coverage costs on the example contracts and saves the results in a JSON file.
+
+Run it with:
+
+    poetry run python3 benchmarks/bench_suite.py --output bench.json --baseline previous.json
+
+For each workload (the loop program and the example contracts) and each number of transactions it
+saves the steps/s without and with coverage, the time spent in cover_file, the size of the
+coverage collected by the session and the report_runs latency. The programs rows run many distinct
+programs once to show how the report scales with the number of programs. With --baseline the
+results are compared to a previous run, the metrics more than --threshold % worse are listed and
+the script exits with 1 so a regression fails the CI job.
+"""
+import asyncio
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import Any, Dict, Iterator, List, Optional
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.starknet.testing.starknet import Starknet
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.cairo_coverage import OverrideVm
+
+try:
+    from benchmarks.bench_finalize import LOOP_PROGRAM
+    from benchmarks.workloads import WORKLOADS
+except ImportError:
+    from bench_finalize import LOOP_PROGRAM  # type: ignore
+    from workloads import WORKLOADS  # type: ignore
+
+LOOP_ITERATIONS = 2_000  # Iterations of the loop program per transaction.
+# Metrics compared to the baseline, True if a higher value is better.
+COMPARED_METRICS = {
+    "covered_steps_per_s": True,
+    "cover_file_s": False,
+    "accumulator_bytes": False,
+    "report_runs_s": False,
+}
+
+
+class FinalizeTimer:
+    """Total time spent in OverrideVm.cover_file while it's installed."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.duration = 0.0
+        self.calls = 0
+
+    @contextmanager
+    def installed(self) -> Iterator["FinalizeTimer"]:
+        self.reset()
+        original = OverrideVm.cover_file
+
+        def timed_cover_file(vm: OverrideVm):
+            start = perf_counter()
+            try:
+                original(vm)
+            finally:
+                self.duration += perf_counter() - start
+                self.calls += 1
+
+        OverrideVm.cover_file = timed_cover_file  # type: ignore
+        try:
+            yield self
+        finally:
+            OverrideVm.cover_file = original  # type: ignore
+
+
+finalize_timer = FinalizeTimer()  # Reset after the warm up runs so they're not measured.
+
+
+def deep_size(value: Any, seen: Optional[set] = None) -> int:
+    """
+    Bytes used by the value and the containers, line sets and counters it holds, the attributes of
+    the objects with __slots__ (e.g. the bits of a LineSet) included.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += deep_size(vars(value), seen)
+    for cls in type(value).__mro__:
+        slots = getattr(cls, "__slots__", ())
+        for slot in (slots,) if isinstance(slots, str) else slots:
+            if slot not in ("__dict__", "__weakref__") and hasattr(value, slot):
+                size += deep_size(getattr(value, slot), seen)
+    return size
+
+
+def accumulator_size() -> int:
+    """
+    Bytes retained by the coverage collected in the current session (the lock excluded), not the
+    peak memory of the collection.
+    """
+    data = cairo_coverage.collected_data()
+    return sum(deep_size(value) for name, value in vars(data).items() if name != "lock")
+
+
+def timed_report() -> float:
+    start = perf_counter()
+    cairo_coverage.report_runs(print_summary=False)
+    return perf_counter() - start
+
+
+def loop_program(index: int = 0):
+    """Loop program, the programs of different indexes have different bytecodes."""
+    source = LOOP_PROGRAM.replace("res=res + 1", f"res=res + {index + 1}")
+    return compile_cairo([(source, f"loop_{index}.cairo")], prime=DEFAULT_PRIME, debug_info=True)
+
+
+def run_loop(program, transactions: int) -> Dict[str, float]:
+    """
+    Runs the loop program once per transaction, returns the steps and the duration. A first run
+    warms up the caches and isn't measured.
+    """
+    CairoFunctionRunner(program, layout="plain").run("loop", LOOP_ITERATIONS)
+    finalize_timer.reset()
+    steps, duration = 0, 0.0
+    for _ in range(transactions):
+        runner = CairoFunctionRunner(program, layout="plain")
+        start = perf_counter()
+        runner.run("loop", LOOP_ITERATIONS)
+        duration += perf_counter() - start
+        steps += runner.vm.current_step
+    return {"steps": steps, "duration": duration}
+
+
+async def run_workload(workload, transactions: int) -> Dict[str, float]:
+    """
+    Deploys the workload and runs its transactions, returns the steps and the duration. A first
+    transaction warms up the caches and isn't measured.
+    """
+    transaction = await workload(await Starknet.empty())
+    await transaction()
+    finalize_timer.reset()
+    steps, duration = 0, 0.0
+    for _ in range(transactions):
+        start = perf_counter()
+        steps += await transaction()
+        duration += perf_counter() - start
+    return {"steps": steps, "duration": duration}
+
+
+async def measure(run, transactions: int) -> Dict[str, float]:
+    """Runs the transactions without then with coverage and returns the metrics of the row."""
+    cairo_coverage.reset()
+    plain = await run(transactions)
+    with cairo_coverage.covering(), finalize_timer.installed():
+        covered = await run(transactions)
+    result = {
+        "transactions": transactions,
+        "steps": covered["steps"],
+        "steps_per_s": plain["steps"] / plain["duration"],
+        "covered_steps_per_s": covered["steps"] / covered["duration"],
+        "overhead_pct": 100 * (plain["steps"] / plain["duration"])
+        / (covered["steps"] / covered["duration"])
+        - 100,
+        "cover_file_s": finalize_timer.duration,
+        "cover_file_calls": finalize_timer.calls,
+        "accumulator_bytes": accumulator_size(),
+        "report_runs_s": timed_report(),
+    }
+    cairo_coverage.reset()
+    return result
+
+
+def measure_programs(nb_programs: int) -> Dict[str, float]:
+    """
+    Runs nb_programs distinct programs once with coverage and measures the report, cover_file
+    includes the indexing of the programs.
+    """
+    programs = [loop_program(index) for index in range(nb_programs)]
+    cairo_coverage.reset()
+    with cairo_coverage.covering(), finalize_timer.installed():
+        for program in programs:
+            CairoFunctionRunner(program, layout="plain").run("loop", 10)
+    result = {
+        "programs": nb_programs,
+        "cover_file_s": finalize_timer.duration,
+        "accumulator_bytes": accumulator_size(),
+        "report_runs_s": timed_report(),
+    }
+    cairo_coverage.reset()
+    return result
+
+
+async def run_suite(transactions: List[int], programs: List[int]) -> Dict[str, Any]:
+    program = loop_program()
+
+    async def loop(count: int) -> Dict[str, float]:
+        return run_loop(program, count)
+
+    rows: Dict[str, Any] = {}
+    for name, run in [("loop", loop)] + [
+        (name, lambda count, workload=workload: run_workload(workload, count))
+        for name, workload in WORKLOADS.items()
+    ]:
+        try:
+            rows[name] = [await measure(run, count) for count in transactions]
+        except Exception as exc:  # Missing dependency (e.g. openzeppelin).
+            cairo_coverage.reset()
+            rows[name] = {"skipped": str(exc).splitlines()[0]}
+    rows["programs"] = [measure_programs(count) for count in programs]
+    return {
+        "meta": {
+            "timestamp": time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "loop_iterations": LOOP_ITERATIONS,
+        },
+        "results": rows,
+    }
+
+
+def row_key(row: Dict[str, Any]) -> str:
+    return f"programs={row['programs']}" if "programs" in row else f"tx={row['transactions']}"
+
+
+def cell(row: Dict[str, Any], metric: str, width: int, scale: float = 1, precision: int = 0):
+    """Formatted metric of the row, - if the row doesn't have it."""
+    value = row.get(metric)
+    return f"{'-':>{width}}" if value is None else f"{value * scale:>{width}.{precision}f}"
+
+
+def print_results(results: Dict[str, Any]):
+    print(
+        f"{'Workload':<16}{'Scale':>14}{'Steps/s':>12}{'Covered':>12}{'Overhead%':>11}"
+        f"{'cover_file(ms)':>16}{'Collected(KB)':>15}{'Report(ms)':>12}"
+    )
+    for name, rows in results["results"].items():
+        if isinstance(rows, dict):
+            print(f"{name:<16} skipped: {rows['skipped']}")
+            continue
+        for row in rows:
+            print(
+                f"{name:<16}{row_key(row):>14}{cell(row, 'steps_per_s', 12)}"
+                f"{cell(row, 'covered_steps_per_s', 12)}{cell(row, 'overhead_pct', 11, 1, 1)}"
+                f"{cell(row, 'cover_file_s', 16, 1000, 2)}"
+                f"{cell(row, 'accumulator_bytes', 15, 1 / 1024, 1)}"
+                f"{cell(row, 'report_runs_s', 12, 1000, 2)}"
+            )
+
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Metrics more than threshold % worse than in the baseline, as printable lines."""
+    found = []
+    for name, rows in results["results"].items():
+        previous_rows = baseline["results"].get(name)
+        if isinstance(rows, dict) or not isinstance(previous_rows, list):
+            continue
+        previous = {row_key(row): row for row in previous_rows}
+        for row in rows:
+            old_row = previous.get(row_key(row))
+            if old_row is None:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                value, old = row.get(metric), old_row.get(metric)
+                if value is None or not old:
+                    continue
+                change = 100 * (value - old) / old
+                worse = -change if higher_is_better else change
+                if worse > threshold:
+                    found.append(
+                        f"{name} {row_key(row)} {metric}: {old:.4g} -> {value:.4g} ({change:+.1f}%)"
+                    )
+    return found
+
+
+def parse_counts(value: str) -> List[int]:
+    return [int(count) for count in value.split(",")]
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file.")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Default: 10 (%%).")
+    parser.add_argument("--transactions", type=parse_counts, default=[1, 10], metavar="N,N")
+    parser.add_argument("--programs", type=parse_counts, default=[1, 10, 50], metavar="N,N")
+    parsed = parser.parse_args(args)
+    results = asyncio.run(run_suite(parsed.transactions, parsed.programs))
+    print_results(results)
+    with open(parsed.output, "w") as stream:
+        json.dump(results, stream, indent=2)
+    print(f"Wrote the results in {parsed.output}")
+    if parsed.baseline is None:
+        return 0
+    with open(parsed.baseline) as stream:
+        found = regressions(results, json.load(stream), parsed.threshold)
+    for line in found:
+        print(f"REGRESSION {line}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Starknet workloads on the example contracts, shared by the benchmarks."""
+from os import path
+from typing import Awaitable, Callable, Dict
+
+from starkware.crypto.signature.signature import private_to_stark_key
+from starkware.starknet.testing.starknet import Starknet
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+CONTRACTS = path.join(ROOT, "examples", "contracts")
+PRODUCT_ARRAY = [(x, x + 1) for x in range(1, 6, 2)]
+SIGNERS = [private_to_stark_key(key) for key in (123, 1234, 12345, 123456)]
+
+# Runs one transaction and returns its nb of steps.
+Transaction = Callable[[], Awaitable[int]]
+# Deploys the contracts of the workload and returns its transaction.
+Workload = Callable[[Starknet], Awaitable[Transaction]]
+
+
+async def deploy(starknet: Starknet, name: str, constructor_calldata=None):
+    return await starknet.deploy(
+        source=path.join(CONTRACTS, f"{name}.cairo"),
+        cairo_path=[ROOT],
+        constructor_calldata=constructor_calldata,
+        disable_hint_validation=True,
+    )
+
+
+async def array_workload(starknet: Starknet) -> Transaction:
+    """view_product of array.cairo."""
+    contract = await deploy(starknet, "array")
+
+    async def transaction() -> int:
+        res = await contract.view_product(array=PRODUCT_ARRAY).call()
+        return res.call_info.execution_resources.n_steps
+
+    return transaction
+
+
+async def erc20_workload(starknet: Starknet) -> Transaction:
+    """Transfers of ERC20.cairo."""
+    owner = SIGNERS[0]
+    contract = await deploy(starknet, "ERC20", [1, 1, 0, 2**128 - 1, 0, owner])
+
+    async def transaction() -> int:
+        res = await contract.transfer(recipient=SIGNERS[1], amount=(1, 0)).execute(
+            caller_address=owner
+        )
+        return res.call_info.execution_resources.n_steps
+
+    return transaction
+
+
+async def multisig_workload(starknet: Starknet) -> Transaction:
+    """Proposals of contract_final.cairo."""
+    contract = await deploy(starknet, "contract_final", [len(SIGNERS), *SIGNERS, 3, 0])
+    token = await deploy(starknet, "ERC20", [1, 1, 0, 100, 0, contract.contract_address])
+
+    async def transaction() -> int:
+        res = await contract.create_proposal(
+            amount=(1, 0), to_=SIGNERS[0], targetERC20=token.contract_address
+        ).execute(caller_address=SIGNERS[0])
+        return res.call_info.execution_resources.n_steps
+
+    return transaction
+
+
+WORKLOADS: Dict[str, Workload] = {
+    "array": array_workload,
+    "ERC20": erc20_workload,
+    "contract_final": multisig_workload,
+}
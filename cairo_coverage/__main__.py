@@ -0,0 +1,252 @@
+"""Command line entry point to work with the coverage data files."""
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from glob import glob
+from os import path
+from typing import List, Optional, Tuple
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.config import SORTS, configure, parse_threshold
+from cairo_coverage.data import CoverageData, combine, merge_data
+from cairo_coverage.diff import (
+    DiffError,
+    changed_lines,
+    diff_coverage,
+    print_diff,
+    total_diff_coverage,
+)
+from cairo_coverage.exporters import EXPORTERS, export
+from cairo_coverage.html_report import write_html
+from cairo_coverage.lines import format_ranges
+from cairo_coverage.runner import CoverageRunner, read_inputs
+from cairo_coverage.store import CoverageStore
+
+DEFAULT_DATA_FILE = ".cairo_coverage"
+
+
+def data_files(paths: List[str]) -> List[str]:
+    """The given data files or by default the parallel data files of the current directory."""
+    return paths or sorted(glob(f"{DEFAULT_DATA_FILE}.*"))
+
+
+def file_threshold(value: str) -> Tuple[str, float]:
+    try:
+        return parse_threshold(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(str(exc)) from exc
+
+
+def print_contexts(location: Optional[str], only: Optional[str], paths: List[str]) -> int:
+    data = CoverageData()
+    for data_file in paths:
+        merge_data(data, data_file)
+    if only is not None:
+        for file, lines in sorted(data.lines_only_covered_by(only).items()):
+            print(f"{file}: {format_ranges(lines.ranges())}")
+        return 0
+    if location is None or ":" not in location:
+        print("Give a FILE:LINE location or --only CONTEXT")
+        return 1
+    name, _, line = location.rpartition(":")
+    files = [file for file in data.line_contexts if file == name or file.endswith(f"/{name}")]
+    for file in files:
+        for context in data.contexts_of(file, int(line)):
+            print(context)
+    return 0 if files else 1
+
+
+def run_program(parsed: Namespace) -> int:
+    """Runs the program once per input, saves and prints its coverage, 1 if a run failed."""
+    configure(count_hits=parsed.count_hits)
+    cairo_coverage.reset()
+    try:
+        runner = CoverageRunner.load(parsed.program, layout=parsed.layout, max_steps=parsed.steps)
+        inputs = read_inputs(parsed.inputs) if parsed.inputs else [None]
+        failures = 0
+        for number, error in runner.run_batch(inputs):
+            if error is not None:
+                failures += 1
+                message = str(error).splitlines() or [type(error).__name__]
+                print(f"Input {number} failed: {message[-1]}")
+    except ValueError as exc:
+        print(exc)
+        return 1
+    finally:
+        configure(count_hits=False)
+    print(f"Ran {runner.runs} inputs in {runner.steps} steps, {failures} failed")
+    cairo_coverage.save_data(parsed.output)
+    cairo_coverage.report_runs()
+    return 1 if failures else 0
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(prog="cairo-coverage", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    combine_parser = commands.add_parser("combine", help="Merge data files in a single one.")
+    combine_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}.*")
+    combine_parser.add_argument("-o", "--output", default=DEFAULT_DATA_FILE)
+
+    report_parser = commands.add_parser("report", help="Print the coverage of data files.")
+    report_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}")
+    report_parser.add_argument("--width", type=int, help="Default: the terminal's.")
+    report_parser.add_argument(
+        "--sort", choices=SORTS, default="name", help="Order of the files, default: name."
+    )
+    report_parser.add_argument(
+        "--skip-covered", action="store_true", help="Don't print the fully covered files."
+    )
+    report_parser.add_argument(
+        "--summary-only", action="store_true", help="Only print the total, no file report."
+    )
+    report_parser.add_argument("--fail-under", type=float, metavar="MIN", help="Exit with 2.")
+    report_parser.add_argument(
+        "--file-fail-under",
+        type=file_threshold,
+        action="append",
+        default=[],
+        metavar="GLOB=MIN",
+        help="Exit with 2 if a file matching the glob is under MIN %%. Can be repeated.",
+    )
+
+    diff_parser = commands.add_parser(
+        "diff", help="Print the coverage of the cairo lines changed since a git ref."
+    )
+    diff_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}")
+    diff_parser.add_argument("--ref", default="HEAD", help="Default: HEAD.")
+    diff_parser.add_argument("--fail-under", type=float, metavar="MIN")
+
+    store_parser = commands.add_parser(
+        "store", help="Save data files in a store, reused while the cairo files don't change."
+    )
+    store_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}")
+    store_parser.add_argument("--prune", action="store_true", help="Remove the outdated entries.")
+
+    contexts_parser = commands.add_parser(
+        "contexts", help="Print the contexts (tests) that ran a line or the lines only one ran."
+    )
+    contexts_parser.add_argument("location", nargs="?", metavar="FILE:LINE")
+    contexts_parser.add_argument("--only", metavar="CONTEXT", help="Lines only this context ran.")
+    contexts_parser.add_argument("--data-file", action="append", default=[], metavar="PATH")
+
+    run_parser = commands.add_parser(
+        "run", help="Run a compiled program over inputs like cairo-run and save its coverage."
+    )
+    run_parser.add_argument("program", help="JSON file of the compiled program.")
+    run_parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="JSON files of the program_input of each run (.jsonl: an input per line), default: "
+        "a single run without input.",
+    )
+    run_parser.add_argument("--layout", default="plain", help="Default: plain.")
+    run_parser.add_argument("--steps", type=int, metavar="MAX", help="Max nb of steps of a run.")
+    run_parser.add_argument("--count-hits", action="store_true", help="Profiling mode.")
+    run_parser.add_argument("-o", "--output", default=DEFAULT_DATA_FILE)
+
+    report_parsers = [report_parser, diff_parser]  # Commands reporting the data files.
+    for report_format, exporter in EXPORTERS.items():
+        export_parser = commands.add_parser(report_format, help=exporter.__doc__)
+        export_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}")
+        export_parser.add_argument(
+            "-o", "--output", default=f"coverage.{report_format}", help="- for stdout."
+        )
+        report_parsers.append(export_parser)
+    html_parser = commands.add_parser(
+        "html", help="Write the HTML report, only the changed files are rendered again."
+    )
+    html_parser.add_argument("files", nargs="*", help=f"Default: {DEFAULT_DATA_FILE}")
+    html_parser.add_argument("-d", "--directory", default="htmlcov", help="Default: htmlcov.")
+    html_parser.add_argument(
+        "--jobs", type=int, default=1, help="Nb of processes rendering the pages, default: 1."
+    )
+    report_parsers.append(html_parser)
+    for command_parser in report_parsers:
+        command_parser.add_argument(
+            "--store",
+            metavar="DIR",
+            help="Also report the stored coverage of the cairo files that didn't change.",
+        )
+    store_parser.add_argument("--store", required=True, metavar="DIR")
+
+    parsed = parser.parse_args(args)
+    if parsed.command == "combine":
+        files = data_files(parsed.files)
+        if not files:
+            print("No data file to combine")
+            return 1
+        combine(files, parsed.output)
+        print(f"Combined {len(files)} data files in {parsed.output}")
+        return 0
+
+    if parsed.command == "contexts":
+        return print_contexts(parsed.location, parsed.only, parsed.data_file or [DEFAULT_DATA_FILE])
+
+    if parsed.command == "store":
+        store = CoverageStore(parsed.store)
+        data = CoverageData()
+        for data_file in parsed.files or [DEFAULT_DATA_FILE]:
+            merge_data(data, data_file)
+        print(f"Stored the coverage of {len(store.save(data))} files in {parsed.store}")
+        if parsed.prune:
+            print(f"Removed {store.prune()} outdated entries")
+        return 0
+
+    if parsed.command == "run":
+        return run_program(parsed)
+
+    cairo_coverage.reset()
+    for data_file in parsed.files or [DEFAULT_DATA_FILE]:
+        if path.exists(data_file) or parsed.store is None:
+            cairo_coverage.load_data(data_file)
+    if parsed.store is not None:
+        reused = CoverageStore(parsed.store).load(cairo_coverage.collected_data())
+        print(f"Reused the stored coverage of {len(reused)} unchanged files")
+    if parsed.command == "report":
+        configure(
+            report_width=parsed.width,
+            sort=parsed.sort,
+            skip_covered=parsed.skip_covered,
+            fail_under=parsed.fail_under,
+            file_fail_under=dict(parsed.file_fail_under),
+        )
+        try:
+            report = cairo_coverage.report_runs(summary_only=parsed.summary_only)
+        except cairo_coverage.CoverageThresholdError as exc:
+            for failure in exc.failures:
+                print(f"FAIL {failure}")
+            return 2
+        finally:
+            configure(fail_under=None, file_fail_under={})
+        if parsed.summary_only:
+            return 0 if report.files else 1
+        return 0 if report else 1
+    files = cairo_coverage.report_runs(print_summary=False)
+    if not files:
+        return 1
+    if parsed.command == "diff":
+        try:
+            diff_files = diff_coverage(files, changed_lines(parsed.ref))
+        except DiffError as exc:
+            print(exc)
+            return 1
+        print_diff(diff_files, parsed.ref)
+        total = total_diff_coverage(diff_files)
+        if parsed.fail_under is not None and total < parsed.fail_under:
+            print(f"FAIL Required diff coverage of {parsed.fail_under}% not reached.")
+            return 2
+        return 0
+    if parsed.command == "html":
+        rendered = write_html(files, parsed.directory, parsed.jobs)
+        print(
+            f"Wrote the HTML report of {len(files)} files in {parsed.directory} "
+            f"({len(rendered)} rendered)"
+        )
+        return 0
+    export(files, parsed.command, parsed.output)
+    if parsed.output != "-":
+        print(f"Wrote the {parsed.command} report of {len(files)} files in {parsed.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
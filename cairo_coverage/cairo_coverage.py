@@ -1,17 +1,42 @@
-from collections import defaultdict
-from dataclasses import dataclass
-from os import get_terminal_size
-from typing import Any, DefaultDict, Dict, List, Optional, Set
-
-from textwrap import wrap
+import atexit
+import json
+import sys
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from heapq import nlargest
+from itertools import count, islice
+from operator import itemgetter
+from os import getpid, path
+from shutil import get_terminal_size
+from socket import gethostname
+from time import perf_counter
+from typing import Any, Callable, DefaultDict, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
 from starkware.cairo.lang.compiler.instruction import Instruction
 from starkware.cairo.lang.compiler.program import ProgramBase
-from starkware.cairo.lang.vm import cairo_runner
+from starkware.cairo.lang.vm.cairo_runner import CairoRunner
 from starkware.cairo.lang.vm.builtin_runner import BuiltinRunner
 from starkware.cairo.lang.vm.relocatable import MaybeRelocatable
 from starkware.cairo.lang.vm.vm_core import RunContext, VirtualMachine
 
+from cairo_coverage.config import Collection, config, configure
+from cairo_coverage.data import CoverageData, merge_data, write_data
+from cairo_coverage.filters import FileFilter
+from cairo_coverage.lines import LineSet, format_ranges
+from cairo_coverage.program_index import BranchLocation, ProgramIndex, index_cache
+from cairo_coverage.sampling import HitEstimate, estimate_hits, print_estimates
+from cairo_coverage.session import (
+    CoverageSession,
+    current_context,
+    current_session,
+    root_session,
+)
+from cairo_coverage.shared import SharedHits, shared_hits
+from cairo_coverage.telemetry import telemetry
+
 
 class Headers:
     """Headers for the report table."""
@@ -38,140 +63,560 @@ class Colors:
     END = "\033[0m"
 
 
+@dataclass
+class FunctionCoverage:
+    name: str  # Full name of the cairo function.
+    line: int  # Line of its first instruction.
+    instructions: int  # Nb of instructions.
+    covered: LineSet  # Offsets from the first instruction of the instructions run.
+    steps: int = 0  # Nb of instructions run in the function (profiling mode).
+    # Nb of instructions run in the code generated for the function, e.g. its external wrapper.
+    inlined_steps: int = 0
+
+    def __post_init__(self):
+        self.entered = bool(self.covered)  # The function ran at least once.
+        self.nb_covered = min(len(self.covered), self.instructions)  # Nb of instructions run.
+        self.pct_covered = 100 * self.nb_covered / self.instructions if self.instructions else 0.0
+        self.total_steps = self.steps + self.inlined_steps
+
+
 @dataclass
 class CoverageFile:
     name: str  # Filename.
-    covered: Set[int]  # Tested lines.
-    statements: Set[int]  # Lines with code.
+    covered: LineSet  # Tested lines.
+    statements: LineSet  # Lines with code.
     precision: int = 1  # Decimals for %.
-
-    @staticmethod
-    def col_sizes(sizes=[]):
-        """To share the column sizes between all the instances."""
-        return sizes
+    hits: Dict[int, int] = field(default_factory=dict)  # Nb of runs of each line (profiling mode).
+    branches: Set[BranchLocation] = field(default_factory=set)  # Conditional jumps (branch mode).
+    # Nb of runs of each (conditional jump, taken) outcome (branch mode).
+    branch_hits: Dict[Tuple[BranchLocation, bool], int] = field(default_factory=dict)
+    functions: List[FunctionCoverage] = field(default_factory=list)  # Functions of the file.
+    contexts: Dict[int, List[str]] = field(default_factory=dict)  # Contexts that ran each line.
 
     def __post_init__(self):
-        if not self.statements:
-            return
+        self.covered = LineSet(self.covered)  # Also accepts sets of lines.
+        self.statements = LineSet(self.statements)
+        self.nb_branches = 2 * len(self.branches)  # Each jump can be taken or not.
+        outcomes = Counter(
+            location for (location, _), hits in self.branch_hits.items() if hits
+        )  # Nb of outcomes of each jump that ran.
+        self.nb_branches_covered = sum(
+            nb_outcomes for location, nb_outcomes in outcomes.items() if location in self.branches
+        )
+        self.partial_branches = LineSet(
+            line for line, column in self.branches if outcomes[(line, column)] < 2
+        )  # Lines with a jump that didn't go both ways.
         self.nb_statements = len(self.statements)  # Nb of lines with code in the cairo file.
         self.nb_covered = len(self.covered)  # Nb of lines tested.
-        self.missed = sorted(list(self.statements - self.covered))  # Lines not tested.
+        self.missed = self.statements - self.covered  # Lines not tested.
+        self.missed_ranges = self.missed.ranges()  # (first, last) line of each untested block.
+        self.missed_str = format_ranges(self.missed_ranges)  # e.g. 12-40, 45.
         self.nb_missed = len(self.missed)  # Nb of lines not tested.
-        self.pct_covered = 100 * self.nb_covered / self.nb_statements  # % of lines tested.
-        self.pct_missed = 100 * self.nb_missed / self.nb_statements  # % of lines not tested.
+        # % of lines tested and not tested, a file without code is fully tested.
+        self.pct_covered = (
+            100 * self.nb_covered / self.nb_statements if self.nb_statements else 100.0
+        )
+        self.pct_missed = 100 - self.pct_covered
 
     def __str__(self):
-        sizes = self.__class__.col_sizes()  # Get columns size.
-        name_len = len(self.name)
-        if (
-            name_len > sizes[Headers.FILE_INDEX]
-        ):  # If the filename is longer than the col len we crop it.
-            cropped_name = self.name[
-                5 + name_len - sizes[Headers.FILE_INDEX] :
-            ]  # Crops the filename to the filename col size and leave room for [...] prefix.
-            # Formats the string to be left aligned and to file the col size length.
-            name = f"{'[...]' + cropped_name:<{sizes[Headers.FILE_INDEX]}}"
-        else:
-            # Pads the filename to the column length.
-            name = f"{self.name:<{sizes[Headers.FILE_INDEX]}}"
-        # % covered centered with right decimals.
-        pct_covered = f"{self.pct_covered:^{sizes[Headers.COVERED_INDEX]}.{self.precision}f}"
-        # % missed centered with right decimals.
-        pct_missed = f"{self.pct_missed:^{sizes[Headers.MISSED_INDEX]}.{self.precision}f}"
-        prefix = " " * (
-            len(name) + len(pct_covered) + len(pct_missed) + 4
-        )  # Offset of the missed lines column.
-        if len(str(self.missed)) > sizes[Headers.LINE_MISSED_INDEX]:
-            wrapped_missed = wrap(
-                str(self.missed), sizes[Headers.LINE_MISSED_INDEX]
-            )  # Wrap the missed lines list if too big.
-            wrapped_missed[1:] = [
-                f"{prefix}{val}" for val in wrapped_missed[1:]
-            ]  # Prefix the wrapped missed lines.
-            missed: str = "\n".join(wrapped_missed)  # Convert it to multiline string.
+        return render_row(self, Layout.of([self], get_terminal_size().columns), color=False)
+
+
+# Orders of the files in the report, see CoverageConfig.sort.
+SORT_KEYS: Dict[str, Callable[[CoverageFile], Any]] = {
+    "name": lambda file: file.name,
+    "cover": lambda file: (file.pct_covered, file.name),  # Least covered first.
+    "missed": lambda file: (-file.nb_missed, file.name),  # Most lines missed first.
+}
+MIN_NAME_WIDTH = 16  # Below it the filenames are cropped less and the rows overflow.
+MIN_LINES_WIDTH = 20  # Below it the missed lines are wrapped less and the rows overflow.
+
+
+@dataclass
+class Layout:
+    """Widths of the columns of the report table, computed once for all the rows."""
+
+    name: int
+    covered: int
+    missed: int
+    lines: int  # The missed lines are wrapped to this width.
+
+    @classmethod
+    def of(cls, covered_files: List[CoverageFile], width: int) -> "Layout":
+        """
+        Fits the table in width columns: the missed lines column gets what the names don't need,
+        the names are cropped if both don't fit.
+        """
+        covered, missed = len(Headers.COVERED), len(Headers.MISSED)
+        available = width - covered - missed - 3  # The 3 spaces between the columns.
+        longest_name = max((len(file.name) for file in covered_files), default=0)
+        longest_missed = max((len(file.missed_str) for file in covered_files), default=0)
+        lines_needed = min(longest_missed, MIN_LINES_WIDTH)
+        name = max(min(longest_name + 1, available - lines_needed), MIN_NAME_WIDTH)
+        return cls(
+            name=name, covered=covered, missed=missed, lines=max(available - name, lines_needed)
+        )
+
+    @property
+    def prefix(self) -> str:
+        """Offset of the missed lines column."""
+        return " " * (self.name + self.covered + self.missed + 3)
+
+
+def wrap_ranges(ranges: List[Tuple[int, int]], width: int) -> Iterator[str]:
+    """Lines of at most width characters of the ranges formatted as in format_ranges."""
+    line = ""
+    for first, last in ranges:
+        item = str(first) if first == last else f"{first}-{last}"
+        if line and len(line) + len(item) + 3 > width:  # ", " before and "," after it.
+            yield f"{line},"
+            line = item
         else:
-            missed = str(self.missed)
-        if 0 <= self.pct_covered < 50:  # If coverage is not enough writes in red.
-            color = Colors.FAIL
-        elif 50 <= self.pct_covered < 80:  # If coverage is mid enough writes in yellow.
-            color = Colors.WARNING
-        else:  # If coverage is good write in green.
-            color = Colors.GREEN
-        # Formatted file line report.
-        return f"{color}{name} {pct_covered} {pct_missed} {missed}{Colors.END}"
-
-
-def print_sum(covered_files: List[CoverageFile]):
-    """Print the coverage summary of the project."""
-    try:
-        term_size = get_terminal_size()
-        max_name = max([len(file.name) for file in covered_files]) + 2  # Longest name.
-        max_missed_lines = max(
-            [len(str(file.missed)) for file in covered_files]
-        )  # Length of the longest missed lines list.
-        sizes = (
-            CoverageFile.col_sizes()
-        )  # Init the sizes list with our static method so it's available everywhere.
-        sizes.extend(
-            [max_name, len(Headers.COVERED), len(Headers.MISSED), max_missed_lines]
-        )  # Fill the sizes.
-
-        while (
-            sum(sizes) > term_size.columns
-        ):  # While the length of all the cols is > the terminal size, reduce the biggest col.
-            idx = sizes.index(max(sizes))
-            sizes[idx] = int(0.75 * sizes[idx])
-
-        headers = (
-            f"\n{Headers.FILE:{sizes[Headers.FILE_INDEX] + 1}}"
-            f"{Headers.COVERED:{sizes[Headers.COVERED_INDEX] + 1}}"
-            f"{Headers.MISSED:{sizes[Headers.MISSED_INDEX] + 1}}"
-            f"{Headers.LINES_MISSED:{sizes[Headers.LINE_MISSED_INDEX] + 1}}\n"
-        )  # Prepare the coverage table headers.
-        underline = "-" * term_size.columns  # To separate the header from the values.
-        print(headers + underline)
-        for file in covered_files:  # Prints the report of each file.
-            print(file)
-    except OSError:
-        pass
+            line = f"{line}, {item}" if line else item
+    if line:
+        yield line
+
+
+def coverage_color(pct_covered: float) -> str:
+    if pct_covered < 50:  # If coverage is not enough writes in red.
+        return Colors.FAIL
+    if pct_covered < 80:  # If coverage is mid enough writes in yellow.
+        return Colors.WARNING
+    return Colors.GREEN  # If coverage is good write in green.
+
+
+def render_row(file: CoverageFile, layout: Layout, color: bool) -> str:
+    """Row of the file in the report table, the missed lines wrapped on several lines."""
+    name = file.name
+    if len(name) > layout.name:  # Crop the start of the name, leave room for the [...] prefix.
+        name = f"[...]{name[len(name) - layout.name + 6 :]}"
+    missed = f"\n{layout.prefix}".join(wrap_ranges(file.missed_ranges, layout.lines))
+    row = (
+        f"{name:<{layout.name}} {file.pct_covered:^{layout.covered}.{file.precision}f} "
+        f"{file.pct_missed:^{layout.missed}.{file.precision}f} {missed}"
+    ).rstrip()
+    return f"{coverage_color(file.pct_covered)}{row}{Colors.END}" if color else row
+
+
+def print_sum(
+    covered_files: List[CoverageFile],
+    width: Optional[int] = None,
+    sort: Optional[str] = None,
+    skip_covered: Optional[bool] = None,
+    stream: Optional[TextIO] = None,
+):
+    """
+    Print the coverage summary of the project. The settings default to the report settings of the
+    config, the width to the terminal's (80 columns if there's no terminal) and the rows are only
+    colored in a terminal.
+    """
+    stream = sys.stdout if stream is None else stream
+    width = width or config.report_width or get_terminal_size().columns
+    sort = sort or config.sort
+    skip_covered = config.skip_covered if skip_covered is None else skip_covered
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort {sort!r}, expected one of {', '.join(SORT_KEYS)}.")
+    files = covered_files
+    if skip_covered:
+        files = [file for file in covered_files if file.nb_missed]
+    files = sorted(files, key=SORT_KEYS[sort])
+    layout = Layout.of(files, width)
+    color = config.color if config.color is not None else stream.isatty()
+    stream.write(
+        f"\n{Headers.FILE:{layout.name + 1}}{Headers.COVERED:{layout.covered + 1}}"
+        f"{Headers.MISSED:{layout.missed + 1}}{Headers.LINES_MISSED}\n{'-' * width}\n"
+    )
+    for file in files:  # Streams the rows, the layout doesn't depend on them.
+        stream.write(f"{render_row(file, layout, color)}\n")
+    if len(files) < len(covered_files):
+        stream.write(f"\n{len(covered_files) - len(files)} files skipped, fully covered.\n")
+
+
+# Failure of the thresholds when no cairo line was measured, e.g. the coverage isn't enabled.
+NOTHING_MEASURED = "No cairo code was measured, is the coverage enabled?"
+
+
+class CoverageThresholdError(Exception):
+    """Raised by report_runs when the coverage is under a fail_under threshold of the config."""
+
+    def __init__(self, failures: List[str]):
+        super().__init__("\n".join(failures))
+        self.failures = failures
+
+
+@dataclass
+class CoverageSummary:
+    """Totals of the coverage without the details of the lines, enough to check thresholds."""
+
+    files: Dict[str, Tuple[int, int]]  # (nb of lines tested, nb of lines with code) of each file.
+
+    def __post_init__(self):
+        self.nb_covered = sum(covered for covered, _ in self.files.values())
+        self.nb_statements = sum(statements for _, statements in self.files.values())
+        self.pct_covered = (
+            100 * self.nb_covered / self.nb_statements if self.nb_statements else 100.0
+        )
+
+    @classmethod
+    def from_files(cls, covered_files: List[CoverageFile]) -> "CoverageSummary":
+        return cls(
+            {
+                file.name: (len(file.covered & file.statements), file.nb_statements)
+                for file in covered_files
+            }
+        )
+
+    def failures(
+        self, fail_under: Optional[float] = None, file_fail_under: Optional[Dict[str, float]] = None
+    ) -> List[str]:
+        """
+        The thresholds not reached: the total % and the % of the files matching each glob. No
+        threshold is reached if nothing was measured.
+        """
+        if not self.nb_statements and (fail_under is not None or file_fail_under):
+            return [NOTHING_MEASURED]
+        failures = []
+        if fail_under is not None and self.pct_covered < fail_under:
+            failures.append(
+                f"Total cairo coverage of {self.pct_covered:.1f}% is under {fail_under}%."
+            )
+        for pattern, minimum in (file_fail_under or {}).items():
+            for file, (covered, statements) in sorted(self.files.items()):
+                pct = 100 * covered / statements if statements else 100.0
+                if pct < minimum and fnmatch(file, pattern):
+                    failures.append(
+                        f"{file}: coverage of {pct:.1f}% is under {minimum}% ({pattern})."
+                    )
+        return failures
+
+
+def summarize(excluded_file: Optional[Set[str]] = None) -> CoverageSummary:
+    """Totals of the current session counted on its line sets, no report is built."""
+    session = collected_data()
+    measured = FileFilter.excluding(excluded_file or ())
+    empty = LineSet()
+    files = {}
+    for file, covered in session.covered.items():
+        if measured(file):
+            statements = session.statements.get(file, empty)
+            files[file] = (len(covered & statements), len(statements))
+    return CoverageSummary(files)
+
+
+def check_thresholds(summary: CoverageSummary):
+    """Raises CoverageThresholdError if a fail_under threshold of the config isn't reached."""
+    failures = summary.failures(config.fail_under, config.file_fail_under)
+    if failures:
+        raise CoverageThresholdError(failures)
+
+
+def total_coverage(covered_files: List[CoverageFile]) -> float:
+    """% of the lines with code of all the files that are tested."""
+    nb_statements = sum(len(file.statements) for file in covered_files)
+    if not nb_statements:
+        return 100.0
+    return 100 * sum(len(file.covered) for file in covered_files) / nb_statements
+
+
+def hottest_lines(covered_files: List[CoverageFile], top: int) -> List[Tuple[str, int, int]]:
+    """Returns the (filename, line, hits) of the most executed lines."""
+    return nlargest(
+        top,
+        ((file.name, line, hits) for file in covered_files for line, hits in file.hits.items()),
+        key=itemgetter(2),
+    )
+
+
+def estimated_hits() -> Dict[str, Dict[int, HitEstimate]]:
+    """
+    Estimated hits of each line in all the vm runs of the current session (sampling and
+    profiling modes), empty if every run was recorded.
+    """
+    return estimate_hits(collected_data())
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Telemetry of the vms of the process (config.telemetry) and size of the coverage collected in
+    the current session, its pending pcs (config.report_jobs) are left to the report.
+    """
+    data = current_session.get()
+    collection = telemetry.as_dict()
+    with data.lock:
+        collection["accumulator"] = {
+            "programs": len(data.merged_programs),
+            "files": len(data.statements),
+            "covered_lines": sum(len(lines) for lines in data.covered.values()),
+            "hit_lines": sum(len(hits) for hits in data.line_hits.values()),
+            "functions": len(data.functions),
+            "contexts": len(data.contexts),
+            "pc_hits_bytes": sum(hits.itemsize * len(hits) for hits in data.pc_hits.values()),
+            "pending_programs": len(data.pending_pcs) + len(data.pending_hits),
+        }
+    return collection
+
+
+def dump_stats(output: str):
+    """Writes the stats in the JSON file."""
+    with open(output, "w") as stream:
+        json.dump(stats(), stream, indent=2)
+
+
+def reset_stats():
+    """Drops the telemetry of the vms, reset() keeps it."""
+    telemetry.clear()
+
+
+def hottest_functions(top: int) -> List[Tuple[str, int, str]]:
+    """Returns the (function, steps, file) of the functions that ran the most instructions."""
+    return [
+        (function, steps, file)
+        for (file, function), steps in collected_data().function_hits.most_common(top)
+    ]
+
+
+def print_hot_lines(covered_files: List[CoverageFile], top: int):
+    """Print the most executed lines and functions of the project (profiling mode)."""
+    lines = hottest_lines(covered_files, top)
+    if lines:
+        print(f"\nHottest lines\n{'Hits':>12}  {'Line':>6}  File")
+        for name, line, hits in lines:
+            print(f"{hits:>12}  {line:>6}  {name}")
+    functions = hottest_functions(top)
+    if functions:
+        print(f"\nHottest functions\n{'Steps':>12}  Function")
+        for function, steps, file in functions:
+            print(f"{steps:>12}  {function} ({file})")
+
+
+def print_branches(covered_files: List[CoverageFile]):
+    """Print the branch coverage of the project (branch mode)."""
+    files = [file for file in covered_files if file.nb_branches]
+    if not files:
+        return
+    max_name = max(len(file.name) for file in files) + 2
+    print(f"\n{Headers.FILE:{max_name}}{'Branches':>10}{'Covered(%)':>12}  Partial lines")
+    for file in files:
+        pct = 100 * file.nb_branches_covered / file.nb_branches
+        print(
+            f"{file.name:{max_name}}{file.nb_branches:>10}{pct:>12.{file.precision}f}"
+            f"  {format_ranges(file.partial_branches.ranges())}"
+        )
+
+
+def print_functions(covered_files: List[CoverageFile]):
+    """Print the coverage and the steps of each cairo function, the costliest first."""
+    functions = [
+        (file, function) for file in covered_files for function in file.functions
+    ]  # Already sorted by line in each file.
+    if not functions:
+        return
+    functions.sort(key=lambda item: item[1].total_steps, reverse=True)
+    print(
+        f"\n{'Instructions':>12}{'Covered(%)':>12}{'Steps':>12}{'Inlined':>12}  Function"
+    )
+    for file, function in functions:
+        print(
+            f"{function.instructions:>12}{function.pct_covered:>12.{file.precision}f}"
+            f"{function.steps:>12}{function.inlined_steps:>12}"
+            f"  {function.name} ({file.name}:{function.line})"
+        )
+
+
+def file_functions(session: CoverageData) -> DefaultDict[str, List[FunctionCoverage]]:
+    """Coverage of the functions of each file, by line."""
+    functions: DefaultDict[str, List[FunctionCoverage]] = defaultdict(list)
+    for key, (file, line, instructions) in session.functions.items():
+        functions[file].append(
+            FunctionCoverage(
+                name=key[1],
+                line=line,
+                instructions=instructions,
+                covered=session.function_covered.get(key, LineSet()),
+                steps=session.function_hits[key],
+                inlined_steps=session.inlined_hits[key],
+            )
+        )
+    for coverages in functions.values():
+        coverages.sort(key=lambda function: (function.line, function.name))
+    return functions
 
 
 def report_runs(
     excluded_file: Optional[Set[str]] = None,
     print_summary: bool = True,
+    summary_only: bool = False,
 ):
-    if excluded_file is None:
-        excluded_file = set()
-    report_dict = OverrideVm.covered  # Get the infos of all the covered files.
-    statements = OverrideVm.statements  # Get the lines of codes of each files.
+    """
+    Reports the coverage of the current session and resets it. Returns the coverage of each file,
+    or only the totals if summary_only (no file report is built, e.g. for a gating step). Raises
+    CoverageThresholdError if a fail_under threshold of the config isn't reached.
+    """
+    if summary_only:
+        summary = summarize(excluded_file)
+        if not summary.files:
+            print("Nothing to report")
+        elif print_summary:
+            print(
+                f"Total cairo coverage: {summary.pct_covered:.1f}% "
+                f"({summary.nb_covered}/{summary.nb_statements} lines)"
+            )
+        if config.telemetry_file is not None:
+            dump_stats(config.telemetry_file)
+        reset()
+        check_thresholds(summary)
+        return summary
+    measured = FileFilter.excluding(excluded_file or ())  # Substrings compiled once.
+    session = collected_data()  # Coverage of the current session.
+    report_dict = session.covered  # Get the infos of all the covered files.
+    statements = session.statements  # Get the lines of codes of each files.
+    line_hits = session.line_hits  # Get the nb of runs of each line (profiling mode).
+    branches = session.branches  # Get the conditional jumps of each file (branch mode).
+    branch_hits = session.branch_hits
+    functions = file_functions(session)  # Once for all the files.
+    context_names = session.context_names()
     files = sorted(
         [
-            CoverageFile(statements=set(statements[file]), covered=set(coverage), name=file)
+            CoverageFile(
+                statements=statements[file],
+                covered=coverage,
+                name=file,
+                hits=dict(line_hits.get(file, {})),
+                branches=set(branches.get(file, ())),
+                branch_hits=dict(branch_hits.get(file, {})),
+                functions=functions.get(file, []),
+                contexts={
+                    line: session.contexts_of(file, line, context_names)
+                    for line in sorted(session.line_contexts.get(file, ()))
+                },
+            )
             for file, coverage in report_dict.items()
-            if not any(excluded in file for excluded in excluded_file)
+            if measured(file)
         ],
         key=lambda x: x.name,
     )  # Sort the files by filename.
 
     if not len(files):
         print("Nothing to report")
+        reset()
+        check_thresholds(CoverageSummary({}))
         return []
     if print_summary:
         print_sum(covered_files=files)
+        print_branches(covered_files=files)
+        if config.functions:
+            print_functions(covered_files=files)
+        if any(file.hits for file in files):
+            print_hot_lines(covered_files=files, top=config.hot_lines)
+        if session.runs["sampled"]:
+            print(f"\nSampled {session.runs['sampled']} of {session.runs['all']} vm runs")
+            print_estimates(estimate_hits(session), top=config.hot_lines)
+    if config.telemetry_file is not None:
+        dump_stats(config.telemetry_file)
     reset()
+    if config.fail_under is not None or config.file_fail_under:
+        check_thresholds(CoverageSummary.from_files(files))
     return files
 
 
 def reset():
-    OverrideVm.covered.clear()
-    OverrideVm.statements.clear()
-    CoverageFile.col_sizes().clear()
+    """Drops the coverage of the current session, the other sessions keep theirs."""
+    current_session.get().clear()
+
+
+def collected_data() -> CoverageSession:
+    """
+    The coverage collected by the vms of the current session (not a copy), the pcs the vms left
+    to the report (see config.report_jobs) are mapped to lines first.
+    """
+    data = current_session.get()
+    data.resolve(config.report_jobs)
+    return data
+
+
+@contextmanager
+def session(merge: bool = True) -> Iterator[CoverageSession]:
+    """
+    Collects the coverage of the vms created in the block (the current thread or asyncio task) in
+    a new session, so concurrent tests can report and reset their coverage without touching the
+    coverage of the others. The coverage is merged in the enclosing session at the end if merge.
+    """
+    parent = current_session.get()
+    child = CoverageSession()
+    token = current_session.set(child)
+    try:
+        yield child
+    finally:
+        current_session.reset(token)
+        if merge:
+            parent.merge(child)
+
+
+@contextmanager
+def context(label: str) -> Iterator[None]:
+    """
+    Records the lines run by the vms created in the block for the label (e.g. a test name), to
+    know which contexts cover a line (see CoverageData.contexts_of).
+    """
+    token = current_context.set(label)
+    try:
+        yield
+    finally:
+        current_context.reset(token)
 
 
-class OverrideVm(VirtualMachine):
+def data_file_path() -> Optional[str]:
+    """Path of the data file of this process."""
+    if config.data_file is None:
+        return None
+    if config.parallel:  # Each process writes its own file, merge them with combine.
+        return f"{config.data_file}.{gethostname()}.{getpid()}"
+    return config.data_file
+
+
+def save_data(data_file: Optional[str] = None, append: bool = False) -> Optional[str]:
+    """Saves the collected coverage in the data file, merged with its content if append."""
+    data_file = data_file or data_file_path()
+    if data_file is None:
+        return None
+    data = collected_data()
+    if append and path.exists(data_file):
+        data = merge_data(CoverageData(), data_file)
+        data.update(collected_data())
+    write_data(data, data_file)
+    return data_file
+
+
+def load_shared(directory: Optional[str] = None) -> int:
+    """
+    Adds the coverage the processes wrote in the shared buffers of the directory (default:
+    config.shared_hits) to the collected coverage, returns the nb of programs. Load them once per
+    report, the counters would be added twice.
+    """
+    directory = directory or config.shared_hits
+    if directory is None:
+        return 0
+    return shared_hits(directory).load(collected_data(), branches=config.branches)
+
 
-    covered: DefaultDict[str, List[int]] = defaultdict(list)
-    statements: DefaultDict[str, List[int]] = defaultdict(list)
+def load_data(data_file: str):
+    """Adds the coverage of a data file to the collected coverage (e.g. to report it)."""
+    merge_data(collected_data(), data_file)
+
+
+def save_data_at_exit():
+    if config.data_file is not None and (root_session.covered or root_session.statements):
+        token = current_session.set(root_session)
+        try:
+            save_data()
+        finally:
+            current_session.reset(token)
+
+
+atexit.register(save_data_at_exit)
+
+
+class OverrideVm(VirtualMachine):
 
     def __init__(
         self,
@@ -190,6 +635,8 @@ class OverrideVm(VirtualMachine):
             builtin_runners=builtin_runners,
             program_base=program_base,
         )
+        self.session = current_session.get()  # Where the coverage of the vm is collected.
+        self.context = current_context.get()  # Label of the coverage of the vm (e.g. test).
         self.old_end_run = super().end_run  # Save the old end run function to wrap it afterwards.
         self.old_run_instruction = (
             super().run_instruction
@@ -197,13 +644,127 @@ class OverrideVm(VirtualMachine):
         self.old_as_vm_exception = (
             super().as_vm_exception
         )  # Save the old vm as exception function to wrap it afterwards.
-        self.touched_pcs: List[int] = []
+        self.count_hits = config.count_hits
+        self.track_branches = config.branches
+        self.from_trace = config.collection == Collection.TRACE
+        # Sampling mode: only one run out of config.sample_every is recorded, the others run the
+        # regular instructions and are only counted to scale the hits.
+        self.sampling = config.sample_every > 1
+        self.sampled = not self.sampling or next(vm_runs) % config.sample_every == 0
+        if self.sampling:
+            self.session.count_run(self.sampled)
+        if not self.sampled:
+            self.run_instruction = self.old_run_instruction
+            self.shared = None
+            return
+        # The pcs are mapped to lines by the report, unless the lines of each run are needed.
+        self.deferred = config.report_jobs > 0 and self.context is None and not self.sampling
+        self.traced_steps = 0  # Nb of trace entries already saved in the touched pcs (trace mode).
+        # Buffers shared with the other processes (see cairo_coverage.shared), None if not used.
+        self.shared: Optional[SharedHits] = None
+        if config.shared_hits is not None and len(program.data):
+            index = index_cache.get(program)
+            if index is not None:
+                self.shared = shared_hits(config.shared_hits)
+        if self.shared is not None:  # Written in place, the report reads them from the files.
+            if self.count_hits:
+                self.touched_pcs = self.shared.pc_hits(index, len(program.data))
+            else:
+                self.touched_pcs = self.shared.touched_pcs(index, len(program.data))
+            if self.track_branches:
+                self.jump_hits = self.shared.jump_hits(index, len(program.data))
+        elif self.count_hits:
+            # One counter per pc of the program, incremented each time the pc is run.
+            self.touched_pcs = array("Q", bytes(8 * len(program.data)))
+        else:
+            # One byte per pc of the program, set to 1 once the pc has been run. The size doesn't
+            # depend on the number of steps and checking if a pc was touched is O(1).
+            self.touched_pcs = bytearray(len(program.data))
+        if self.track_branches and self.shared is None:
+            # Not taken and taken counters of each pc, only used for the conditional jumps.
+            self.jump_hits = array("Q", bytes(16 * len(program.data)))
+        # Avoids checking the mode at each step.
+        if self.from_trace:  # The pcs are read from the trace, run the instructions directly.
+            self.run_instruction = self.old_run_instruction
+        elif self.track_branches:
+            self.hit_instruction = (
+                self.count_instruction if self.count_hits else self.run_instruction
+            )
+            self.run_instruction = self.branch_instruction
+        elif self.count_hits:
+            self.run_instruction = self.count_instruction
+        # Telemetry: the steps are timed in the coverage run_instruction and in the base one.
+        self.timed = config.telemetry
+        if self.timed:
+            self.instruction_s = self.base_instruction_s = 0.0
+            self.pcs_run = 0  # Nb of pcs run, counted in cover_file.
+            self.untimed_base = self.old_run_instruction
+            self.old_run_instruction = self.time_base_instruction
+            self.untimed_instruction = (
+                self.old_run_instruction if self.from_trace else self.run_instruction
+            )
+            self.run_instruction = self.time_instruction
 
     def run_instruction(self, instruction: Instruction):
         """Saves the current pc and runs the instruction."""
-        self.touched_pcs.append(self.run_context.pc.offset)
+        try:
+            self.touched_pcs[self.run_context.pc.offset] = 1
+        except IndexError:  # Pc outside of the program (e.g. loaded program), nothing to map it to.
+            pass
         self.old_run_instruction(instruction=instruction)
 
+    def count_instruction(self, instruction: Instruction):
+        """Counts the current pc and runs the instruction (profiling mode)."""
+        try:
+            self.touched_pcs[self.run_context.pc.offset] += 1
+        except IndexError:  # Pc outside of the program (e.g. loaded program), nothing to map it to.
+            pass
+        self.old_run_instruction(instruction=instruction)
+
+    def branch_instruction(self, instruction: Instruction):
+        """Runs the instruction and saves the outcome of the conditional jumps (branch mode)."""
+        pc = self.run_context.pc.offset
+        self.hit_instruction(instruction)
+        if instruction.pc_update is Instruction.PcUpdate.JNZ:
+            taken = self.run_context.pc.offset != pc + instruction.size
+            try:
+                self.jump_hits[2 * pc + taken] += 1
+            except IndexError:  # Pc outside of the program.
+                pass
+
+    def time_instruction(self, instruction: Instruction):
+        """Runs the instruction with the coverage and times it (telemetry)."""
+        start = perf_counter()
+        self.untimed_instruction(instruction)
+        self.instruction_s += perf_counter() - start
+
+    def time_base_instruction(self, instruction: Instruction):
+        """Runs the instruction of the base vm and times it (telemetry)."""
+        start = perf_counter()
+        self.untimed_base(instruction=instruction)
+        self.base_instruction_s += perf_counter() - start
+
+    def collect_trace(self, index: ProgramIndex):
+        """Saves the pcs of the trace entries added since the last call (trace mode)."""
+        touched_pcs = self.touched_pcs
+        size = len(touched_pcs)
+        pcs = [entry.pc.offset for entry in islice(self.trace, self.traced_steps, None)]
+        self.traced_steps = len(self.trace)
+        if self.count_hits:
+            for pc, hits in Counter(pcs).items():
+                if pc < size:  # Pc outside of the program (e.g. loaded program) are ignored.
+                    touched_pcs[pc] += hits
+        else:
+            for pc in set(pcs):
+                if pc < size:
+                    touched_pcs[pc] = 1
+        if self.track_branches and index.branches:
+            pcs.append(self.run_context.pc.offset)  # Where the last traced instruction went.
+            for pc, next_pc in zip(pcs, islice(pcs, 1, None)):
+                branch = index.branches.get(pc)
+                if branch is not None:
+                    self.jump_hits[2 * pc + (next_pc != pc + branch[0])] += 1
+
     def end_run(self):
         """In case the run doesn't fail creates report coverage."""
         self.old_end_run()
@@ -220,46 +781,134 @@ class OverrideVm(VirtualMachine):
         self.cover_file()
         return self.old_as_vm_exception(exc, with_traceback, notes, hint_index)
 
-    def pc_to_line(
-        self,
-        pc,
-        statements: DefaultDict[str, list],
-        report_dict: DefaultDict[str, List[int]],
-    ) -> None:
-        """Converts the touched pcs to the line numbers of the original file and saves them."""
-        should_update_report = (
-            pc in self.touched_pcs
-        )  # If the pc is not touched by the test don't report it.
-        instruct = self.program.debug_info.instruction_locations[
-            pc
-        ].inst  # First instruction in the debug info.
-        file = instruct.input_file.filename  # Current analyzed file.
-        while True:
-            if "autogen" not in file:  # If file is auto generated discard it.
-                lines = list(
-                    range(
-                        instruct.start_line,
-                        instruct.end_line + 1,
-                    )
-                )  # Get the lines touched.
-                if should_update_report:
-                    report_dict[file].extend(lines)
-                statements[file].extend(lines)
-            if instruct.parent_location is not None:  # Continue until we have last parent location.
-                instruct = instruct.parent_location[0]
-                file = instruct.input_file.filename
-            else:
-                return
-
     def cover_file(
         self,
     ):
-        """Adds the coverage report in the report dict and all the lines of code."""
-        if self.program.debug_info is not None:
-            report_dict = self.__class__.covered
-            statements = self.__class__.statements
-            for pc in set(self.program.debug_info.instruction_locations.keys()):
-                self.pc_to_line(pc=pc, report_dict=report_dict, statements=statements)
+        """
+        Adds the coverage of the run and all the lines of code to the session of the vm, and the
+        stats of the vm to the telemetry if enabled.
+        """
+        if not self.sampled:
+            return
+        if not self.timed:
+            self.cover_run()
+            return
+        start = perf_counter()
+        index = self.cover_run()
+        duration = perf_counter() - start
+        if index is not None:
+            telemetry.add_vm(
+                index,
+                steps=self.current_step,
+                instruction_s=self.instruction_s,
+                base_instruction_s=self.base_instruction_s,
+                cover_file_s=duration,
+                pcs=self.pcs_run,
+            )
+            self.instruction_s = self.base_instruction_s = 0.0  # Not added twice.
+
+    def cover_run(self) -> Optional[ProgramIndex]:
+        """Adds the coverage of the run to the session, returns the index of the program."""
+        index = index_cache.get(self.program)  # Pc to lines mapping built once per program.
+        if index is None:
+            return None
+        if self.from_trace:
+            self.collect_trace(index)
+        if self.shared is not None:  # Already in the shared buffers.
+            return index
+        if self.timed:
+            self.pcs_run = len(self.touched_pcs) - self.touched_pcs.count(0)
+        run = CoverageData()  # Coverage of the run, merged at once in the session.
+        if self.track_branches:
+            self.cover_branches(index, run)
+        if self.deferred:  # Only save the pcs, the report maps them to lines once per program.
+            if self.count_hits:
+                self.session.add_pending(
+                    index, run, branches=self.track_branches, pc_hits=self.take_pc_hits()
+                )
+            else:
+                self.session.add_pending(
+                    index, run, branches=self.track_branches, touched_pcs=bytes(self.touched_pcs)
+                )
+            return index
+        if self.count_hits:
+            pc_hits = self.count_file(index, run)
+            self.session.add_run(
+                index,
+                run,
+                branches=self.track_branches,
+                pc_hits=pc_hits,
+                context=self.context,
+                squares=self.sampling,
+            )
+            return index
+        index.cover(self.touched_pcs, run)
+        self.session.add_run(index, run, branches=self.track_branches, context=self.context)
+        return index
+
+    def cover_branches(self, index: ProgramIndex, run: CoverageData):
+        """Adds the outcomes of the conditional jumps of the run (branch mode)."""
+        index.cover_jumps(self.jump_hits, run)
+        # The counters are saved, start again from 0 so they're not added twice.
+        self.jump_hits = array("Q", bytes(16 * len(self.touched_pcs)))
+
+    def count_file(self, index: ProgramIndex, run: CoverageData) -> array:
+        """
+        Adds the hits of the run to the lines and functions counters (profiling mode), returns the
+        hits of each pc.
+        """
+        pc_hits = self.take_pc_hits()
+        index.count(pc_hits, run)
+        return pc_hits
+
+    def take_pc_hits(self) -> array:
+        """Returns the hits of each pc and starts again from 0 so they're not added twice."""
+        pc_hits = self.touched_pcs
+        self.touched_pcs = array("Q", bytes(8 * len(self.touched_pcs)))
+        return pc_hits
+
+
+vm_runs = count()  # Nb of vms created, the sampling mode records one run out of sample_every.
+original_initialize_vm = CairoRunner.initialize_vm
+enabled_scopes = 0  # Nb of enable() calls not closed by a disable() call.
+
+
+def initialize_coverage_vm(
+    self: CairoRunner,
+    hint_locals,
+    static_locals: Optional[Dict[str, Any]] = None,
+    vm_class=None,
+):
+    """CairoRunner.initialize_vm creating the coverage vm unless another vm class is asked for."""
+    if vm_class is None or vm_class is VirtualMachine:
+        vm_class = OverrideVm
+    return original_initialize_vm(self, hint_locals, static_locals=static_locals, vm_class=vm_class)
+
+
+def enable():
+    """Makes the cairo runners create coverage vms until disable() is called."""
+    global enabled_scopes
+    enabled_scopes += 1
+    CairoRunner.initialize_vm = initialize_coverage_vm
+
 
+def disable():
+    """Undoes enable(), the runners create regular vms once every enable() call is undone."""
+    global enabled_scopes
+    enabled_scopes = max(enabled_scopes - 1, 0)
+    if not enabled_scopes:
+        CairoRunner.initialize_vm = original_initialize_vm
 
-cairo_runner.VirtualMachine = OverrideVm
+
+def is_enabled() -> bool:
+    return enabled_scopes > 0
+
+
+@contextmanager
+def covering() -> Iterator[None]:
+    """Measures the coverage of the cairo code run in the with block."""
+    enable()
+    try:
+        yield
+    finally:
+        disable()
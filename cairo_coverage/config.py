@@ -0,0 +1,82 @@
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional, Tuple
+
+
+class Collection:
+    """How the vm collects the pcs that have been run."""
+
+    WRAP: str = "wrap"  # Wrap run_instruction to save each pc when it's run.
+    TRACE: str = "trace"  # Read the pcs from the vm trace at the end of the run, no cost per step.
+
+
+SORTS = ("name", "cover", "missed")  # Orders of the files in the report.
+
+
+@dataclass
+class CoverageConfig:
+    """Settings of the coverage collection, shared by all the vms."""
+
+    collection: str = Collection.WRAP  # See Collection.
+    count_hits: bool = False  # Count how many times each pc runs (profiling mode).
+    branches: bool = False  # Save the taken/not taken outcomes of the conditional jumps.
+    # Glob patterns of the cairo files measured (all if empty) and of the files left out (e.g.
+    # "*/openzeppelin/*"), applied when the programs are indexed, see cairo_coverage.filters.
+    include: List[str] = field(default_factory=list)
+    omit: List[str] = field(default_factory=list)
+    # Record one vm run out of sample_every (see cairo_coverage.sampling), 1 records every run.
+    sample_every: int = 1
+    functions: bool = False  # Print the coverage and steps of each cairo function in the report.
+    # Processes mapping the pcs run to lines when the report is made, one job per program. With 0
+    # each vm maps its pcs at the end of its run, else the vms only merge their pcs.
+    report_jobs: int = 0
+    # Directory of the pcs buffers shared by the processes (see cairo_coverage.shared), None to
+    # collect in the session of each process.
+    shared_hits: Optional[str] = None
+    report_width: Optional[int] = None  # Width of the report, default: the terminal's.
+    sort: str = "name"  # Order of the files in the report: name, cover or missed.
+    skip_covered: bool = False  # Don't print the fully covered files in the report.
+    color: Optional[bool] = None  # Color the report, default: only in a terminal.
+    fail_under: Optional[float] = None  # report_runs raises if the total % is lower.
+    # Min % of the files matching each glob, e.g. {"contracts/token/*": 90}.
+    file_fail_under: Dict[str, float] = field(default_factory=dict)
+    # Time the steps and cover_file of the vms (see cairo_coverage.telemetry), and the JSON file
+    # report_runs writes the stats in, not written if None.
+    telemetry: bool = False
+    telemetry_file: Optional[str] = None
+    hot_lines: int = 10  # Nb of lines/functions in the hottest lines report (profiling mode).
+    data_file: Optional[str] = None  # Where the coverage is saved at exit, not saved if None.
+    parallel: bool = False  # Suffix the data file with the host and pid so processes don't clash.
+
+
+config = CoverageConfig()
+
+
+def configure(**settings) -> CoverageConfig:
+    """Updates the coverage settings, e.g. configure(count_hits=True)."""
+    names = {field.name for field in fields(CoverageConfig)}
+    for name, value in settings.items():
+        if name not in names:
+            raise TypeError(f"Unknown coverage setting {name!r}.")
+        if name == "collection" and value not in (Collection.WRAP, Collection.TRACE):
+            raise ValueError(f"Unknown collection mode {value!r}.")
+        if name == "sort" and value not in SORTS:
+            raise ValueError(f"Unknown sort {value!r}, expected one of {', '.join(SORTS)}.")
+        if name in ("include", "omit") and isinstance(value, str):
+            raise TypeError(f"{name} expects a list of glob patterns, got {value!r}.")
+        if name == "sample_every" and value < 1:
+            raise ValueError(f"sample_every must be at least 1, got {value}.")
+        if name == "report_jobs" and value < 0:
+            raise ValueError(f"report_jobs can't be negative, got {value}.")
+        setattr(config, name, value)
+    return config
+
+
+def parse_threshold(value: str) -> Tuple[str, float]:
+    """(glob, min %) of a GLOB=MIN threshold of file_fail_under."""
+    pattern, _, minimum = value.rpartition("=")
+    try:
+        if pattern:
+            return pattern, float(minimum)
+    except ValueError:
+        pass
+    raise ValueError(f"Expected GLOB=MIN, got {value!r}.")
@@ -0,0 +1,360 @@
+import os
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from io import BytesIO
+from struct import Struct
+from tempfile import NamedTemporaryFile
+from typing import (
+    BinaryIO,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from cairo_coverage.lines import LineSet
+
+# (line, column) of a conditional jump in its file.
+BranchLocation = Tuple[int, int]
+# (file, line, nb of instructions) of a cairo function.
+FunctionLocation = Tuple[str, int, int]
+# (file, full name) of a cairo function, the functions of the main module of every starknet
+# contract are named __main__.* so the name alone isn't unique.
+FunctionKey = Tuple[str, str]
+
+MAGIC = b"CAIROCOV"  # First bytes of a coverage data file.
+VERSION = 3
+FILE_RECORD = b"F"  # Lines of a cairo file.
+FUNCTION_RECORD = b"U"  # Instructions and steps of a cairo function.
+BRANCH_RECORD = b"B"  # Conditional jumps of a cairo file.
+CONTEXT_RECORD = b"T"  # Name of a context, in the order of their ids, before the line contexts.
+LINE_CONTEXTS_RECORD = b"L"  # Contexts of the lines of a cairo file.
+
+SIZE = Struct("<I")  # Length prefix of the strings, bitmaps and arrays.
+STEPS = Struct("<QQ")  # Steps of a function and of the code inlined in it.
+FUNCTION = Struct("<II")  # Line and nb of instructions of a function.
+
+
+class CoverageDataError(Exception):
+    """Raised when a coverage data file can't be read."""
+
+
+@dataclass
+class CoverageData:
+    """Coverage collected by a process, what's saved in the data files."""
+
+    covered: DefaultDict[str, LineSet] = field(default_factory=lambda: defaultdict(LineSet))
+    statements: DefaultDict[str, LineSet] = field(default_factory=lambda: defaultdict(LineSet))
+    line_hits: DefaultDict[str, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    function_hits: Counter = field(default_factory=Counter)  # Steps of each function key.
+    branches: DefaultDict[str, Set[BranchLocation]] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+    branch_hits: DefaultDict[str, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    functions: Dict[FunctionKey, FunctionLocation] = field(default_factory=dict)
+    # Offsets from the first instruction of the instructions run in each function.
+    function_covered: DefaultDict[FunctionKey, LineSet] = field(
+        default_factory=lambda: defaultdict(LineSet)
+    )
+    inlined_hits: Counter = field(default_factory=Counter)  # Steps of the code inlined in each.
+    contexts: Dict[str, int] = field(default_factory=dict)  # Id of each context (e.g. test).
+    # Contexts that ran each line of each file, bit n is set if the context n ran the line.
+    line_contexts: DefaultDict[str, Dict[int, int]] = field(
+        default_factory=lambda: defaultdict(dict)
+    )
+
+    def context_id(self, context: str) -> int:
+        """Id of the context, added to the table if it's new."""
+        return self.contexts.setdefault(context, len(self.contexts))
+
+    def add_context(self, context: str, covered: Dict[str, LineSet]):
+        """Records that the context ran the covered lines."""
+        bit = 1 << self.context_id(context)
+        for file, lines in covered.items():
+            file_contexts = self.line_contexts[file]
+            for line in lines:
+                file_contexts[line] = file_contexts.get(line, 0) | bit
+
+    def add_line_contexts(self, file: str, line_contexts: Dict[int, int], ids: List[int]):
+        """Adds the contexts of the lines of a file, ids maps their context ids to the ones here."""
+        identity = ids == list(range(len(ids)))
+        file_contexts = self.line_contexts[file]
+        for line, bits in line_contexts.items():
+            if not identity:
+                bits = sum(1 << ids[context] for context in LineSet.from_bits(bits))
+            file_contexts[line] = file_contexts.get(line, 0) | bits
+
+    def context_names(self) -> List[str]:
+        """Names of the contexts, in the order of their ids."""
+        return list(self.contexts)
+
+    def contexts_of(self, file: str, line: int, names: Optional[List[str]] = None) -> List[str]:
+        """
+        Contexts that ran the line, e.g. the tests covering it. The reports looking up many lines
+        pass the context_names built once.
+        """
+        names = self.context_names() if names is None else names
+        bits = self.line_contexts.get(file, {}).get(line, 0)
+        return [names[context] for context in LineSet.from_bits(bits)]
+
+    def lines_only_covered_by(self, context: str) -> Dict[str, LineSet]:
+        """Lines of each file that no other context ran."""
+        if context not in self.contexts:
+            return {}
+        bit = 1 << self.contexts[context]
+        only = {
+            file: LineSet(line for line, bits in lines.items() if bits == bit)
+            for file, lines in self.line_contexts.items()
+        }
+        return {file: lines for file, lines in only.items() if lines}
+
+    def update(self, other: "CoverageData"):
+        """Merges the coverage of other in this one."""
+        for file, lines in other.statements.items():
+            self.statements[file].update(lines)
+        for file, lines in other.covered.items():
+            self.covered[file].update(lines)
+        for file, hits in other.line_hits.items():
+            self.line_hits[file].update(hits)
+        self.function_hits.update(other.function_hits)
+        for file, locations in other.branches.items():
+            self.branches[file].update(locations)
+        for file, hits in other.branch_hits.items():
+            self.branch_hits[file].update(hits)
+        for function, location in other.functions.items():
+            merge_function(self.functions, function, location)
+        for function, offsets in other.function_covered.items():
+            self.function_covered[function].update(offsets)
+        self.inlined_hits.update(other.inlined_hits)
+        if other.contexts:
+            ids = [self.context_id(context) for context in other.contexts]
+            for file, lines in other.line_contexts.items():
+                self.add_line_contexts(file, lines, ids)
+
+
+def merge_function(
+    functions: Dict[FunctionKey, FunctionLocation], key: FunctionKey, location: FunctionLocation
+):
+    """Adds the function, a function compiled differently in 2 programs keeps its biggest size."""
+    current = functions.get(key)
+    if current is None or current[2] < location[2]:
+        functions[key] = location
+
+
+def write_data(data: CoverageData, path: str):
+    """
+    Writes the coverage in the data file. The data is written in a temporary file first and then
+    moved so a file is either complete or not there.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with NamedTemporaryFile("wb", dir=directory, prefix=".cairo_coverage", delete=False) as stream:
+        try:
+            write_stream(data, stream)
+        except BaseException:
+            os.unlink(stream.name)
+            raise
+    os.replace(stream.name, path)
+
+
+def write_stream(data: CoverageData, stream: BinaryIO):
+    stream.write(MAGIC + bytes([VERSION]))
+    for file in sorted(data.statements.keys() | data.covered.keys()):
+        hits = data.line_hits.get(file, {})
+        stream.write(FILE_RECORD)
+        write_bytes(stream, file.encode())
+        write_bytes(stream, data.statements.get(file, LineSet()).to_bytes())
+        write_bytes(stream, data.covered.get(file, LineSet()).to_bytes())
+        write_bytes(stream, array("I", hits.keys()).tobytes())
+        write_bytes(stream, array("Q", hits.values()).tobytes())
+    for file, locations in data.branches.items():
+        hits = data.branch_hits.get(file, {})
+        stream.write(BRANCH_RECORD)
+        write_bytes(stream, file.encode())
+        jumps = array("Q")  # line, column, not taken, taken of each jump.
+        for location in sorted(locations):
+            jumps.extend((*location, hits.get((location, False), 0), hits.get((location, True), 0)))
+        write_bytes(stream, jumps.tobytes())
+    for function in sorted(data.functions.keys() | data.function_hits.keys()):
+        file, line, instructions = data.functions.get(function, (function[0], 0, 0))
+        stream.write(FUNCTION_RECORD)
+        write_bytes(stream, function[1].encode())
+        write_bytes(stream, file.encode())
+        stream.write(FUNCTION.pack(line, instructions))
+        write_bytes(stream, data.function_covered.get(function, LineSet()).to_bytes())
+        stream.write(STEPS.pack(data.function_hits[function], data.inlined_hits[function]))
+    for context in data.contexts:  # In the order of their ids.
+        stream.write(CONTEXT_RECORD)
+        write_bytes(stream, context.encode())
+    for file, lines in data.line_contexts.items():
+        stream.write(LINE_CONTEXTS_RECORD)
+        write_bytes(stream, file.encode())
+        bitsets = [LineSet.from_bits(bits).to_bytes() for bits in lines.values()]
+        write_bytes(stream, array("I", lines.keys()).tobytes())
+        write_bytes(stream, array("I", map(len, bitsets)).tobytes())
+        write_bytes(stream, b"".join(bitsets))
+
+
+def write_bytes(stream: BinaryIO, value: bytes):
+    stream.write(SIZE.pack(len(value)))
+    stream.write(value)
+
+
+def data_to_bytes(data: CoverageData) -> bytes:
+    """The content of the data file of the coverage (e.g. to send it to another process)."""
+    stream = BytesIO()
+    write_stream(data, stream)
+    return stream.getvalue()
+
+
+def read_bytes(stream: BinaryIO, size: int) -> bytes:
+    value = stream.read(size)
+    if len(value) != size:
+        raise CoverageDataError("Truncated coverage data file.")
+    return value
+
+
+def read_sized(stream: BinaryIO) -> bytes:
+    (size,) = SIZE.unpack(read_bytes(stream, SIZE.size))
+    return read_bytes(stream, size)
+
+
+Record = Union[
+    Tuple[bytes, str, LineSet, LineSet, Counter],  # File.
+    Tuple[bytes, str, FunctionLocation, LineSet, int, int],  # Function.
+    Tuple[bytes, str, Dict[BranchLocation, Tuple[int, int]]],  # Branches.
+    Tuple[bytes, str],  # Context.
+    Tuple[bytes, str, Dict[int, int]],  # Line contexts.
+]
+
+
+def iter_records(path: str) -> Iterator[Record]:
+    """
+    Yields the records of a data file one by one, prefixed with their kind:
+    (FILE_RECORD, file, statements, covered, line hits) for the cairo files,
+    (FUNCTION_RECORD, function, location, covered offsets, steps, inlined steps) for the functions
+    and
+    (BRANCH_RECORD, file, {jump: (not taken, taken)}) for the conditional jumps,
+    (CONTEXT_RECORD, context) for the contexts in the order of their ids and
+    (LINE_CONTEXTS_RECORD, file, {line: context bits}) for the contexts of the lines.
+    """
+    with open(path, "rb") as stream:
+        try:
+            yield from read_records(stream)
+        except CoverageDataError as exc:
+            raise CoverageDataError(f"{path}: {exc}") from None
+
+
+def read_records(stream: BinaryIO) -> Iterator[Record]:
+    if stream.read(len(MAGIC) + 1) != MAGIC + bytes([VERSION]):
+        raise CoverageDataError("Not a cairo coverage data file.")
+    while True:
+        kind = stream.read(1)
+        if not kind:
+            return
+        name = read_sized(stream).decode()
+        if kind == FILE_RECORD:
+            statements = LineSet.from_bytes(read_sized(stream))
+            covered = LineSet.from_bytes(read_sized(stream))
+            lines, counts = array("I"), array("Q")
+            lines.frombytes(read_sized(stream))
+            counts.frombytes(read_sized(stream))
+            yield kind, name, statements, covered, Counter(dict(zip(lines, counts)))
+        elif kind == FUNCTION_RECORD:
+            file = read_sized(stream).decode()
+            line, instructions = FUNCTION.unpack(read_bytes(stream, FUNCTION.size))
+            covered = LineSet.from_bytes(read_sized(stream))
+            steps, inlined_steps = STEPS.unpack(read_bytes(stream, STEPS.size))
+            yield kind, name, (file, line, instructions), covered, steps, inlined_steps
+        elif kind == BRANCH_RECORD:
+            jumps = array("Q")
+            jumps.frombytes(read_sized(stream))
+            yield kind, name, {
+                (jumps[i], jumps[i + 1]): (jumps[i + 2], jumps[i + 3])
+                for i in range(0, len(jumps), 4)
+            }
+        elif kind == CONTEXT_RECORD:
+            yield kind, name
+        elif kind == LINE_CONTEXTS_RECORD:
+            lines, sizes = array("I"), array("I")
+            lines.frombytes(read_sized(stream))
+            sizes.frombytes(read_sized(stream))
+            bitsets = read_sized(stream)
+            line_contexts, offset = {}, 0
+            for line, size in zip(lines, sizes):
+                line_contexts[line] = int.from_bytes(bitsets[offset : offset + size], "little")
+                offset += size
+            yield kind, name, line_contexts
+        else:
+            raise CoverageDataError(f"Unknown record {kind!r}.")
+
+
+def merge_data(data: CoverageData, path: str) -> CoverageData:
+    """Merges a data file in the coverage, one record at a time."""
+    return merge_records(data, iter_records(path))
+
+
+def merge_bytes(data: CoverageData, content: bytes) -> CoverageData:
+    """Merges the content of a data file (see data_to_bytes) in the coverage."""
+    return merge_records(data, read_records(BytesIO(content)))
+
+
+def merge_records(data: CoverageData, records: Iterable[Record]) -> CoverageData:
+    ids: List[int] = []  # Ids in data of the contexts of the records.
+    for record in records:
+        if record[0] == CONTEXT_RECORD:
+            ids.append(data.context_id(record[1]))
+            continue
+        if record[0] == LINE_CONTEXTS_RECORD:
+            _, file, line_contexts = record
+            data.add_line_contexts(file, line_contexts, ids)
+            continue
+        if record[0] == BRANCH_RECORD:
+            _, file, jumps = record
+            data.branches[file].update(jumps)
+            for location, (not_taken, taken) in jumps.items():
+                if not_taken:
+                    data.branch_hits[file][(location, False)] += not_taken
+                if taken:
+                    data.branch_hits[file][(location, True)] += taken
+            continue
+        if record[0] == FUNCTION_RECORD:
+            _, name, location, covered, steps, inlined_steps = record
+            function = (location[0], name)
+            if location[2]:
+                merge_function(data.functions, function, location)
+            if covered:
+                data.function_covered[function].update(covered)
+            if steps:
+                data.function_hits[function] += steps
+            if inlined_steps:
+                data.inlined_hits[function] += inlined_steps
+            continue
+        _, file, statements, covered, hits = record
+        data.statements[file].update(statements)
+        if covered:
+            data.covered[file].update(covered)
+        if hits:
+            data.line_hits[file].update(hits)
+    return data
+
+
+def read_data(path: str) -> CoverageData:
+    return merge_data(CoverageData(), path)
+
+
+def combine(paths: Iterable[str], output: str) -> CoverageData:
+    """
+    Merges the data files in output. The files are read one after the other so the memory only
+    depends on the size of the cairo sources and not on the number of files.
+    """
+    data = CoverageData()
+    for path in paths:
+        merge_data(data, path)
+    write_data(data, output)
+    return data
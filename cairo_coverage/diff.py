@@ -0,0 +1,97 @@
+"""Coverage of the cairo lines changed since a git ref (diff coverage), to gate the new code."""
+import re
+import subprocess
+from dataclasses import dataclass
+from os import path
+from typing import Dict, List, Optional
+
+from cairo_coverage.cairo_coverage import CoverageFile
+from cairo_coverage.lines import LineSet, format_ranges
+
+HUNK = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+class DiffError(Exception):
+    """Raised when the changes can't be read from git."""
+
+
+def git(args: List[str], cwd: Optional[str] = None) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as exc:
+        message = getattr(exc, "stderr", None) or str(exc)
+        raise DiffError(f"git {' '.join(args)} failed: {message.strip()}") from None
+
+
+def changed_lines(ref: str, cwd: Optional[str] = None) -> Dict[str, LineSet]:
+    """Lines of the cairo files added or modified since ref (working tree included), by path."""
+    root = git(["rev-parse", "--show-toplevel"], cwd).strip()
+    options = ["--unified=0", "--no-color", "--no-renames", "--dst-prefix=b/"]
+    diff = git(["diff", *options, ref, "--", "*.cairo"], cwd)
+    changes: Dict[str, LineSet] = {}
+    lines: Optional[LineSet] = None
+    for row in diff.splitlines():
+        if row.startswith("+++ "):
+            name = row[4:]
+            lines = None
+            if name != "/dev/null":  # Not deleted.
+                lines = changes.setdefault(path.join(root, name[2:]), LineSet())  # b/ prefix.
+            continue
+        match = HUNK.match(row)
+        if match is not None and lines is not None:
+            start, count = int(match.group(1)), int(match.group(2) or 1)
+            lines.update(range(start, start + count))
+    return changes
+
+
+@dataclass
+class DiffFile:
+    name: str  # Filename.
+    changed: LineSet  # Changed lines with code.
+    covered: LineSet  # Changed lines tested.
+
+    def __post_init__(self):
+        self.missed = self.changed - self.covered  # Changed lines not tested.
+
+
+def diff_coverage(
+    covered_files: List[CoverageFile], changes: Dict[str, LineSet]
+) -> List[DiffFile]:
+    """Coverage of the changed lines of each file, the changed lines without code are ignored."""
+    changes = {path.realpath(name): lines for name, lines in changes.items()}
+    diff_files = []
+    for file in covered_files:
+        lines = changes.get(path.realpath(file.name))
+        if lines is None:
+            continue
+        changed = lines & file.statements
+        if changed:
+            diff_files.append(DiffFile(file.name, changed, changed & file.covered))
+    return diff_files
+
+
+def total_diff_coverage(diff_files: List[DiffFile]) -> float:
+    """% of the changed lines with code that are tested."""
+    nb_changed = sum(len(file.changed) for file in diff_files)
+    if not nb_changed:
+        return 100.0
+    return 100 * sum(len(file.covered) for file in diff_files) / nb_changed
+
+
+def print_diff(diff_files: List[DiffFile], ref: str):
+    """Print the coverage of the changed lines."""
+    print(f"\nDiff coverage against {ref}")
+    if not diff_files:
+        print("No changed cairo line with code")
+        return
+    max_name = max(len(file.name) for file in diff_files) + 2
+    print(f"{'File':{max_name}}{'Changed':>9}{'Covered(%)':>12}  Lines missed")
+    for file in diff_files:
+        pct = 100 * len(file.covered) / len(file.changed)
+        print(
+            f"{file.name:{max_name}}{len(file.changed):>9}{pct:>12.1f}"
+            f"  {format_ranges(file.missed.ranges())}"
+        )
+    print(f"Total diff coverage: {total_diff_coverage(diff_files):.1f}%")
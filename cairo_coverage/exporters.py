@@ -0,0 +1,198 @@
+"""
+Machine readable reports of the coverage files returned by report_runs, for the coverage tools
+and dashboards: LCOV, Cobertura XML and JSON. The reports are written file by file in the output
+stream so the memory doesn't depend on the number of cairo files.
+"""
+import json
+import sys
+from itertools import groupby
+from os import path
+from time import time
+from typing import Callable, Dict, Iterable, List, TextIO, Tuple
+from xml.sax.saxutils import quoteattr
+
+from cairo_coverage.cairo_coverage import CoverageFile, FunctionCoverage
+
+# Writes the report of the files in the stream.
+Exporter = Callable[[List[CoverageFile], TextIO], None]
+
+
+def line_hits(file: CoverageFile) -> Iterable[Tuple[int, int]]:
+    """(line, nb of runs) of each line with code, 1 for the run lines if the hits aren't counted."""
+    for line in file.statements:
+        yield line, file.hits.get(line, 1) if line in file.covered else 0
+
+
+def jump_outcomes(file: CoverageFile) -> Iterable[Tuple[int, int, List[int]]]:
+    """(line, column, [runs not taken, runs taken]) of each conditional jump."""
+    for line, column in sorted(file.branches):
+        yield line, column, [file.branch_hits.get(((line, column), taken), 0) for taken in (0, 1)]
+
+
+def function_runs(function: FunctionCoverage) -> int:
+    """Steps of the function in profiling mode, else 1 if it ran."""
+    return function.steps or int(function.entered)
+
+
+def write_lcov(covered_files: List[CoverageFile], stream: TextIO):
+    """LCOV tracefile (genhtml, codecov, coveralls...)."""
+    for file in covered_files:
+        stream.write(f"TN:\nSF:{file.name}\n")
+        for function in file.functions:
+            stream.write(f"FN:{function.line},{function.name}\n")
+        for function in file.functions:
+            stream.write(f"FNDA:{function_runs(function)},{function.name}\n")
+        stream.write(f"FNF:{len(file.functions)}\n")
+        stream.write(f"FNH:{sum(function.entered for function in file.functions)}\n")
+        if file.branches:
+            blocks: Dict[int, int] = {}  # Nb of jumps already written on each line.
+            for line, _, outcomes in jump_outcomes(file):
+                block = blocks[line] = blocks.get(line, -1) + 1
+                for branch, runs in enumerate(outcomes):
+                    taken = runs if line in file.covered else "-"  # "-" if the jump never ran.
+                    stream.write(f"BRDA:{line},{block},{branch},{taken}\n")
+            stream.write(f"BRF:{file.nb_branches}\nBRH:{file.nb_branches_covered}\n")
+        for line, hits in line_hits(file):
+            stream.write(f"DA:{line},{hits}\n")
+        stream.write(f"LF:{len(file.statements)}\nLH:{len(file.covered & file.statements)}\n")
+        stream.write("end_of_record\n")
+
+
+def rate(covered: int, total: int) -> str:
+    return f"{covered / total:.4f}" if total else "1"
+
+
+def xml_counts(files: List[CoverageFile]) -> str:
+    """Line and branch rates attributes of the Cobertura elements."""
+    lines = sum(len(file.statements) for file in files)
+    covered = sum(len(file.covered & file.statements) for file in files)
+    branches = sum(file.nb_branches for file in files)
+    branches_covered = sum(file.nb_branches_covered for file in files)
+    return (
+        f'lines-valid="{lines}" lines-covered="{covered}" line-rate="{rate(covered, lines)}" '
+        f'branches-valid="{branches}" branches-covered="{branches_covered}" '
+        f'branch-rate="{rate(branches_covered, branches)}" complexity="0"'
+    )
+
+
+def directory(file: CoverageFile) -> str:
+    return path.dirname(file.name)
+
+
+def write_cobertura(covered_files: List[CoverageFile], stream: TextIO):
+    """Cobertura XML report (GitLab, Jenkins, Azure...), one package per directory."""
+    stream.write('<?xml version="1.0" ?>\n')
+    stream.write(
+        f'<coverage version="1" timestamp="{int(time() * 1000)}" {xml_counts(covered_files)}>\n'
+    )
+    stream.write("\t<sources>\n\t\t<source>.</source>\n\t</sources>\n\t<packages>\n")
+    for package, files in groupby(sorted(covered_files, key=directory), key=directory):
+        package_files = list(files)
+        stream.write(f"\t\t<package name={quoteattr(package)} {xml_counts(package_files)}>\n")
+        stream.write("\t\t\t<classes>\n")
+        for file in package_files:
+            stream.write(
+                f"\t\t\t\t<class name={quoteattr(path.basename(file.name))} "
+                f"filename={quoteattr(file.name)} {xml_counts([file])}>\n\t\t\t\t\t<methods>\n"
+            )
+            for function in file.functions:
+                stream.write(
+                    f"\t\t\t\t\t\t<method name={quoteattr(function.name)} signature=\"\" "
+                    f'line-rate="{rate(function.nb_covered, function.instructions)}" '
+                    f'branch-rate="1" complexity="0">\n'
+                    f'\t\t\t\t\t\t\t<lines><line number="{function.line}" '
+                    f'hits="{function_runs(function)}"/></lines>\n\t\t\t\t\t\t</method>\n'
+                )
+            stream.write("\t\t\t\t\t</methods>\n\t\t\t\t\t<lines>\n")
+            jumps: Dict[int, List[int]] = {}  # Outcomes of the jumps of each line.
+            for line, _, outcomes in jump_outcomes(file):
+                jumps.setdefault(line, []).extend(outcomes)
+            for line, hits in line_hits(file):
+                outcomes = jumps.get(line)
+                if outcomes is None:
+                    stream.write(
+                        f'\t\t\t\t\t\t<line number="{line}" hits="{hits}" branch="false"/>\n'
+                    )
+                    continue
+                run, total = sum(1 for runs in outcomes if runs), len(outcomes)
+                stream.write(
+                    f'\t\t\t\t\t\t<line number="{line}" hits="{hits}" branch="true" '
+                    f'condition-coverage="{100 * run // total}% ({run}/{total})"/>\n'
+                )
+            stream.write("\t\t\t\t\t</lines>\n\t\t\t\t</class>\n")
+        stream.write("\t\t\t</classes>\n\t\t</package>\n")
+    stream.write("\t</packages>\n</coverage>\n")
+
+
+def file_summary(file: CoverageFile) -> dict:
+    nb_statements = len(file.statements)
+    nb_covered = len(file.covered & file.statements)
+    return {
+        "num_statements": nb_statements,
+        "covered_lines": nb_covered,
+        "missing_lines": nb_statements - nb_covered,
+        "percent_covered": 100 * nb_covered / nb_statements if nb_statements else 100.0,
+        "num_branches": file.nb_branches,
+        "covered_branches": file.nb_branches_covered,
+    }
+
+
+def write_json(covered_files: List[CoverageFile], stream: TextIO):
+    """JSON report, the files are written one by one and the totals at the end."""
+    stream.write(f'{{"meta": {{"timestamp": {time():.3f}}}, "files": {{')
+    totals = {"num_statements": 0, "covered_lines": 0, "num_branches": 0, "covered_branches": 0}
+    for index, file in enumerate(covered_files):
+        summary = file_summary(file)
+        for name in totals:
+            totals[name] += summary[name]
+        report = {
+            "executed_lines": list(file.covered & file.statements),
+            "missing_lines": list(file.statements - file.covered),
+            "missing_ranges": (file.statements - file.covered).ranges(),
+            "summary": summary,
+            "functions": {
+                function.name: {
+                    "line": function.line,
+                    "instructions": function.instructions,
+                    "covered_instructions": function.nb_covered,
+                    "percent_covered": function.pct_covered,
+                    "steps": function.steps,
+                    "inlined_steps": function.inlined_steps,
+                }
+                for function in file.functions
+            },
+        }
+        if file.hits:
+            report["hits"] = {str(line): hits for line, hits in sorted(file.hits.items())}
+        if file.contexts:
+            report["contexts"] = {str(line): names for line, names in file.contexts.items()}
+        if file.branches:
+            report["branches"] = [
+                {"line": line, "column": column, "not_taken": outcomes[0], "taken": outcomes[1]}
+                for line, column, outcomes in jump_outcomes(file)
+            ]
+        stream.write(f"{', ' if index else ''}{json.dumps(file.name)}: {json.dumps(report)}")
+    statements, covered = totals["num_statements"], totals["covered_lines"]
+    totals["missing_lines"] = statements - covered
+    totals["percent_covered"] = 100 * covered / statements if statements else 100.0
+    stream.write(f'}}, "totals": {json.dumps(totals)}}}\n')
+
+
+EXPORTERS: Dict[str, Exporter] = {
+    "lcov": write_lcov,
+    "xml": write_cobertura,
+    "json": write_json,
+}
+
+
+def export(covered_files: List[CoverageFile], report_format: str, output: str) -> str:
+    """Writes the report of the files in the format (see EXPORTERS) in output, - for stdout."""
+    exporter = EXPORTERS.get(report_format)
+    if exporter is None:
+        raise ValueError(f"Unknown report format {report_format!r}.")
+    if output == "-":
+        exporter(covered_files, sys.stdout)
+    else:
+        with open(output, "w") as stream:
+            exporter(covered_files, stream)
+    return output
@@ -0,0 +1,54 @@
+"""
+Include and omit glob patterns of the cairo files measured, compiled once in a single regex each.
+The program indexes are built for a filter so the pcs of the omitted files (e.g. the libraries)
+are dropped when the program is indexed and never mapped to lines by the vms.
+"""
+import re
+from fnmatch import translate
+from functools import lru_cache
+from glob import escape
+from typing import Dict, Iterable, Optional, Pattern, Tuple
+
+AUTOGEN = "autogen"  # In the name of the files generated by the compiler, never measured.
+
+
+def compile_globs(patterns: Tuple[str, ...]) -> Optional[Pattern]:
+    """Regex matching the names matching one of the glob patterns, None if there's no pattern."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{translate(pattern)})" for pattern in patterns))
+
+
+class FileFilter:
+    """
+    Tells if a cairo file is measured: not generated by the compiler, matching an include pattern
+    (any file if there's none) and no omit pattern. The patterns are matched against the names of
+    the files in the debug info, e.g. */openzeppelin/*.
+    """
+
+    def __init__(self, include: Iterable[str] = (), omit: Iterable[str] = ()):
+        self.key: Tuple[Tuple[str, ...], Tuple[str, ...]] = (tuple(include), tuple(omit))
+        self.include = compile_globs(self.key[0])
+        self.omit = compile_globs(self.key[1])
+        self.measured: Dict[str, bool] = {}  # Answer for each file already seen.
+
+    @classmethod
+    def excluding(cls, substrings: Iterable[str]) -> "FileFilter":
+        """Filter omitting the files containing one of the substrings."""
+        return cls(omit=[f"*{escape(substring)}*" for substring in substrings])
+
+    def __call__(self, file: str) -> bool:
+        measured = self.measured.get(file)
+        if measured is None:
+            measured = self.measured[file] = (
+                AUTOGEN not in file
+                and (self.include is None or self.include.match(file) is not None)
+                and (self.omit is None or self.omit.match(file) is None)
+            )
+        return measured
+
+
+@lru_cache(maxsize=16)
+def file_filter(include: Tuple[str, ...] = (), omit: Tuple[str, ...] = ()) -> FileFilter:
+    """Compiled filter of the patterns, shared by the indexes built with the same patterns."""
+    return FileFilter(include, omit)
@@ -0,0 +1,229 @@
+"""
+HTML report of the coverage files returned by report_runs: an index page with the totals of each
+file (sortable by clicking the headers) and a page per cairo file with its annotated source, the
+missed lines, partial jumps and hit counts highlighted.
+
+The pages are rendered lazily, line by line straight in their file, and in parallel with jobs > 1.
+The digest of the coverage and source of each page is saved in the report directory so the next
+report only renders again the files whose coverage or source changed since.
+"""
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
+from html import escape
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cairo_coverage.cairo_coverage import CoverageFile
+from cairo_coverage.store import source_hash
+
+VERSION = "1"  # Changing it renders all the pages again, e.g. when the template changes.
+STATUS_FILE = "status.json"  # Digest and page of each rendered file.
+SOURCE_CACHE_SIZE = 64  # Max nb of sources kept in memory by each process.
+
+STYLE = """
+body { font-family: sans-serif; margin: 1em 2em; }
+table { border-collapse: collapse; }
+th, td { padding: 2px 8px; text-align: right; }
+th { cursor: pointer; border-bottom: 1px solid #888; }
+td.name, th.name { text-align: left; }
+tfoot td { font-weight: bold; border-top: 1px solid #888; }
+pre { margin: 0; }
+.source td { text-align: left; font-family: monospace; white-space: pre; padding: 0 8px; }
+.source td.n, .source td.h { text-align: right; color: #888; }
+.run { background: #dfd; }
+.mis { background: #fdd; }
+.par { background: #ffd; }
+"""
+
+# Sorts the index table on the clicked column, the cells have their sort key in data-v.
+SORT_SCRIPT = """
+document.querySelectorAll("th").forEach((th, column) => th.onclick = () => {
+  const body = th.closest("table").tBodies[0];
+  const up = th.dataset.up = th.dataset.up === "1" ? "0" : "1";
+  const key = row => {
+    const cell = row.cells[column];
+    return cell.dataset.v === undefined ? cell.textContent : parseFloat(cell.dataset.v);
+  };
+  [...body.rows]
+    .sort((a, b) => (key(a) > key(b) ? 1 : key(a) < key(b) ? -1 : 0) * (up === "1" ? 1 : -1))
+    .forEach(row => body.appendChild(row));
+});
+"""
+
+
+def read_source(name: str) -> Optional[Tuple[str, ...]]:
+    """Lines of the cairo file, None if it can't be read (e.g. compiled from a string)."""
+    try:
+        stat = os.stat(name)
+    except OSError:
+        return None
+    return read_version(name, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=SOURCE_CACHE_SIZE)
+def read_version(name: str, mtime_ns: int, size: int) -> Optional[Tuple[str, ...]]:
+    """Lines of the file, cached until it's modified."""
+    try:
+        with open(name, encoding="utf-8", errors="replace") as stream:
+            return tuple(line.rstrip("\n") for line in stream)
+    except OSError:
+        return None
+
+
+def page_name(file: CoverageFile) -> str:
+    """Name of the page of the file, readable and unique."""
+    digest = sha256(file.name.encode()).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', file.name.lstrip('/'))[-80:]}_{digest}.html"
+
+
+def file_digest(file: CoverageFile) -> str:
+    """Digest of what the page of the file shows: its coverage and the hash of its source."""
+    coverage = [
+        VERSION,
+        source_hash(file.name),
+        file.statements.ranges(),
+        file.covered.ranges(),
+        sorted(file.hits.items()),
+        sorted(file.branches),
+        sorted((location, taken, hits) for (location, taken), hits in file.branch_hits.items()),
+        [(f.name, f.line, f.instructions, f.nb_covered, f.steps) for f in file.functions],
+        sorted(file.contexts.items()),
+    ]
+    return sha256(repr(coverage).encode()).hexdigest()
+
+
+def line_class(file: CoverageFile, line: int) -> str:
+    """Css class of the line: run, missed, partial jump or no code."""
+    if line not in file.statements:
+        return ""
+    if line not in file.covered:
+        return "mis"
+    return "par" if line in file.partial_branches else "run"
+
+
+def source_rows(file: CoverageFile) -> Iterator[str]:
+    """Rows of the annotated source, the lines with code only if the source can't be read."""
+    source = read_source(file.name)
+    if source is None:
+        numbers: Iterator[int] = iter(file.statements)
+        lines: Dict[int, str] = {}
+    else:
+        numbers = iter(range(1, len(source) + 1))
+        lines = dict(enumerate(source, 1))
+    for line in numbers:
+        css = line_class(file, line)
+        hits = file.hits.get(line, "") if file.hits else ""
+        contexts = file.contexts.get(line)
+        title = f' title="{escape(", ".join(contexts))}"' if contexts else ""
+        yield (
+            f'<tr class="{css}"{title}><td class="n">{line}</td><td class="h">{hits}</td>'
+            f"<td>{escape(lines.get(line, ''))}</td></tr>\n"
+        )
+
+
+def render_page(file: CoverageFile, output: str):
+    """Writes the page of the file in output."""
+    with open(output, "w", encoding="utf-8") as stream:
+        stream.write(
+            f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{escape(file.name)}"
+            f"</title><style>{STYLE}</style></head><body>\n<p><a href=\"index.html\">index</a></p>"
+            f"\n<h1>{escape(file.name)}</h1>\n<p>{file.pct_covered:.{file.precision}f}% covered, "
+            f"{file.nb_covered} of {file.nb_statements} lines, missed: "
+            f"{escape(file.missed_str) or 'none'}"
+        )
+        if file.branches:
+            stream.write(f", {file.nb_branches_covered} of {file.nb_branches} branches")
+        stream.write("</p>\n")
+        if file.functions:
+            stream.write("<table><thead><tr><th class=\"name\">Function</th><th>Line</th>")
+            stream.write("<th>Instructions</th><th>Covered(%)</th><th>Steps</th></tr></thead>\n")
+            for function in file.functions:
+                stream.write(
+                    f'<tr><td class="name">{escape(function.name)}</td><td>{function.line}</td>'
+                    f"<td>{function.instructions}</td><td>{function.pct_covered:.1f}</td>"
+                    f"<td>{function.steps}</td></tr>\n"
+                )
+            stream.write("</table>\n")
+        stream.write('<table class="source">\n')
+        for row in source_rows(file):
+            stream.write(row)
+        stream.write("</table>\n</body></html>\n")
+
+
+def render_job(file: CoverageFile, output: str) -> str:
+    render_page(file, output)
+    return file.name
+
+
+def write_index(covered_files: List[CoverageFile], pages: Dict[str, str], output: str):
+    """Writes the index page with the totals of each file."""
+    nb_statements = sum(file.nb_statements for file in covered_files)
+    nb_covered = sum(file.nb_covered for file in covered_files)
+    pct = 100 * nb_covered / nb_statements if nb_statements else 100.0
+    with open(output, "w", encoding="utf-8") as stream:
+        stream.write(
+            f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Cairo coverage</title>"
+            f"<style>{STYLE}</style></head><body>\n<h1>Cairo coverage: {pct:.1f}%</h1>\n"
+            "<table><thead><tr><th class=\"name\">File</th><th>Statements</th><th>Missed</th>"
+            "<th>Branches</th><th>Covered(%)</th></tr></thead>\n<tbody>\n"
+        )
+        for file in covered_files:
+            stream.write(
+                f'<tr><td class="name"><a href="{escape(pages[file.name])}">{escape(file.name)}'
+                f'</a></td><td data-v="{file.nb_statements}">{file.nb_statements}</td>'
+                f'<td data-v="{file.nb_missed}">{file.nb_missed}</td>'
+                f'<td data-v="{file.nb_branches}">{file.nb_branches_covered}/{file.nb_branches}'
+                f'</td><td data-v="{file.pct_covered}">{file.pct_covered:.1f}</td></tr>\n'
+            )
+        stream.write(
+            f"</tbody>\n<tfoot><tr><td class=\"name\">Total</td><td>{nb_statements}</td>"
+            f"<td>{nb_statements - nb_covered}</td><td></td><td>{pct:.1f}</td></tr></tfoot>\n"
+            f"</table>\n<script>{SORT_SCRIPT}</script>\n</body></html>\n"
+        )
+
+
+def read_status(directory: str) -> Dict[str, Dict[str, str]]:
+    """Digest and page of the files of the previous report of the directory."""
+    try:
+        with open(os.path.join(directory, STATUS_FILE)) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_html(covered_files: List[CoverageFile], directory: str, jobs: int = 1) -> List[str]:
+    """
+    Writes the HTML report of the files in the directory, renders in jobs processes the pages of
+    the files whose coverage or source changed since the previous report, returns these files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_status(directory)
+    status: Dict[str, Dict[str, str]] = {}
+    outdated = []
+    for file in covered_files:
+        entry = status[file.name] = {"digest": file_digest(file), "page": page_name(file)}
+        output = os.path.join(directory, entry["page"])
+        if previous.get(file.name) != entry or not os.path.exists(output):
+            outdated.append((file, output))
+    if jobs > 1 and len(outdated) > 1:
+        with ProcessPoolExecutor(min(jobs, len(outdated))) as pool:
+            rendered = list(pool.map(render_job, *zip(*outdated)))
+    else:
+        rendered = [render_job(file, output) for file, output in outdated]
+    for name, entry in previous.items():  # Pages of the files no longer reported.
+        if name not in status:
+            try:
+                os.unlink(os.path.join(directory, entry["page"]))
+            except OSError:
+                pass
+    write_index(
+        covered_files,
+        {name: entry["page"] for name, entry in status.items()},
+        os.path.join(directory, "index.html"),
+    )
+    with open(os.path.join(directory, STATUS_FILE), "w") as stream:
+        json.dump(status, stream)
+    return rendered
@@ -0,0 +1,109 @@
+from typing import AbstractSet, Iterable, Iterator, List, Tuple, Union
+
+# Line numbers of the set bits of each byte value.
+BYTE_LINES = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class LineSet:
+    """
+    Set of line numbers stored as a bitset (bit n is set if line n is in the set) so the unions
+    and differences of the lines of a file are a few operations on ints instead of one per line.
+    """
+
+    __slots__ = ("bits",)
+
+    def __init__(self, lines: Union["LineSet", Iterable[int]] = ()):
+        if isinstance(lines, LineSet):
+            self.bits: int = lines.bits
+        elif isinstance(lines, range) and lines.step == 1:
+            self.bits = span_bits(lines.start, lines.stop - 1) if lines else 0
+        else:
+            self.bits = 0
+            for line in lines:
+                self.bits |= 1 << line
+
+    @classmethod
+    def from_bits(cls, bits: int) -> "LineSet":
+        lines = cls()
+        lines.bits = bits
+        return lines
+
+    @classmethod
+    def from_bytes(cls, bitmap: bytes) -> "LineSet":
+        """Lines of a bitmap created by to_bytes."""
+        return cls.from_bits(int.from_bytes(bitmap, "little"))
+
+    def to_bytes(self) -> bytes:
+        """Bitmap of the lines, bit n of the byte n // 8 is set if line n is in the set."""
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+
+    def update(self, lines: Union["LineSet", Iterable[int]]):
+        """Adds the lines to the set."""
+        self.bits |= lines.bits if isinstance(lines, LineSet) else LineSet(lines).bits
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """(first, last) lines of each run of consecutive lines."""
+        ranges = []
+        bits = self.bits
+        offset = 0
+        while bits:
+            zeros = (bits & -bits).bit_length() - 1  # Nb of trailing zeros.
+            bits >>= zeros
+            offset += zeros
+            ones = (~bits & (bits + 1)).bit_length() - 1  # Nb of trailing ones.
+            ranges.append((offset, offset + ones - 1))
+            bits >>= ones
+            offset += ones
+        return ranges
+
+    def __iter__(self) -> Iterator[int]:
+        """Lines in increasing order."""
+        for byte_index, byte in enumerate(self.to_bytes()):
+            if byte:
+                offset = byte_index << 3
+                for bit in BYTE_LINES[byte]:
+                    yield offset + bit
+
+    def __len__(self) -> int:
+        return bin(self.bits).count("1")
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __contains__(self, line: object) -> bool:
+        return isinstance(line, int) and line >= 0 and bool(self.bits >> line & 1)
+
+    def __or__(self, other: "LineSet") -> "LineSet":
+        return LineSet.from_bits(self.bits | other.bits)
+
+    def __and__(self, other: "LineSet") -> "LineSet":
+        return LineSet.from_bits(self.bits & other.bits)
+
+    def __sub__(self, other: "LineSet") -> "LineSet":
+        return LineSet.from_bits(self.bits & ~other.bits)
+
+    def __ior__(self, other: "LineSet") -> "LineSet":
+        self.bits |= other.bits
+        return self
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, LineSet):
+            return self.bits == other.bits
+        if isinstance(other, AbstractSet):
+            return self.bits == LineSet(other).bits
+        return NotImplemented
+
+    __hash__ = None  # type: ignore  # Mutable.
+
+    def __repr__(self) -> str:
+        return f"LineSet({format_ranges(self.ranges())})"
+
+
+def span_bits(first: int, last: int) -> int:
+    """Bits of the lines first to last (included)."""
+    return ((1 << (last + 1)) - 1) ^ ((1 << first) - 1)
+
+
+def format_ranges(ranges: Iterable[Tuple[int, int]]) -> str:
+    """Compact form of the ranges, e.g. 12-40, 45."""
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
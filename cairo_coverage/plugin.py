@@ -0,0 +1,221 @@
+"""
+Pytest plugin measuring the coverage of the cairo code run by the tests:
+
+    pytest --cairo-cov --cairo-cov-fail-under=80
+
+With pytest-xdist each worker collects its coverage and sends it to the controller that merges
+everything in a single report.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+WORKER_OUTPUT_KEY = "cairo_coverage"  # Key of the worker coverage in the xdist worker output.
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("cairo-coverage", "cairo coverage reporting")
+    group.addoption(
+        "--cairo-cov",
+        action="store_true",
+        default=False,
+        help="Measure the coverage of the cairo code run by the tests.",
+    )
+    group.addoption(
+        "--cairo-cov-fail-under",
+        type=float,
+        default=None,
+        metavar="MIN",
+        help="Fail if the total cairo coverage is less than MIN %%.",
+    )
+    group.addoption(
+        "--cairo-cov-file-fail-under",
+        action="append",
+        default=[],
+        metavar="GLOB=MIN",
+        help="Fail if a cairo file matching the glob has a coverage less than MIN %%, e.g. "
+        "'contracts/token/*=90'. Can be repeated.",
+    )
+    group.addoption(
+        "--cairo-cov-include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Only measure the cairo files matching the glob, e.g. '*/contracts/*'. Can be "
+        "repeated.",
+    )
+    group.addoption(
+        "--cairo-cov-omit",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Don't measure the cairo files matching the glob, e.g. '*/openzeppelin/*'. Can be "
+        "repeated.",
+    )
+    group.addoption(
+        "--cairo-cov-contexts",
+        action="store_true",
+        default=False,
+        help="Record which tests run each cairo line (saved in the data file and json report).",
+    )
+    group.addoption(
+        "--cairo-cov-report",
+        action="append",
+        default=[],
+        metavar="FORMAT:PATH",
+        help="Also write the cairo coverage in a lcov, xml (Cobertura) or json file or a html "
+        "directory (default: htmlcov), e.g. xml:coverage.xml. Can be repeated.",
+    )
+    group.addoption(
+        "--cairo-cov-store",
+        default=None,
+        metavar="DIR",
+        help="Save the cairo coverage in this store and also report the stored coverage of the "
+        "cairo files that didn't change, e.g. when only the impacted tests are run.",
+    )
+    group.addoption(
+        "--cairo-cov-data-file",
+        default=None,
+        metavar="PATH",
+        help="Also save the cairo coverage of the session in this data file.",
+    )
+
+
+def parse_report(report: str) -> Tuple[str, str]:
+    """(format, path) of a --cairo-cov-report option, the path defaults to coverage.<format>."""
+    from cairo_coverage.exporters import EXPORTERS
+
+    report_format, _, output = report.partition(":")
+    if report_format == "html":
+        return report_format, output or "htmlcov"
+    if report_format not in EXPORTERS:
+        raise pytest.UsageError(
+            f"Unknown cairo coverage report format {report_format!r}, use one of "
+            f"{', '.join(EXPORTERS)}, html."
+        )
+    return report_format, output or f"coverage.{report_format}"
+
+
+def file_threshold(threshold: str) -> Tuple[str, float]:
+    """(glob, min %) of a --cairo-cov-file-fail-under option."""
+    from cairo_coverage.config import parse_threshold
+
+    try:
+        return parse_threshold(threshold)
+    except ValueError as exc:
+        raise pytest.UsageError(f"--cairo-cov-file-fail-under: {exc}") from exc
+
+
+def pytest_configure(config):
+    if config.getoption("cairo_cov"):
+        config.pluginmanager.register(CairoCoveragePlugin(config), "cairo_coverage_session")
+
+
+class CairoCoveragePlugin:
+    """Collects the coverage during the session and reports it at the end."""
+
+    def __init__(self, config):
+        from cairo_coverage import cairo_coverage
+        from cairo_coverage.config import configure
+
+        self.cairo_coverage = cairo_coverage
+        self.config = config
+        self.is_worker = hasattr(config, "workerinput")  # xdist worker.
+        self.fail_under: Optional[float] = config.getoption("cairo_cov_fail_under")
+        self.file_fail_under: Dict[str, float] = dict(
+            map(file_threshold, config.getoption("cairo_cov_file_fail_under"))
+        )
+        self.data_file: Optional[str] = config.getoption("cairo_cov_data_file")
+        self.contexts: bool = config.getoption("cairo_cov_contexts")
+        self.store: Optional[str] = config.getoption("cairo_cov_store")
+        self.reports: List[Tuple[str, str]] = [
+            parse_report(report) for report in config.getoption("cairo_cov_report")
+        ]
+        self.files: List = []
+        self.total: Optional[float] = None
+        self.measured = False  # Some cairo line was measured.
+        self.failures: List[str] = []  # Thresholds of the files not reached.
+        configure(
+            include=config.getoption("cairo_cov_include"), omit=config.getoption("cairo_cov_omit")
+        )
+        cairo_coverage.reset()
+        cairo_coverage.enable()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item):
+        """Records the coverage of the test for its node id."""
+        if not self.contexts:
+            yield
+            return
+        with self.cairo_coverage.context(item.nodeid):
+            yield
+
+    def pytest_unconfigure(self):
+        self.cairo_coverage.disable()
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        """Controller side of xdist, merges the coverage of the worker."""
+        from cairo_coverage.data import merge_bytes
+
+        content = getattr(node, "workeroutput", {}).get(WORKER_OUTPUT_KEY)
+        if content is not None:
+            merge_bytes(self.cairo_coverage.collected_data(), content)
+
+    def pytest_sessionfinish(self, session):
+        if self.is_worker:  # Sends the coverage to the controller.
+            from cairo_coverage.data import data_to_bytes
+
+            self.config.workeroutput[WORKER_OUTPUT_KEY] = data_to_bytes(
+                self.cairo_coverage.collected_data()
+            )
+            return
+        if self.data_file is not None:
+            self.cairo_coverage.save_data(self.data_file)
+        if self.store is not None:
+            from cairo_coverage.data import CoverageData
+            from cairo_coverage.store import CoverageStore
+
+            store = CoverageStore(self.store)
+            stored = CoverageData()
+            store.load(stored)  # Before saving the session so it's not counted twice.
+            store.save(self.cairo_coverage.collected_data())
+            self.cairo_coverage.collected_data().update(stored)
+        self.files = self.cairo_coverage.report_runs(print_summary=False)
+        if self.reports:
+            from cairo_coverage.exporters import export
+            from cairo_coverage.html_report import write_html
+
+            for report_format, output in self.reports:
+                if report_format == "html":
+                    write_html(self.files, output)
+                else:
+                    export(self.files, report_format, output)
+        self.total = self.cairo_coverage.total_coverage(self.files)
+        summary = self.cairo_coverage.CoverageSummary.from_files(self.files)
+        self.measured = summary.nb_statements > 0
+        # The total is checked below, unless nothing was measured.
+        self.failures = summary.failures(
+            self.fail_under if not self.measured else None, self.file_fail_under
+        )
+        under = self.fail_under is not None and self.total < self.fail_under
+        if (under or self.failures) and session.exitstatus == pytest.ExitCode.OK:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.is_worker or self.total is None:
+            return
+        terminalreporter.write_sep("-", "cairo coverage")
+        if self.files:
+            self.cairo_coverage.print_sum(covered_files=self.files)
+        if not self.measured:  # No total, the failures give the reason if a threshold is set.
+            if not self.failures:
+                terminalreporter.write_line(self.cairo_coverage.NOTHING_MEASURED)
+        else:
+            terminalreporter.write_line(f"Total cairo coverage: {self.total:.1f}%")
+        if self.fail_under is not None and self.total < self.fail_under:
+            terminalreporter.write_line(
+                f"FAIL Required cairo coverage of {self.fail_under}% not reached.", red=True
+            )
+        for failure in self.failures:
+            terminalreporter.write_line(f"FAIL {failure}", red=True)
@@ -0,0 +1,430 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from hashlib import sha256
+from threading import Lock
+from typing import (
+    Callable,
+    DefaultDict,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from weakref import ref
+
+from starkware.cairo.lang.compiler.debug_info import InstructionLocation
+from starkware.cairo.lang.compiler.encode import decode_instruction
+from starkware.cairo.lang.compiler.instruction import Instruction
+from starkware.cairo.lang.compiler.error_handling import Location
+from starkware.cairo.lang.compiler.program import ProgramBase
+
+from cairo_coverage.config import config
+from cairo_coverage.data import BranchLocation, CoverageData, FunctionKey
+from cairo_coverage.filters import AUTOGEN, FileFilter, file_filter
+from cairo_coverage.lines import LineSet, span_bits
+
+# (filename, lines) of a cairo location.
+LineSpan = Tuple[str, range]
+# (instruction size, filename, location) of a conditional jump.
+Branch = Tuple[int, str, BranchLocation]
+
+
+@dataclass
+class FunctionInfo:
+    """Instructions of a cairo function in a program."""
+
+    start: int  # Pc of the first instruction.
+    instructions: int  # Nb of instructions.
+    file: str  # File and line of the first instruction.
+    line: int
+
+
+def program_key(program: ProgramBase) -> Hashable:
+    """
+    Key identifying a compiled program, the same program deserialized twice has the same key. The
+    key is a digest of the bytecode and of the locations of the debug info, so the same code
+    compiled from other files or lines has another key. It's the same in all the processes.
+    """
+    digest = sha256(",".join(map(str, program.data)).encode())
+    if program.debug_info is not None:
+        for pc, location in sorted(program.debug_info.instruction_locations.items()):
+            scope = str(location.accessible_scopes[-1]) if location.accessible_scopes else ""
+            digest.update(f"\n{pc}:{scope}".encode())
+            instruct: Optional[Location] = location.inst
+            while instruct is not None:  # The location and its parent locations.
+                digest.update(
+                    f"|{instruct.input_file.filename}:{instruct.start_line}:{instruct.start_col}-"
+                    f"{instruct.end_line}:{instruct.end_col}".encode()
+                )
+                parent = instruct.parent_location
+                instruct = parent[0] if parent is not None else None
+    return digest.hexdigest()
+
+
+@dataclass
+class ProgramIndex:
+    """Pc to cairo lines mapping of a program, computed once and shared by all the vms running it."""
+
+    key: Hashable  # Key of the indexed program and of the file filter it's indexed for.
+    pc_lines: Dict[int, List[LineSpan]]  # Lines of each pc (with its parent locations).
+    pc_masks: Dict[int, List[Tuple[str, int]]]  # Bits of the lines of each pc, one int per file.
+    statements: Dict[str, LineSet]  # Lines with code of each file.
+    pc_functions: Dict[int, str]  # Cairo function of each pc.
+    functions: Dict[str, FunctionInfo]  # Instructions of each function.
+    # Function the code of the pc was generated for when it's another one (e.g. the external
+    # function of a wrapper), found with the outermost parent location of the pc.
+    pc_parents: Dict[int, str]
+    branches: Dict[int, Branch]  # Conditional jumps (jnz) of the program.
+    # Pcs of the measured files, byte pc is 1 (bit 8 * pc set) if the pc is one of them. The pcs
+    # run in the omitted files are dropped with a single and instead of being looked up one by one.
+    pc_mask: int = 0
+    measured_pcs: List[int] = field(default_factory=list)  # Pcs of the measured files, sorted.
+    # Key of each function in the coverage data, the names are only unique in the program.
+    function_keys: Dict[str, FunctionKey] = field(default_factory=dict)
+
+    def branch_locations(self) -> Dict[str, Set[BranchLocation]]:
+        """Location of the conditional jumps of each file."""
+        locations: DefaultDict[str, Set[BranchLocation]] = defaultdict(set)
+        for _, file, location in self.branches.values():
+            locations[file].add(location)
+        return locations
+
+    def cover(self, touched_pcs: Union[bytes, bytearray], run: CoverageData):
+        """Adds the lines and function instructions of the touched pcs (one byte per pc) to run."""
+        touched: DefaultDict[str, int] = defaultdict(int)  # Bits of the touched lines of each file.
+        offsets: DefaultDict[str, int] = defaultdict(int)  # Bits of the touched pcs by function.
+        size = len(touched_pcs)
+        touched_pcs = (int.from_bytes(touched_pcs, "little") & self.pc_mask).to_bytes(
+            size, "little"
+        )  # Only the touched pcs of the measured files.
+        pc = touched_pcs.find(1)
+        while pc != -1:  # Only look at the touched pcs.
+            for file, mask in self.pc_masks.get(pc, ()):
+                touched[file] |= mask
+            function = self.pc_functions.get(pc)
+            if function is not None:
+                offsets[function] |= 1 << (pc - self.functions[function].start)
+            pc = touched_pcs.find(1, pc + 1)
+        for file, mask in touched.items():
+            run.covered[file].bits |= mask
+        keys = self.function_keys
+        for function, bits in offsets.items():
+            run.function_covered[keys[function]].bits |= bits
+
+    def cover_jumps(self, jump_hits: Sequence[int], run: CoverageData):
+        """Adds the not taken and taken counters of each pc to the branch hits of run."""
+        branch_hits = run.branch_hits
+        for pc, (_, file, location) in self.branches.items():
+            not_taken, taken = jump_hits[2 * pc], jump_hits[2 * pc + 1]
+            if not_taken:
+                branch_hits[file][(location, False)] += not_taken
+            if taken:
+                branch_hits[file][(location, True)] += taken
+
+    def count(self, pc_hits: Sequence[int], run: CoverageData):
+        """Adds the hits of each pc to the lines and functions counters of run (profiling mode)."""
+        line_hits = run.line_hits
+        function_hits: DefaultDict[str, int] = defaultdict(int)  # Steps of each function.
+        inlined_hits: DefaultDict[str, int] = defaultdict(int)
+        touched: DefaultDict[str, int] = defaultdict(int)  # Bits of the touched lines of each file.
+        offsets: DefaultDict[str, int] = defaultdict(int)  # Bits of the touched pcs by function.
+        size = len(pc_hits)
+        for pc in self.measured_pcs:
+            count = pc_hits[pc] if pc < size else 0
+            if not count:
+                continue
+            for file, mask in self.pc_masks.get(pc, ()):
+                touched[file] |= mask
+            for file, lines in self.pc_lines.get(pc, ()):
+                file_hits = line_hits[file]
+                for line in lines:
+                    file_hits[line] += count
+            function = self.pc_functions.get(pc)
+            if function is not None:
+                function_hits[function] += count
+                offsets[function] |= 1 << (pc - self.functions[function].start)
+            parent = self.pc_parents.get(pc)
+            if parent is not None:
+                inlined_hits[parent] += count
+        for file, mask in touched.items():
+            run.covered[file].bits |= mask
+        keys = self.function_keys
+        for function, bits in offsets.items():
+            run.function_covered[keys[function]].bits |= bits
+        for function, steps in function_hits.items():
+            run.function_hits[keys[function]] += steps
+        for function, steps in inlined_hits.items():
+            run.inlined_hits[keys[function]] += steps
+
+    @classmethod
+    def from_program(
+        cls,
+        program: ProgramBase,
+        measured: Optional[FileFilter] = None,
+        key: Optional[Hashable] = None,
+    ) -> "ProgramIndex":
+        """
+        Walks the debug info of the program once to map each pc to its lines, the lines and
+        functions of the files the filter doesn't measure (default: the generated files) are left
+        out. key is the program_key of the program if already computed.
+        """
+        if measured is None:
+            measured = file_filter()
+        pc_lines: Dict[int, List[LineSpan]] = {}
+        pc_masks: Dict[int, List[Tuple[str, int]]] = {}
+        statements: DefaultDict[str, LineSet] = defaultdict(LineSet)
+        pc_functions: Dict[int, str] = {}
+        functions: Dict[str, FunctionInfo] = {}
+        branches: Dict[int, Branch] = {}
+        for pc, location in sorted(program.debug_info.instruction_locations.items()):
+            spans: List[LineSpan] = []
+            masks: DefaultDict[str, int] = defaultdict(int)
+            instruct = location.inst  # First instruction in the debug info.
+            while True:
+                file = instruct.input_file.filename  # Current analyzed file.
+                if measured(file):  # Auto generated and omitted files are discarded.
+                    spans.append((file, range(instruct.start_line, instruct.end_line + 1)))
+                    masks[file] |= span_bits(instruct.start_line, instruct.end_line)
+                if instruct.parent_location is None:  # Continue until the last parent location.
+                    break
+                instruct = instruct.parent_location[0]
+            if spans:
+                pc_lines[pc] = spans
+                pc_masks[pc] = list(masks.items())
+            for file, mask in masks.items():
+                statements[file].bits |= mask
+            if location.accessible_scopes:  # The innermost scope is the function of the pc.
+                function = str(location.accessible_scopes[-1])
+                pc_functions[pc] = function
+                info = functions.get(function)
+                if info is not None:
+                    info.instructions += 1
+                else:
+                    instruct = real_location(location.inst)
+                    functions[function] = FunctionInfo(
+                        start=pc,
+                        instructions=1,
+                        file=instruct.input_file.filename,
+                        line=instruct.start_line,
+                    )
+            branch = conditional_jump(program, pc)
+            if branch is not None and spans:
+                instruct = real_location(location.inst)
+                if not measured(instruct.input_file.filename):
+                    continue
+                branches[pc] = (
+                    branch.size,
+                    instruct.input_file.filename,
+                    (instruct.start_line, instruct.start_col),
+                )
+        # The wrappers are attributed with all the functions, then the omitted ones are dropped
+        # (the generated functions without a source location are kept as before).
+        pc_parents = parent_functions(
+            pc_functions, functions, program.debug_info.instruction_locations
+        )
+        functions = {
+            name: info
+            for name, info in functions.items()
+            if AUTOGEN in info.file or measured(info.file)
+        }
+        pc_functions = {pc: name for pc, name in pc_functions.items() if name in functions}
+        pc_parents = {pc: name for pc, name in pc_parents.items() if name in functions}
+        measured_pcs = sorted(pc_masks.keys() | pc_functions.keys() | pc_parents.keys())
+        pc_mask = bytearray(len(program.data))
+        for pc in measured_pcs:
+            if pc < len(pc_mask):
+                pc_mask[pc] = 1
+        return cls(
+            key=(program_key(program) if key is None else key, measured.key),
+            pc_lines=pc_lines,
+            pc_masks=pc_masks,
+            statements=dict(statements),
+            pc_functions=pc_functions,
+            functions=functions,
+            pc_parents=pc_parents,
+            branches=branches,
+            pc_mask=int.from_bytes(pc_mask, "little"),
+            measured_pcs=measured_pcs,
+            function_keys={name: (info.file, name) for name, info in functions.items()},
+        )
+
+
+def real_location(location: Location) -> Location:
+    """First location that isn't in an auto generated file, following the parent locations."""
+    while AUTOGEN in location.input_file.filename and location.parent_location is not None:
+        location = location.parent_location[0]
+    return location
+
+
+def parent_functions(
+    pc_functions: Dict[int, str],
+    functions: Dict[str, FunctionInfo],
+    instruction_locations: Dict[int, InstructionLocation],
+) -> Dict[int, str]:
+    """
+    Function the outermost location of each pc is in, when it's not the function of the pc. E.g.
+    the wrapper of an external function is generated from its declaration so its instructions are
+    attributed to the external function too.
+    """
+    # Functions generated by the compiler (e.g. wrappers), their code starts in an autogen file.
+    generated = {
+        function
+        for function, info in functions.items()
+        if AUTOGEN in instruction_locations[info.start].inst.input_file.filename
+    }
+    # First and last line of each function written in the sources, by file.
+    bounds: DefaultDict[str, Dict[str, Tuple[int, int]]] = defaultdict(dict)
+    for pc, location in instruction_locations.items():
+        function = pc_functions.get(pc)
+        inst = location.inst
+        if function is None or function in generated or inst.parent_location is not None:
+            continue
+        file_bounds = bounds[inst.input_file.filename]
+        first, last = file_bounds.get(function, (inst.start_line, inst.end_line))
+        file_bounds[function] = (min(first, inst.start_line), max(last, inst.end_line))
+    # (first line, function) of the functions of each file by short name, and the (first line,
+    # last line, function) of all of them, sorted to find the function of a line by bisection.
+    by_name: Dict[str, DefaultDict[str, List[Tuple[int, str]]]] = {}
+    by_first: Dict[str, List[Tuple[int, int, str]]] = {}
+    for file, file_bounds in bounds.items():
+        names = by_name[file] = defaultdict(list)
+        for candidate, (first, _) in file_bounds.items():
+            names[candidate.rsplit(".", 1)[-1]].append((first, candidate))
+        for named in names.values():
+            named.sort()
+        by_first[file] = sorted(
+            (first, last, candidate) for candidate, (first, last) in file_bounds.items()
+        )
+    parents: Dict[int, str] = {}
+    sources: Dict[str, Optional[List[str]]] = {}
+    for pc, location in instruction_locations.items():
+        function = pc_functions.get(pc)
+        if function not in generated and location.inst.parent_location is None:
+            continue
+        outermost = location.inst.topmost_location()
+        file = outermost.input_file.filename
+        line = outermost.start_line
+        name = location_text(outermost, sources)
+        # The name of a function in its declaration (e.g. for its wrapper), the closest one after
+        # the line, or the innermost function with the line in its body.
+        named = by_name.get(file, {}).get(name, []) if name is not None else []
+        position = bisect_left(named, (line,))
+        if position < len(named):
+            parent: Optional[str] = named[position][1]
+        else:
+            parent = innermost_function(by_first.get(file, []), line)
+        if parent is not None and parent != function:
+            parents[pc] = parent
+    return parents
+
+
+def innermost_function(bounds: List[Tuple[int, int, str]], line: int) -> Optional[str]:
+    """Smallest of the functions (sorted (first line, last line, function)) containing the line."""
+    best: Optional[Tuple[int, str]] = None
+    for position in range(bisect_right(bounds, (line, float("inf"))) - 1, -1, -1):
+        first, last, function = bounds[position]
+        if best is not None and first < line - best[0]:
+            break  # The functions starting before can't contain the line with fewer lines.
+        if last >= line and (best is None or (last - first, function) < best):
+            best = (last - first, function)
+    return None if best is None else best[1]
+
+
+def location_text(location: Location, sources: Dict[str, Optional[List[str]]]) -> Optional[str]:
+    """Code of a single line location, the lines of the files read are kept in sources."""
+    file = location.input_file.filename
+    if file not in sources:
+        content = location.input_file.content
+        if content is None:
+            try:
+                with open(file) as stream:
+                    content = stream.read()
+            except (OSError, TypeError):  # Not on disk (e.g. compiled from a string).
+                pass
+        sources[file] = None if content is None else content.splitlines()
+    lines = sources[file]
+    if lines is None or location.start_line != location.end_line:
+        return None
+    if location.start_line > len(lines):
+        return None
+    return lines[location.start_line - 1][location.start_col - 1 : location.end_col - 1]
+
+
+def conditional_jump(program: ProgramBase, pc: int) -> Optional[Instruction]:
+    """The instruction at pc if it's a conditional jump (jnz)."""
+    if pc >= len(program.data):
+        return None
+    imm = program.data[pc + 1] if pc + 1 < len(program.data) else None
+    try:
+        instruction = decode_instruction(program.data[pc], imm)
+    except Exception:  # Not an instruction.
+        return None
+    return instruction if instruction.pc_update is Instruction.PcUpdate.JNZ else None
+
+
+class ProgramIndexCache:
+    """LRU cache of the program indexes so each program is only indexed once per session."""
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size  # Nb of programs kept in the cache.
+        self.indexes: "OrderedDict[Hashable, ProgramIndex]" = OrderedDict()
+        self.lock = Lock()  # The vms of several threads can ask for an index at the same time.
+        # (program, filter key, index) of the last program asked for, the batches running the same
+        # program object don't hash its bytecode again for each vm.
+        self.last: Optional[Tuple[ProgramBase, Hashable, ProgramIndex]] = None
+        # program_key of the live program objects by id, so the programs the vms alternate between
+        # (e.g. an account and the contract it calls) are only hashed once.
+        self.keys: Dict[int, Tuple[Callable[[], Optional[ProgramBase]], Hashable]] = {}
+
+    def get(self, program: ProgramBase) -> Optional[ProgramIndex]:
+        """
+        Returns the index of the program for the include and omit patterns of the config, builds
+        it if it's not cached yet.
+        """
+        if program.debug_info is None:
+            return None
+        measured = file_filter(tuple(config.include), tuple(config.omit))
+        last = self.last
+        if last is not None and last[0] is program and last[1] == measured.key:
+            return last[2]
+        digest = self.program_key(program)
+        key = (digest, measured.key)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)  # Most recently used.
+                self.last = (program, measured.key, index)
+                return index
+            index = ProgramIndex.from_program(program, measured, digest)
+            self.indexes[key] = index
+            self.last = (program, measured.key, index)
+            while len(self.indexes) > self.max_size:  # Drop the least recently used programs.
+                self.indexes.popitem(last=False)
+            return index
+
+    def program_key(self, program: ProgramBase) -> Hashable:
+        """program_key of the program, computed once per program object."""
+        cached = self.keys.get(id(program))
+        if cached is not None and cached[0]() is program:
+            return cached[1]
+        key = program_key(program)
+        program_id = id(program)
+        try:
+            alive = ref(program, lambda _: self.keys.pop(program_id, None))
+        except TypeError:  # Not weakly referenceable, hashed again next time.
+            return key
+        self.keys[program_id] = (alive, key)
+        return key
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+            self.last = None
+
+
+index_cache = ProgramIndexCache()
@@ -0,0 +1,91 @@
+"""
+Coverage of plain cairo programs run outside of starknet, like cairo-run does, for the batches
+running a compiled program over many inputs (e.g. the provers):
+
+    runner = CoverageRunner.load("program.json", layout="small")
+    for program_input in inputs:
+        runner.run(program_input)  # The hints read it in program_input, like with cairo-run.
+    cairo_coverage.report_runs()
+
+The program is loaded and indexed once, all the runs of the batch share its index.
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from starkware.cairo.lang.compiler.program import Program
+from starkware.cairo.lang.vm.cairo_runner import CairoRunner
+from starkware.cairo.lang.vm.utils import RunResources
+from starkware.cairo.lang.vm.vm_exceptions import VmException
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.program_index import ProgramIndex, index_cache
+
+
+class CoverageRunner:
+    """Runs a compiled cairo program with coverage, once per input."""
+
+    def __init__(self, program: Program, layout: str = "plain", max_steps: Optional[int] = None):
+        if program.debug_info is None:
+            raise ValueError(
+                "The program has no debug info, compile it without --no_debug_info to measure its "
+                "coverage."
+            )
+        self.program = program
+        self.layout = layout
+        self.max_steps = max_steps  # Max nb of steps of a run, None for no limit.
+        index = index_cache.get(program)  # Built once for the whole batch.
+        assert index is not None
+        self.index: ProgramIndex = index
+        self.runs = 0  # Nb of runs, failed ones included.
+        self.steps = 0  # Nb of steps of all the runs.
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "CoverageRunner":
+        """Runner of the program compiled in the JSON file (cairo-compile --output)."""
+        with open(path) as stream:
+            return cls(Program.load(data=json.load(stream)), **kwargs)
+
+    def run(self, program_input: Optional[Dict[str, Any]] = None) -> CairoRunner:
+        """
+        Runs the main function of the program with the input, returns the runner (e.g. to read the
+        output). The coverage of the run is collected even if it fails.
+        """
+        runner = CairoRunner(program=self.program, layout=self.layout, proof_mode=False)
+        runner.initialize_segments()
+        end = runner.initialize_main_entrypoint()
+        with cairo_coverage.covering():
+            runner.initialize_vm(hint_locals={"program_input": program_input or {}})
+        self.runs += 1
+        try:
+            runner.run_until_pc(end, run_resources=RunResources(n_steps=self.max_steps))
+            runner.end_run()
+        finally:
+            self.steps += runner.vm.current_step
+        return runner
+
+    def run_batch(
+        self, inputs: Iterable[Optional[Dict[str, Any]]]
+    ) -> Iterator[Tuple[int, Optional[Exception]]]:
+        """
+        Runs the program once per input, yields (input nb, None) for each successful run and
+        (input nb, error) for each failed one so one bad input doesn't stop the batch.
+        """
+        for number, program_input in enumerate(inputs):
+            try:
+                self.run(program_input)
+            except (VmException, AssertionError) as exc:
+                yield number, exc
+                continue
+            yield number, None
+
+
+def read_inputs(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Inputs of the JSON files, the .jsonl files have one input per line."""
+    for path in paths:
+        with open(path) as stream:
+            if not path.endswith(".jsonl"):
+                yield json.load(stream)
+                continue
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
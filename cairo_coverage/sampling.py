@@ -0,0 +1,77 @@
+"""
+Sampling mode (config.sample_every = n): only one vm run out of n is recorded, the other runs use
+the regular instructions so the coverage costs about 1/n of the full collection, e.g. to leave it
+on during load tests. The covered lines are the ones of the recorded runs, a lower bound of what
+all the runs covered. In profiling mode the hits of the lines in all the runs are estimated from
+the hits of the recorded runs, with the standard error of the estimate.
+"""
+from dataclasses import dataclass
+from math import sqrt
+from typing import Dict, List, Tuple
+
+from cairo_coverage.session import CoverageSession
+
+Z_95 = 1.96  # The bounds are a 95% confidence interval.
+
+
+@dataclass
+class HitEstimate:
+    """Estimated nb of runs of a line in all the vm runs, from the recorded runs."""
+
+    sampled: int  # Hits in the recorded runs.
+    hits: float  # Estimated hits in all the runs.
+    error: float  # Standard error of the estimate.
+
+    @property
+    def low(self) -> float:
+        """Lower bound, at least the hits seen."""
+        return max(self.hits - Z_95 * self.error, self.sampled)
+
+    @property
+    def high(self) -> float:
+        return self.hits + Z_95 * self.error
+
+
+def estimate(sampled: int, squares: int, nb_sampled: int, nb_runs: int) -> HitEstimate:
+    """
+    Estimate of the total of a line from its hits (and sum of the squares of the hits of each
+    run) in nb_sampled runs out of nb_runs.
+    """
+    mean = sampled / nb_sampled
+    variance = (squares - sampled * mean) / (nb_sampled - 1) if nb_sampled > 1 else 0.0
+    # Finite population correction, no error when all the runs are recorded.
+    error = nb_runs * sqrt(max(variance, 0.0) * (1 - nb_sampled / nb_runs) / nb_sampled)
+    return HitEstimate(sampled=sampled, hits=nb_runs * mean, error=error)
+
+
+def estimate_hits(session: CoverageSession) -> Dict[str, Dict[int, HitEstimate]]:
+    """Estimated hits of each line of each file, empty if no run was sampled out."""
+    nb_runs, nb_sampled = session.runs["all"], session.runs["sampled"]
+    if not nb_sampled or nb_sampled == nb_runs:
+        return {}
+    estimates = {}
+    for file, hits in session.line_hits.items():
+        squares = session.line_hits_squares.get(file, {})
+        estimates[file] = {
+            line: estimate(count, squares.get(line, 0), nb_sampled, nb_runs)
+            for line, count in hits.items()
+        }
+    return estimates
+
+
+def print_estimates(estimates: Dict[str, Dict[int, HitEstimate]], top: int):
+    """Print the lines with the most estimated hits and their 95% bounds."""
+    lines: List[Tuple[str, int, HitEstimate]] = sorted(
+        (
+            (file, line, hit_estimate)
+            for file, file_estimates in estimates.items()
+            for line, hit_estimate in file_estimates.items()
+        ),
+        key=lambda item: (-item[2].hits, item[0], item[1]),
+    )[:top]
+    if not lines:
+        return
+    print(f"\nEstimated hits (95% bounds)\n{'Hits':>12}  {'Bounds':>17}  {'Line':>6}  File")
+    for file, line, hit_estimate in lines:
+        bounds = f"{hit_estimate.low:.0f}-{hit_estimate.high:.0f}"
+        print(f"{hit_estimate.hits:>12.0f}  {bounds:>17}  {line:>6}  {file}")
@@ -0,0 +1,226 @@
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from multiprocessing import get_all_start_methods, get_context
+from operator import add
+from threading import Lock
+from typing import DefaultDict, Dict, Hashable, List, Optional, Set, Tuple
+
+from cairo_coverage.data import CoverageData, merge_function
+from cairo_coverage.program_index import ProgramIndex
+
+# Pcs of a program and the pcs run in it, to map to lines (see CoverageSession.resolve).
+Job = Tuple[ProgramIndex, Optional[bytes], Optional[array]]
+# Min nb of pcs of the pending programs to map them in processes, under it starting the processes
+# costs more than mapping the pcs.
+PARALLEL_MIN_PCS = 200_000
+# Jobs of the resolve running, the forked processes of its pool inherit them so only the positions
+# of the jobs are sent to the processes and not the indexes.
+forked_jobs: List[Job] = []
+
+
+@dataclass
+class CoverageSession(CoverageData):
+    """
+    Coverage collected by the vms created in a context (see cairo_coverage.session). The vms merge
+    the coverage of each run at once under the lock so the vms of other threads only wait for the
+    merge and not for the whole collection.
+    """
+
+    merged_programs: Set[Hashable] = field(default_factory=set)  # Programs already merged.
+    pc_hits: Dict[Hashable, array] = field(default_factory=dict)  # Runs of each pc (profiling).
+    # Pcs run by the vms of each program that aren't mapped to lines yet (see config.report_jobs),
+    # a byte per pc or the hits of each pc in profiling mode.
+    pending_pcs: Dict[Hashable, Tuple[ProgramIndex, bytes]] = field(default_factory=dict)
+    pending_hits: Dict[Hashable, Tuple[ProgramIndex, array]] = field(default_factory=dict)
+    # Nb of vm runs ("all") and of recorded runs ("sampled") in sampling mode, and the sum of the
+    # squares of the hits of each line in each recorded run to estimate the error of the hits.
+    runs: Counter = field(default_factory=Counter)
+    line_hits_squares: DefaultDict[str, Counter] = field(
+        default_factory=lambda: defaultdict(Counter)
+    )
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def add_run(
+        self,
+        index: ProgramIndex,
+        run: CoverageData,
+        branches: bool = False,
+        pc_hits: Optional[array] = None,
+        context: Optional[str] = None,
+        squares: bool = False,
+    ):
+        """
+        Adds the coverage of a run of the program, the statements (and the conditional jumps if
+        branches) of the program are added on its first run. The covered lines are also recorded
+        for the context if given, and the squares of the line hits of the run if squares.
+        """
+        with self.lock:
+            self.merge_program(index, branches)
+            self.update(run)
+            if pc_hits is not None:
+                self.add_pc_hits(index.key, pc_hits)
+            if context is not None:
+                self.add_context(context, run.covered)
+            if squares:
+                for file, hits in run.line_hits.items():
+                    file_squares = self.line_hits_squares[file]
+                    for line, count in hits.items():
+                        file_squares[line] += count * count
+
+    def count_run(self, sampled: bool):
+        """Counts a vm run (sampling mode)."""
+        with self.lock:
+            self.runs["all"] += 1
+            self.runs["sampled"] += sampled
+
+    def add_pending(
+        self,
+        index: ProgramIndex,
+        run: CoverageData,
+        branches: bool = False,
+        touched_pcs: Optional[bytes] = None,
+        pc_hits: Optional[array] = None,
+    ):
+        """
+        Like add_run but the pcs of the run (one byte per pc or the hits of each pc) are only
+        merged with the ones of the previous runs of the program, resolve maps them to lines.
+        """
+        with self.lock:
+            self.merge_program(index, branches)
+            self.update(run)
+            self.add_pending_pcs(index, touched_pcs, pc_hits)
+
+    def merge_program(self, index: ProgramIndex, branches: bool):
+        """Adds the statements of the program on its first run, they don't change between runs."""
+        if index.key in self.merged_programs:
+            return
+        self.merged_programs.add(index.key)
+        for file, lines in index.statements.items():
+            self.statements[file].update(lines)
+        for function, info in index.functions.items():
+            location = (info.file, info.line, info.instructions)
+            merge_function(self.functions, index.function_keys[function], location)
+        if branches:
+            for file, locations in index.branch_locations().items():
+                self.branches[file].update(locations)
+
+    def add_pending_pcs(
+        self, index: ProgramIndex, touched_pcs: Optional[bytes], pc_hits: Optional[array]
+    ):
+        if touched_pcs is not None:
+            current = self.pending_pcs.get(index.key)
+            if current is not None:
+                touched_pcs = or_bytes(current[1], touched_pcs)
+            self.pending_pcs[index.key] = (index, touched_pcs)
+        if pc_hits is not None:
+            current_hits = self.pending_hits.get(index.key)
+            if current_hits is not None:
+                pc_hits = array("Q", map(add, current_hits[1], pc_hits))
+            self.pending_hits[index.key] = (index, pc_hits)
+
+    def resolve(self, jobs: int = 1):
+        """
+        Maps the pending pcs of each program to lines, in a pool of jobs processes when there are
+        several programs with at least PARALLEL_MIN_PCS pcs and jobs > 1, and merges the lines of
+        all the programs. The pool forks the processes, without fork the pcs are mapped here.
+        """
+        with self.lock:
+            pending: List[Job] = [
+                (index, touched_pcs, None) for index, touched_pcs in self.pending_pcs.values()
+            ] + [(index, None, pc_hits) for index, pc_hits in self.pending_hits.values()]
+            self.pending_pcs.clear()
+            self.pending_hits.clear()
+        if not pending:
+            return
+        pcs = sum(
+            len(touched_pcs if touched_pcs is not None else pc_hits or ())
+            for _, touched_pcs, pc_hits in pending
+        )
+        if (
+            jobs > 1
+            and len(pending) > 1
+            and pcs >= PARALLEL_MIN_PCS
+            and "fork" in get_all_start_methods()
+        ):
+            runs = resolve_forked(pending, jobs)
+        else:
+            runs = [resolve_program(*job) for job in pending]
+        with self.lock:
+            for (index, _, pc_hits), run in zip(pending, runs):
+                self.update(run)
+                if pc_hits is not None:
+                    self.add_pc_hits(index.key, pc_hits)
+
+    def add_pc_hits(self, key: Hashable, pc_hits: array):
+        current = self.pc_hits.get(key)
+        self.pc_hits[key] = pc_hits if current is None else array("Q", map(add, current, pc_hits))
+
+    def merge(self, other: "CoverageSession"):
+        """Adds the coverage of another session (e.g. a finished child session)."""
+        with self.lock:
+            self.update(other)
+            self.merged_programs.update(other.merged_programs)
+            self.runs.update(other.runs)
+            for file, squares in other.line_hits_squares.items():
+                self.line_hits_squares[file].update(squares)
+            for key, pc_hits in other.pc_hits.items():
+                self.add_pc_hits(key, pc_hits)
+            for index, touched_pcs in other.pending_pcs.values():
+                self.add_pending_pcs(index, touched_pcs, None)
+            for index, pc_hits in other.pending_hits.values():
+                self.add_pending_pcs(index, None, pc_hits)
+
+    def clear(self):
+        """Drops all the collected coverage."""
+        with self.lock:
+            for data_field in fields(self):
+                if data_field.name != "lock":
+                    getattr(self, data_field.name).clear()
+
+
+def or_bytes(first: bytes, second: bytes) -> bytes:
+    """Bytes set in either of the pcs bitmaps (same size)."""
+    size = len(first)
+    return (int.from_bytes(first, "little") | int.from_bytes(second, "little")).to_bytes(
+        size, "little"
+    )
+
+
+def resolve_program(
+    index: ProgramIndex, touched_pcs: Optional[bytes], pc_hits: Optional[array]
+) -> CoverageData:
+    """Coverage of the pcs run in the program, the job of a report process."""
+    run = CoverageData()
+    if touched_pcs is not None:
+        index.cover(touched_pcs, run)
+    if pc_hits is not None:
+        index.count(pc_hits, run)
+    return run
+
+
+def resolve_forked(pending: List[Job], jobs: int) -> List[CoverageData]:
+    """Coverage of each job, mapped by a pool of forked processes."""
+    global forked_jobs
+    forked_jobs = pending
+    try:
+        workers = min(jobs, len(pending))
+        chunksize = -(-len(pending) // workers)  # One batch of programs per process.
+        with ProcessPoolExecutor(workers, mp_context=get_context("fork")) as pool:
+            return list(pool.map(resolve_forked_job, range(len(pending)), chunksize=chunksize))
+    finally:
+        forked_jobs = []
+
+
+def resolve_forked_job(position: int) -> CoverageData:
+    return resolve_program(*forked_jobs[position])
+
+
+root_session = CoverageSession()  # Session of the code not running in a cairo_coverage.session.
+current_session: ContextVar[CoverageSession] = ContextVar(
+    "cairo_coverage_session", default=root_session
+)
+# Label (e.g. the test) the coverage of the vms is recorded for, see cairo_coverage.context.
+current_context: ContextVar[Optional[str]] = ContextVar("cairo_coverage_context", default=None)
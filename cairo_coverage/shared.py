@@ -0,0 +1,159 @@
+"""
+Pcs buffers shared by the processes through memory mapped files, for the harnesses forking
+workers that run the same programs. The vms of every process write the pcs they run straight in
+the files of the directory so nothing is sent back or merged when a worker exits, the parent reads
+the files to report the coverage:
+
+    cairo_coverage.configure(shared_hits="/tmp/cairo_hits")  # Before forking the workers.
+    ...
+    cairo_coverage.load_shared()  # In the parent once the workers are done.
+    cairo_coverage.report_runs()
+
+Each program has a file with a byte per pc set to 1 once a process ran it (the writes of the
+processes can't conflict), and the index of the program to map the pcs to lines. The counters of
+the profiling and branch modes aren't shared, each process has its own file that the parent sums,
+so no increment is lost.
+"""
+import mmap
+import os
+import pickle
+from array import array
+from glob import glob
+from hashlib import sha256
+from operator import add
+from typing import Dict, List, Tuple
+
+from cairo_coverage.data import CoverageData
+from cairo_coverage.program_index import ProgramIndex
+
+PCS_SUFFIX = ".pcs"  # Byte per pc, shared by the processes.
+HITS_SUFFIX = ".hits"  # Hits of each pc, one file per process (profiling mode).
+JUMPS_SUFFIX = ".jumps"  # Not taken and taken counters of each pc, one file per process.
+INDEX_SUFFIX = ".index"  # Pickled index of the program.
+
+
+def program_name(index: ProgramIndex) -> str:
+    """Name of the files of the program, the same in all the processes."""
+    return sha256(repr(index.key).encode()).hexdigest()[:32]
+
+
+def map_file(path: str, size: int) -> mmap.mmap:
+    """Maps the file, created with size zero bytes if it doesn't exist."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != size:  # The processes creating it at once all set this size.
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+
+
+def read_counters(path: str) -> array:
+    counters = array("Q")
+    with open(path, "rb") as stream:
+        counters.frombytes(stream.read())
+    return counters
+
+
+def sum_counters(paths: List[str]) -> array:
+    """Sum of the counters of the files of the processes."""
+    total = read_counters(paths[0])
+    for path in paths[1:]:
+        total = array("Q", map(add, total, read_counters(path)))
+    return total
+
+
+class SharedHits:
+    """Directory of the memory mapped pcs buffers of the programs."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Buffers mapped by this process, (pid, program, suffix) -> map. The pid is in the key so a
+        # forked process maps its own counters files instead of the ones of its parent.
+        self.maps: Dict[Tuple[int, str, str], mmap.mmap] = {}
+
+    def path(self, name: str, suffix: str, pid: bool = False) -> str:
+        process = f".{os.getpid()}" if pid else ""
+        return os.path.join(self.directory, f"{name}{process}{suffix}")
+
+    def buffer(self, index: ProgramIndex, suffix: str, size: int) -> mmap.mmap:
+        name = program_name(index)
+        key = (os.getpid(), name, suffix)
+        buffer = self.maps.get(key)
+        if buffer is None:
+            self.save_index(name, index)
+            buffer = self.maps[key] = map_file(self.path(name, suffix, suffix != PCS_SUFFIX), size)
+        return buffer
+
+    def touched_pcs(self, index: ProgramIndex, size: int) -> mmap.mmap:
+        """Byte per pc of the program, shared by all the processes."""
+        return self.buffer(index, PCS_SUFFIX, size)
+
+    def pc_hits(self, index: ProgramIndex, size: int) -> memoryview:
+        """Hits of each pc of the program in this process (profiling mode)."""
+        return memoryview(self.buffer(index, HITS_SUFFIX, 8 * size)).cast("Q")
+
+    def jump_hits(self, index: ProgramIndex, size: int) -> memoryview:
+        """Not taken and taken counters of each pc of the program in this process (branch mode)."""
+        return memoryview(self.buffer(index, JUMPS_SUFFIX, 16 * size)).cast("Q")
+
+    def save_index(self, name: str, index: ProgramIndex):
+        path = self.path(name, INDEX_SUFFIX)
+        if os.path.exists(path):
+            return
+        temporary = self.path(name, f"{INDEX_SUFFIX}.tmp", pid=True)
+        with open(temporary, "wb") as stream:
+            pickle.dump(index, stream)
+        os.replace(temporary, path)  # The other processes see the whole index or nothing.
+
+    def load(self, data: CoverageData, branches: bool = False) -> int:
+        """
+        Adds the coverage of the buffers of all the processes to data (the statements and
+        conditional jumps if branches of the programs included), returns the nb of programs.
+        """
+        paths = glob(os.path.join(self.directory, f"*{INDEX_SUFFIX}"))
+        for path in paths:
+            name = os.path.basename(path)[: -len(INDEX_SUFFIX)]
+            with open(path, "rb") as stream:
+                index: ProgramIndex = pickle.load(stream)
+            run = CoverageData()
+            for file, lines in index.statements.items():
+                run.statements[file].update(lines)
+            for function, info in index.functions.items():
+                run.functions[index.function_keys[function]] = (
+                    info.file,
+                    info.line,
+                    info.instructions,
+                )
+            if branches:
+                for file, locations in index.branch_locations().items():
+                    run.branches[file].update(locations)
+            pcs_path = self.path(name, PCS_SUFFIX)
+            if os.path.exists(pcs_path):
+                with open(pcs_path, "rb") as stream:
+                    index.cover(stream.read(), run)
+            hits_paths = glob(os.path.join(self.directory, f"{name}.*{HITS_SUFFIX}"))
+            if hits_paths:
+                index.count(sum_counters(hits_paths), run)
+            jumps_paths = glob(os.path.join(self.directory, f"{name}.*{JUMPS_SUFFIX}"))
+            if jumps_paths:
+                index.cover_jumps(sum_counters(jumps_paths), run)
+            data.update(run)
+        return len(paths)
+
+    def clear(self):
+        """Removes the buffers, e.g. before starting new workers."""
+        self.maps.clear()  # Unmapped once the vms using them are gone.
+        for path in glob(os.path.join(self.directory, "*")):
+            os.unlink(path)
+
+
+shared_directories: Dict[str, SharedHits] = {}  # Buffers of each directory used by the vms.
+
+
+def shared_hits(directory: str) -> SharedHits:
+    buffers = shared_directories.get(directory)
+    if buffers is None:
+        buffers = shared_directories[directory] = SharedHits(directory)
+    return buffers
@@ -0,0 +1,106 @@
+"""
+Coverage store keyed by the content hash of the cairo files: the coverage of a file is reused as
+long as its source doesn't change, so a run of the tests impacted by a change still reports the
+coverage of the whole project.
+"""
+import os
+from glob import glob
+from hashlib import sha256
+from typing import Dict, List, Optional
+
+from cairo_coverage.data import CoverageData, read_data, write_data
+
+ENTRY_SUFFIX = ".cov"
+
+
+def source_hash(path: str) -> Optional[str]:
+    """Hash of the content of the file, None if it can't be read."""
+    try:
+        with open(path, "rb") as stream:
+            return sha256(stream.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def file_data(data: CoverageData, file: str) -> CoverageData:
+    """Coverage of one cairo file (its lines, jumps, functions and contexts)."""
+    single = CoverageData()
+    single.statements[file].update(data.statements.get(file, ()))
+    if file in data.covered:
+        single.covered[file].update(data.covered[file])
+    if file in data.line_hits:
+        single.line_hits[file].update(data.line_hits[file])
+    if file in data.branches:
+        single.branches[file].update(data.branches[file])
+        single.branch_hits[file].update(data.branch_hits.get(file, {}))
+    for function, location in data.functions.items():
+        if location[0] == file:
+            single.functions[function] = location
+            if function in data.function_covered:
+                single.function_covered[function].update(data.function_covered[function])
+            for counter, counts in (
+                (single.function_hits, data.function_hits),
+                (single.inlined_hits, data.inlined_hits),
+            ):
+                if counts[function]:
+                    counter[function] = counts[function]
+    if file in data.line_contexts:
+        single.contexts.update(data.contexts)
+        single.line_contexts[file].update(data.line_contexts[file])
+    return single
+
+
+class CoverageStore:
+    """Directory with one data file per cairo file content, named after the hash of the content."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def entry_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}{ENTRY_SUFFIX}")
+
+    def save(self, data: CoverageData) -> List[str]:
+        """Adds the coverage of each file to the entry of its current content, returns the files."""
+        os.makedirs(self.directory, exist_ok=True)
+        saved = []
+        for file in data.statements.keys() | data.covered.keys():
+            content_hash = source_hash(file)
+            if content_hash is None:  # Not on disk, e.g. compiled from a string.
+                continue
+            entry = file_data(data, file)
+            path = self.entry_path(content_hash)
+            if os.path.exists(path):  # Also keep what the previous runs covered.
+                entry.update(file_data(read_data(path), file))
+            write_data(entry, path)
+            saved.append(file)
+        return saved
+
+    def entries(self) -> Dict[str, str]:
+        """Content hash of each entry of the store."""
+        return {
+            os.path.basename(path)[: -len(ENTRY_SUFFIX)]: path
+            for path in glob(os.path.join(self.directory, f"*{ENTRY_SUFFIX}"))
+        }
+
+    def load(self, data: CoverageData) -> List[str]:
+        """
+        Merges the stored coverage of the files that didn't change since it was saved in data,
+        returns these files.
+        """
+        reused = []
+        for content_hash, path in self.entries().items():
+            entry = read_data(path)
+            for file in list(entry.statements):
+                if source_hash(file) == content_hash:
+                    data.update(file_data(entry, file))
+                    reused.append(file)
+        return sorted(reused)
+
+    def prune(self) -> int:
+        """Removes the entries of the contents no file has anymore, returns their number."""
+        removed = 0
+        for content_hash, path in self.entries().items():
+            if all(source_hash(file) != content_hash for file in read_data(path).statements):
+                os.unlink(path)
+                removed += 1
+        return removed
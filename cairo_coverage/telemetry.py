@@ -0,0 +1,84 @@
+"""
+Telemetry of the coverage collection (config.telemetry), to see what the coverage costs: the time
+spent in the run_instruction of the coverage vms and in the base vm instructions it wraps, the
+cover_file duration of each vm, the nb of pcs mapped to lines and the vms run by each program.
+The vms time their own steps and add them here once at the end of their run. Timing each step
+costs too, the overhead is only meant to be compared between runs with the telemetry on.
+"""
+from collections import Counter
+from dataclasses import dataclass, field, fields
+from threading import Lock
+from typing import Any, Dict
+
+from cairo_coverage.program_index import ProgramIndex
+from cairo_coverage.shared import program_name
+
+
+def program_label(index: ProgramIndex) -> str:
+    """
+    Name of the program in the stats: its first file, the nb of files and the start of its key
+    digest, the same in all the processes.
+    """
+    files = sorted(index.statements)
+    first = files[0] if files else "<no file>"
+    return f"{first} ({len(files)} files, {program_name(index)[:8]})"
+
+
+@dataclass
+class Telemetry:
+    """Collection stats of the vms of the process."""
+
+    vms: Counter = field(default_factory=Counter)  # Nb of vms of each program.
+    steps: int = 0  # Steps of the vms.
+    instruction_s: float = 0.0  # Time in run_instruction, the base vm instructions included.
+    base_instruction_s: float = 0.0  # Time in the base vm instructions.
+    cover_file_s: float = 0.0  # Time in cover_file.
+    cover_file_max_s: float = 0.0  # Longest cover_file of a vm.
+    cover_file_calls: int = 0
+    pcs_resolved: int = 0  # Nb of pcs run handed to the pc to lines mapping (once per vm).
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def add_vm(
+        self,
+        index: ProgramIndex,
+        steps: int,
+        instruction_s: float,
+        base_instruction_s: float,
+        cover_file_s: float,
+        pcs: int,
+    ):
+        """Adds the stats of the run of a vm."""
+        with self.lock:
+            self.vms[program_label(index)] += 1
+            self.steps += steps
+            self.instruction_s += instruction_s
+            self.base_instruction_s += base_instruction_s
+            self.cover_file_s += cover_file_s
+            self.cover_file_max_s = max(self.cover_file_max_s, cover_file_s)
+            self.cover_file_calls += 1
+            self.pcs_resolved += pcs
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The stats and the values derived from them, JSON serializable."""
+        with self.lock:
+            stats = {
+                stat.name: getattr(self, stat.name) for stat in fields(self) if stat.name != "lock"
+            }
+            stats["vms"] = dict(self.vms.most_common())
+        base_s = stats["base_instruction_s"]
+        stats["wrapper_overhead_s"] = stats["instruction_s"] - base_s
+        overhead_s = stats["wrapper_overhead_s"]
+        stats["wrapper_overhead_pct"] = 100 * overhead_s / base_s if base_s else 0.0
+        calls = stats["cover_file_calls"]
+        stats["cover_file_mean_s"] = stats["cover_file_s"] / calls if calls else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.vms.clear()
+            self.steps = self.cover_file_calls = self.pcs_resolved = 0
+            self.instruction_s = self.base_instruction_s = 0.0
+            self.cover_file_s = self.cover_file_max_s = 0.0
+
+
+telemetry = Telemetry()  # Stats of all the vms of the process.
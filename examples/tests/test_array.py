@@ -7,6 +7,8 @@ from starkware.starknet.testing.starknet import Starknet
 
 from cairo_coverage import cairo_coverage
 
+cairo_coverage.enable()
+
 CONTRACT_FILE = path.join("examples", "contracts", "array.cairo")
 PRODUCT_ARRAY = [(x, x + 1) for x in range(1, 6, 2)]
 
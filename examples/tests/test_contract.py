@@ -10,6 +10,8 @@ from starkware.starkware_utils.error_handling import StarkException
 
 from cairo_coverage import cairo_coverage
 
+cairo_coverage.enable()
+
 
 @dataclass
 class Uint256:
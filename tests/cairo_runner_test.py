@@ -0,0 +1,204 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.cairo.lang.vm.vm_core import VirtualMachine
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.config import Collection
+
+
+@pytest.fixture(autouse=True)
+def coverage():
+    with cairo_coverage.covering():
+        yield
+
+
+def test_hit_counts(loop_program):
+    cairo_coverage.reset()
+    cairo_coverage.configure(count_hits=True)
+    try:
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 5)
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 5)
+        assert cairo_coverage.hottest_functions(1)[0][0] == "__main__.loop"
+        (coverage_file,) = cairo_coverage.report_runs(print_summary=False)
+    finally:
+        cairo_coverage.configure(count_hits=False)
+    # Hits are the nb of instructions run for each line over the 2 runs.
+    assert coverage_file.hits[3] == 2 * 6  # jnz, run n + 1 times.
+    assert coverage_file.hits[4] == 2 * 2  # ap += 1 and ret, run once.
+    assert coverage_file.hits[6] == 2 * 2 * 5  # Argument push and call, run n times.
+    assert cairo_coverage.hottest_lines([coverage_file], 1)[0][:2] == ("loop.cairo", 6)
+
+
+def test_trace_collection(loop_program):
+    reports = {}
+    for mode in (Collection.WRAP, Collection.TRACE):
+        cairo_coverage.reset()
+        cairo_coverage.configure(collection=mode, count_hits=True)
+        try:
+            CairoFunctionRunner(loop_program, layout="plain").run("loop", 3)
+            (reports[mode],) = cairo_coverage.report_runs(print_summary=False)
+        finally:
+            cairo_coverage.configure(collection=Collection.WRAP, count_hits=False)
+    assert reports[Collection.TRACE].covered == reports[Collection.WRAP].covered
+    assert reports[Collection.TRACE].hits == reports[Collection.WRAP].hits
+
+
+def test_coverage_scope(loop_program):
+    with cairo_coverage.covering():  # Nested in the scope of the fixture.
+        pass
+    runner = CairoFunctionRunner(loop_program, layout="plain")
+    runner.run("loop", 1)
+    assert isinstance(runner.vm, cairo_coverage.OverrideVm)
+    cairo_coverage.disable()
+    try:
+        runner = CairoFunctionRunner(loop_program, layout="plain")
+        runner.run("loop", 1)
+        assert type(runner.vm) is VirtualMachine
+    finally:
+        cairo_coverage.enable()
+
+
+@pytest.mark.parametrize("mode", [Collection.WRAP, Collection.TRACE])
+def test_branch_coverage(mode, loop_program):
+    cairo_coverage.reset()
+    cairo_coverage.configure(collection=mode, branches=True)
+    try:
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 0)
+        (partial,) = cairo_coverage.report_runs(print_summary=False)
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 2)
+        (full,) = cairo_coverage.report_runs(print_summary=False)
+    finally:
+        cairo_coverage.configure(collection=Collection.WRAP, branches=False)
+    assert partial.nb_branches == 2
+    assert partial.nb_branches_covered == 1
+    assert list(partial.partial_branches) == [3]
+    assert full.nb_branches_covered == 2
+    assert sorted(full.branch_hits.values()) == [1, 2]  # n == 0 once, n != 0 twice.
+    assert not full.partial_branches
+
+
+def test_function_coverage(loop_source):
+    program = compile_cairo(
+        [(loop_source + "\nfunc unused() {\n    return ();\n}\n", "loop.cairo")],
+        prime=DEFAULT_PRIME,
+        debug_info=True,
+    )
+    cairo_coverage.reset()
+    cairo_coverage.configure(count_hits=True)
+    try:
+        CairoFunctionRunner(program, layout="plain").run("loop", 0)
+        (coverage_file,) = cairo_coverage.report_runs(print_summary=False)
+    finally:
+        cairo_coverage.configure(count_hits=False)
+    loop, unused = coverage_file.functions
+    assert (loop.name, loop.line, unused.name) == ("__main__.loop", 3, "__main__.unused")
+    assert loop.entered and not unused.entered
+    assert 0 < loop.nb_covered < loop.instructions  # The recursive call didn't run.
+    assert loop.steps == 3  # jnz, res=0 and ret.
+    assert unused.steps == 0 and unused.pct_covered == 0
+
+
+def test_same_function_name_in_two_files(loop_source):
+    programs = [
+        compile_cairo([(loop_source, "a.cairo")], prime=DEFAULT_PRIME, debug_info=True),
+        compile_cairo([("// B.\n" + loop_source, "b.cairo")], prime=DEFAULT_PRIME, debug_info=True),
+    ]
+    cairo_coverage.reset()
+    cairo_coverage.configure(count_hits=True)
+    try:
+        CairoFunctionRunner(programs[0], layout="plain").run("loop", 0)
+        CairoFunctionRunner(programs[1], layout="plain").run("loop", 2)
+        a, b = cairo_coverage.report_runs(print_summary=False)
+    finally:
+        cairo_coverage.configure(count_hits=False)
+    (a_loop,) = a.functions  # Both named __main__.loop, each keeps its own coverage.
+    (b_loop,) = b.functions
+    assert (a_loop.line, a_loop.steps) == (3, 3)
+    assert b_loop.line == 4 and b_loop.steps > a_loop.steps
+
+
+@pytest.mark.parametrize("count_hits", [False, True])
+def test_report_jobs(count_hits, monkeypatch, loop_program, loop_source):
+    # Map the small programs in the pool too.
+    monkeypatch.setattr("cairo_coverage.session.PARALLEL_MIN_PCS", 0)
+    programs = [
+        loop_program,
+        compile_cairo(
+            [(loop_source.replace("res + 1", "res + 2"), "loop_2.cairo")],
+            prime=DEFAULT_PRIME,
+            debug_info=True,
+        ),
+    ]
+    reports = {}
+    for jobs in (0, 1, 2):
+        cairo_coverage.reset()
+        cairo_coverage.configure(report_jobs=jobs, count_hits=count_hits)
+        try:
+            for iterations in (0, 2):
+                for program in programs:
+                    CairoFunctionRunner(program, layout="plain").run("loop", iterations)
+            assert bool(cairo_coverage.current_session.get().pending_pcs) == (
+                jobs > 0 and not count_hits
+            )
+            reports[jobs] = cairo_coverage.report_runs(print_summary=False)
+        finally:
+            cairo_coverage.configure(report_jobs=0, count_hits=False)
+    for jobs in (1, 2):  # The pcs mapped by the report give the same report.
+        assert [file.name for file in reports[jobs]] == ["loop.cairo", "loop_2.cairo"]
+        for file, expected in zip(reports[jobs], reports[0]):
+            assert file.covered == expected.covered
+            assert file.hits == expected.hits
+            assert file.functions == expected.functions
+
+
+def test_concurrent_sessions(loop_program):
+
+    async def run_test(n: int):
+        with cairo_coverage.session(merge=False):
+            await asyncio.sleep(0)  # Lets the other tasks start their session.
+            CairoFunctionRunner(loop_program, layout="plain").run("loop", n)
+            await asyncio.sleep(0)
+            return cairo_coverage.report_runs(print_summary=False)
+
+    async def run_tests():
+        return await asyncio.gather(run_test(0), run_test(2))
+
+    cairo_coverage.reset()
+    with cairo_coverage.session() as outer:
+        (base_case,), (recursion,) = asyncio.run(run_tests())
+        assert not outer.covered  # The coverage of the tasks isn't merged.
+    assert 6 not in base_case.covered
+    assert 6 in recursion.covered
+
+
+def test_threads_merge_in_their_session(loop_program):
+    cairo_coverage.reset()
+
+    def run_test(n: int):
+        with cairo_coverage.session():  # Merged in the session of the thread, the root session.
+            CairoFunctionRunner(loop_program, layout="plain").run("loop", n)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(run_test, [0, 1, 2, 3] * 4))
+    (coverage_file,) = cairo_coverage.report_runs(print_summary=False)
+    assert coverage_file.covered == coverage_file.statements
+
+
+def test_contexts(loop_program):
+    cairo_coverage.reset()
+    with cairo_coverage.context("base_case"):
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 0)
+    with cairo_coverage.context("recursion"):
+        CairoFunctionRunner(loop_program, layout="plain").run("loop", 1)
+    data = cairo_coverage.collected_data()
+    assert data.contexts_of("loop.cairo", 3) == ["base_case", "recursion"]
+    assert data.contexts_of("loop.cairo", 6) == ["recursion"]
+    assert data.lines_only_covered_by("base_case") == {}
+    (coverage_file,) = cairo_coverage.report_runs(print_summary=False)
+    assert coverage_file.contexts[7] == ["recursion"]
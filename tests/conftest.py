@@ -0,0 +1,26 @@
+import pytest
+
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+
+LOOP_SOURCE = """
+func loop(n: felt) -> (res: felt) {
+    if (n == 0) {
+        return (res=0);
+    }
+    let (res) = loop(n - 1);
+    return (res=res + 1);
+}
+"""
+
+
+@pytest.fixture(scope="session")
+def loop_source() -> str:
+    """Cairo source of loop(n), recursing n times, the base of the programs of the tests."""
+    return LOOP_SOURCE
+
+
+@pytest.fixture(scope="session")
+def loop_program(loop_source):
+    """The loop compiled with its debug info as loop.cairo."""
+    return compile_cairo([(loop_source, "loop.cairo")], prime=DEFAULT_PRIME, debug_info=True)
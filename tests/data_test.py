@@ -0,0 +1,86 @@
+from collections import Counter
+
+import pytest
+
+from cairo_coverage.__main__ import main
+from cairo_coverage.data import (
+    CoverageData,
+    CoverageDataError,
+    combine,
+    read_data,
+    write_data,
+)
+from cairo_coverage.lines import LineSet
+
+MAIN = ("contract.cairo", "__main__.main")  # Key of the function.
+
+
+def make_data(covered, hits=None) -> CoverageData:
+    data = CoverageData()
+    data.statements["contract.cairo"].update(range(1, 20))
+    data.covered["contract.cairo"].update(covered)
+    data.line_hits["contract.cairo"].update(hits or {})
+    data.function_hits[MAIN] += sum((hits or {}).values())
+    data.branches["contract.cairo"].add((3, 5))
+    data.branch_hits["contract.cairo"][((3, 5), True)] += len(covered)
+    data.functions[MAIN] = ("contract.cairo", 1, 10)
+    data.function_covered[MAIN].update(covered)
+    data.inlined_hits[MAIN] += len(covered)
+    return data
+
+
+def test_write_and_read(tmp_path):
+    data_file = str(tmp_path / ".cairo_coverage")
+    write_data(make_data({2, 3}, {2: 5, 3: 1}), data_file)
+    data = read_data(data_file)
+    assert data.statements["contract.cairo"] == set(range(1, 20))
+    assert data.covered["contract.cairo"] == {2, 3}
+    assert data.line_hits["contract.cairo"] == Counter({2: 5, 3: 1})
+    assert data.function_hits == Counter({MAIN: 6})
+    assert data.branches["contract.cairo"] == {(3, 5)}
+    assert data.branch_hits["contract.cairo"] == Counter({((3, 5), True): 2})
+    assert data.functions == {MAIN: ("contract.cairo", 1, 10)}
+    assert data.function_covered[MAIN] == {2, 3}
+    assert data.inlined_hits == Counter({MAIN: 2})
+    assert [path.name for path in tmp_path.iterdir()] == [".cairo_coverage"]  # No temporary file.
+
+
+def test_combine(tmp_path):
+    paths = []
+    for index, (covered, hits) in enumerate([({2}, {2: 1}), ({3, 4}, {2: 2, 4: 1})]):
+        paths.append(str(tmp_path / f".cairo_coverage.{index}"))
+        write_data(make_data(covered, hits), paths[-1])
+    output = str(tmp_path / ".cairo_coverage")
+    assert main(["combine", "-o", output, *paths]) == 0
+    data = read_data(output)
+    assert data.covered["contract.cairo"] == {2, 3, 4}
+    assert data.line_hits["contract.cairo"] == Counter({2: 3, 4: 1})
+    assert data.function_covered[MAIN] == {2, 3, 4}
+    assert combine(paths, output).covered == data.covered
+
+
+def test_invalid_file(tmp_path):
+    data_file = tmp_path / "invalid"
+    data_file.write_bytes(b"not coverage")
+    with pytest.raises(CoverageDataError):
+        read_data(str(data_file))
+
+
+def test_contexts(tmp_path):
+    paths = []
+    for index, tests in enumerate([("test_a", "test_b"), ("test_b", "test_c")]):
+        data = make_data({2})
+        for test in tests:  # test_b has another id in the second file.
+            data.add_context(test, {"contract.cairo": LineSet({2, 3 + index})})
+        paths.append(str(tmp_path / f".cairo_coverage.{index}"))
+        write_data(data, paths[-1])
+    data = combine(paths, str(tmp_path / ".cairo_coverage"))
+    assert read_data(str(tmp_path / ".cairo_coverage")).line_contexts == data.line_contexts
+    assert data.contexts_of("contract.cairo", 2) == ["test_a", "test_b", "test_c"]
+    assert data.contexts_of("contract.cairo", 3) == ["test_a", "test_b"]
+    assert data.contexts_of("contract.cairo", 4) == ["test_b", "test_c"]
+    names = data.context_names()
+    assert data.contexts_of("contract.cairo", 4, names) == ["test_b", "test_c"]
+    assert data.lines_only_covered_by("test_b") == {}
+    data.add_context("test_d", {"contract.cairo": LineSet({7})})
+    assert data.lines_only_covered_by("test_d") == {"contract.cairo": {7}}
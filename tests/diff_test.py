@@ -0,0 +1,52 @@
+import subprocess
+
+import pytest
+
+from cairo_coverage.__main__ import main
+from cairo_coverage.cairo_coverage import CoverageFile
+from cairo_coverage.data import CoverageData, write_data
+from cairo_coverage.diff import changed_lines, diff_coverage, total_diff_coverage
+from cairo_coverage.lines import LineSet
+
+SOURCE = "func main() {\n    ret;\n}\n"
+CHANGED = "func main() {\n    ret;\n}\n\nfunc new() {\n    ret;\n}\n"
+
+
+@pytest.fixture
+def repo(tmp_path):
+    def git(*args):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    git("init", "-q")
+    (tmp_path / "contract.cairo").write_text(SOURCE)
+    git("add", "contract.cairo")
+    git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "init")
+    (tmp_path / "contract.cairo").write_text(CHANGED)
+    return tmp_path
+
+
+def test_changed_lines(repo):
+    changes = changed_lines("HEAD", cwd=str(repo))
+    assert list(changes.values()) == [{4, 5, 6, 7}]
+
+
+def test_diff_coverage(repo):
+    file = str(repo / "contract.cairo")
+    covered_file = CoverageFile(name=file, covered={2}, statements={2, 6})
+    (diff_file,) = diff_coverage([covered_file], changed_lines("HEAD", cwd=str(repo)))
+    assert diff_file.changed == {6}  # Only the changed lines with code.
+    assert diff_file.missed == {6}
+    assert total_diff_coverage([diff_file]) == 0
+
+
+def test_diff_command(repo, monkeypatch, capsys):
+    monkeypatch.chdir(repo)
+    data = CoverageData()
+    data.statements[str(repo / "contract.cairo")].update({2, 6})
+    data.covered[str(repo / "contract.cairo")].update({2, 6})
+    write_data(data, ".cairo_coverage")
+    assert main(["diff", "--fail-under", "100"]) == 0
+    assert "Total diff coverage: 100.0%" in capsys.readouterr().out
+    data.covered[str(repo / "contract.cairo")] = LineSet({2})
+    write_data(data, ".cairo_coverage")
+    assert main(["diff", "--fail-under", "100"]) == 2
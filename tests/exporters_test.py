@@ -0,0 +1,104 @@
+import json
+from io import StringIO
+from xml.etree import ElementTree
+
+import pytest
+
+from cairo_coverage.__main__ import main
+from cairo_coverage.cairo_coverage import CoverageFile, FunctionCoverage
+from cairo_coverage.data import CoverageData, write_data
+from cairo_coverage.exporters import export, write_cobertura, write_json, write_lcov
+from cairo_coverage.lines import LineSet
+
+
+def make_files():
+    return [
+        CoverageFile(
+            name="contracts/token.cairo",
+            covered={2, 3},
+            statements={2, 3, 5},
+            hits={2: 4, 3: 1},
+            branches={(3, 5)},
+            branch_hits={((3, 5), True): 1},
+            functions=[
+                FunctionCoverage(
+                    name="__main__.mint", line=2, instructions=4, covered=LineSet({0, 1}), steps=5
+                ),
+                FunctionCoverage(name="__main__.burn", line=5, instructions=2, covered=LineSet()),
+            ],
+        ),
+        CoverageFile(name="lib/math.cairo", covered=set(), statements={1}),
+    ]
+
+
+def test_lcov():
+    stream = StringIO()
+    write_lcov(make_files(), stream)
+    token, math, _ = stream.getvalue().split("end_of_record\n")
+    assert token.splitlines() == [
+        "TN:",
+        "SF:contracts/token.cairo",
+        "FN:2,__main__.mint",
+        "FN:5,__main__.burn",
+        "FNDA:5,__main__.mint",
+        "FNDA:0,__main__.burn",
+        "FNF:2",
+        "FNH:1",
+        "BRDA:3,0,0,0",
+        "BRDA:3,0,1,1",
+        "BRF:2",
+        "BRH:1",
+        "DA:2,4",
+        "DA:3,1",
+        "DA:5,0",
+        "LF:3",
+        "LH:2",
+    ]
+    assert "DA:1,0" in math.splitlines()
+
+
+def test_cobertura():
+    stream = StringIO()
+    write_cobertura(make_files(), stream)
+    coverage = ElementTree.fromstring(stream.getvalue())
+    assert coverage.get("lines-valid") == "4"
+    assert coverage.get("lines-covered") == "2"
+    assert [package.get("name") for package in coverage.iter("package")] == ["contracts", "lib"]
+    token = coverage.find(".//class[@filename='contracts/token.cairo']")
+    lines = {line.get("number"): line.attrib for line in token.findall("lines/line")}
+    assert lines["2"]["hits"] == "4"
+    assert lines["3"]["condition-coverage"] == "50% (1/2)"
+    assert lines["5"]["hits"] == "0"
+    assert [method.get("name") for method in token.iter("method")] == [
+        "__main__.mint",
+        "__main__.burn",
+    ]
+
+
+def test_json():
+    stream = StringIO()
+    write_json(make_files(), stream)
+    report = json.loads(stream.getvalue())
+    token = report["files"]["contracts/token.cairo"]
+    assert token["missing_lines"] == [5]
+    assert token["hits"] == {"2": 4, "3": 1}
+    assert token["branches"] == [{"line": 3, "column": 5, "not_taken": 0, "taken": 1}]
+    assert token["functions"]["__main__.mint"]["percent_covered"] == 50
+    assert report["totals"]["num_statements"] == 4
+    assert report["totals"]["percent_covered"] == 50
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export(make_files(), "html", "-")
+
+
+def test_export_command(tmp_path):
+    data = CoverageData()
+    data.statements["contract.cairo"].update({1, 2})
+    data.covered["contract.cairo"].update({1})
+    data_file = str(tmp_path / ".cairo_coverage")
+    write_data(data, data_file)
+    output = tmp_path / "coverage.lcov"
+    assert main(["lcov", data_file, "-o", str(output)]) == 0
+    assert "DA:2,0" in output.read_text().splitlines()
@@ -0,0 +1,21 @@
+from cairo_coverage.filters import FileFilter, file_filter
+
+
+def test_include_and_omit():
+    measured = FileFilter(include=["*/contracts/*"], omit=["*/contracts/mocks/*"])
+    assert measured("/project/contracts/token.cairo")
+    assert not measured("/project/contracts/mocks/token.cairo")
+    assert not measured("/project/lib/math.cairo")
+    assert not measured("/project/contracts/autogen/token.cairo")  # Generated by the compiler.
+    assert FileFilter()("/project/lib/math.cairo")
+
+
+def test_excluding_substrings():
+    measured = FileFilter.excluding(["openzeppelin", "[mock]"])
+    assert not measured("/lib/openzeppelin/token.cairo")
+    assert not measured("/tests/[mock]/token.cairo")
+    assert measured("/tests/m/token.cairo")
+
+
+def test_filters_are_compiled_once():
+    assert file_filter(("*.cairo",), ()) is file_filter(("*.cairo",), ())
@@ -0,0 +1,62 @@
+from cairo_coverage.__main__ import main
+from cairo_coverage.cairo_coverage import CoverageFile
+from cairo_coverage.data import CoverageData, write_data
+from cairo_coverage.html_report import page_name, write_html
+
+SOURCE = "func main() {\n    let a = 1;\n    if (a == 0) {\n        return ();\n    }\n}\n"
+
+
+def make_files(tmp_path, covered=frozenset({2, 3})):
+    source = tmp_path / "main.cairo"
+    source.write_text(SOURCE)
+    return [
+        CoverageFile(
+            name=str(source),
+            covered=set(covered),
+            statements={2, 3, 4},
+            hits={2: 3, 3: 3},
+            branches={(3, 5)},
+            branch_hits={((3, 5), False): 3},
+            contexts={2: ["test_main"]},
+        ),
+        CoverageFile(name="<string>", covered=set(), statements={1}),  # No source on disk.
+    ]
+
+
+def test_pages(tmp_path):
+    files = make_files(tmp_path)
+    report = tmp_path / "htmlcov"
+    assert sorted(write_html(files, str(report))) == sorted(file.name for file in files)
+    page = (report / page_name(files[0])).read_text()
+    assert '<tr class="run" title="test_main"><td class="n">2</td><td class="h">3</td>' in page
+    assert '<tr class="par"><td class="n">3</td>' in page  # The jump is never taken.
+    assert '<tr class="mis"><td class="n">4</td><td class="h"></td><td>' in page
+    assert "if (a == 0) {" in page
+    assert '<td class="n">1</td>' in (report / page_name(files[1])).read_text()
+    index = (report / "index.html").read_text()
+    assert f'href="{page_name(files[0])}"' in index
+    assert "Cairo coverage: 50.0%" in index
+
+
+def test_only_changed_files_are_rendered(tmp_path):
+    report = str(tmp_path / "htmlcov")
+    write_html(make_files(tmp_path), report, jobs=2)
+    assert write_html(make_files(tmp_path), report) == []
+    files = make_files(tmp_path, covered={2, 3, 4})
+    assert write_html(files, report) == [files[0].name]  # Coverage changed.
+    (tmp_path / "main.cairo").write_text(SOURCE.replace("a == 0", "a == 2") + "\n")
+    assert write_html(files, report) == [files[0].name]  # Source changed.
+    assert "if (a == 2) {" in (tmp_path / "htmlcov" / page_name(files[0])).read_text()
+    assert write_html(files[:1], report) == []
+    assert not (tmp_path / "htmlcov" / page_name(files[1])).exists()  # No longer reported.
+
+
+def test_html_command(tmp_path):
+    data = CoverageData()
+    data.statements["contract.cairo"].update({1, 2})
+    data.covered["contract.cairo"].update({1})
+    data_file = str(tmp_path / ".cairo_coverage")
+    write_data(data, data_file)
+    report = tmp_path / "htmlcov"
+    assert main(["html", data_file, "-d", str(report)]) == 0
+    assert "contract.cairo" in (report / "index.html").read_text()
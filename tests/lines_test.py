@@ -0,0 +1,26 @@
+from cairo_coverage.lines import LineSet, format_ranges
+
+
+def test_set_operations():
+    statements = LineSet(range(10, 41))
+    covered = LineSet({10, 11, 20})
+    covered.update(range(30, 36))
+    missed = statements - covered
+    assert len(missed) == 31 - 9
+    assert 12 in missed and 20 not in missed
+    assert list(covered) == [10, 11, 20, 30, 31, 32, 33, 34, 35]
+    assert covered | missed == statements
+    assert covered & statements == covered
+    assert covered == {10, 11, 20, *range(30, 36)}
+
+
+def test_ranges():
+    lines = LineSet({1, 2, 3, 7, 9, 10, 64, 65})
+    assert lines.ranges() == [(1, 3), (7, 7), (9, 10), (64, 65)]
+    assert format_ranges(lines.ranges()) == "1-3, 7, 9-10, 64-65"
+    assert LineSet().ranges() == []
+
+
+def test_bytes_round_trip():
+    lines = LineSet({0, 1, 7, 8, 63, 1000})
+    assert LineSet.from_bytes(lines.to_bytes()) == lines
@@ -0,0 +1,155 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.cairo_coverage import NOTHING_MEASURED
+from cairo_coverage.data import CoverageData, data_to_bytes, merge_bytes, read_data
+from cairo_coverage.plugin import WORKER_OUTPUT_KEY
+
+pytest_plugins = ["pytester"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEST_FILE = '''
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+
+PROGRAM = """
+func is_zero(n: felt) -> (res: felt) {
+    if (n == 0) {
+        return (res=1);
+    }
+    return (res=0);
+}
+"""
+program = compile_cairo([(PROGRAM, "is_zero.cairo")], prime=DEFAULT_PRIME, debug_info=True)
+
+
+def test_zero():
+    CairoFunctionRunner(program, layout="plain").run("is_zero", 0)
+
+
+def test_not_zero():
+    CairoFunctionRunner(program, layout="plain").run("is_zero", 1)
+'''
+
+
+@pytest.fixture
+def cairo_tests(pytester, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+    pytester.makepyfile(test_is_zero=TEST_FILE)
+    return pytester
+
+
+def test_plugin_reports_the_session(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p", "cairo_coverage.plugin", "--cairo-cov", "--cairo-cov-fail-under=100"
+    )
+    result.assert_outcomes(passed=2)
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(["Total cairo coverage: 100.0%"])
+
+
+def test_plugin_fail_under(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p", "cairo_coverage.plugin", "--cairo-cov", "--cairo-cov-fail-under=100", "-k", "not_zero"
+    )
+    result.assert_outcomes(passed=1, deselected=1)
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+    result.stdout.fnmatch_lines(["FAIL Required cairo coverage of 100.0% not reached."])
+
+
+def test_plugin_file_fail_under(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p",
+        "cairo_coverage.plugin",
+        "--cairo-cov",
+        "--cairo-cov-file-fail-under=*.cairo=100",
+        "-k",
+        "not_zero",
+    )
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+    result.stdout.fnmatch_lines(["FAIL *.cairo: coverage of *% is under 100.0% (*.cairo)."])
+
+
+def test_plugin_fails_when_nothing_was_measured(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p",
+        "cairo_coverage.plugin",
+        "--cairo-cov",
+        "--cairo-cov-fail-under=0",
+        "--cairo-cov-omit=*",
+    )
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+    result.stdout.fnmatch_lines([f"FAIL {NOTHING_MEASURED}"])
+    result.stdout.no_fnmatch_line("Total cairo coverage*")
+    result = cairo_tests.runpytest_subprocess(
+        "-p", "cairo_coverage.plugin", "--cairo-cov", "--cairo-cov-omit=*"
+    )
+    assert result.ret == 0  # No threshold to fail, only the reason of the missing total.
+    result.stdout.fnmatch_lines([NOTHING_MEASURED])
+    result.stdout.no_fnmatch_line("Total cairo coverage*")
+
+
+def test_plugin_merges_xdist_workers(cairo_tests):
+    pytest.importorskip("xdist")
+    result = cairo_tests.runpytest_subprocess(
+        "-p", "cairo_coverage.plugin", "--cairo-cov", "--cairo-cov-fail-under=100", "-n", "2"
+    )
+    result.assert_outcomes(passed=2)
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(["Total cairo coverage: 100.0%"])
+
+
+def test_plugin_merges_the_worker_output(pytester):
+    """The xdist hooks of the plugin, without xdist."""
+    config = pytester.parseconfigure("-p", "cairo_coverage.plugin", "--cairo-cov")
+    plugin = config.pluginmanager.get_plugin("cairo_coverage_session")
+    worker = CoverageData()
+    worker.statements["contract.cairo"].update({1, 2})
+    worker.covered["contract.cairo"].update({2})
+    try:
+        node = SimpleNamespace(workeroutput={WORKER_OUTPUT_KEY: data_to_bytes(worker)})
+        plugin.pytest_testnodedown(node, None)
+        plugin.pytest_testnodedown(SimpleNamespace(), "crashed")  # No output to merge.
+        assert cairo_coverage.collected_data().covered == {"contract.cairo": {2}}
+        plugin.is_worker = True  # Sends the merged coverage like a worker.
+        config.workeroutput = {}
+        plugin.pytest_sessionfinish(None)
+        sent = merge_bytes(CoverageData(), config.workeroutput[WORKER_OUTPUT_KEY])
+        assert sent.statements == {"contract.cairo": {1, 2}}
+        assert sent.covered == {"contract.cairo": {2}}
+    finally:
+        cairo_coverage.reset()
+
+
+def test_plugin_writes_reports(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p",
+        "cairo_coverage.plugin",
+        "--cairo-cov",
+        "--cairo-cov-report=xml:coverage.xml",
+        "--cairo-cov-report=lcov",
+        "--cairo-cov-report=html",
+    )
+    assert result.ret == 0
+    assert "is_zero.cairo" in (cairo_tests.path / "htmlcov" / "index.html").read_text()
+    assert (cairo_tests.path / "coverage.xml").read_text().startswith("<?xml")
+    assert "SF:is_zero.cairo" in (cairo_tests.path / "coverage.lcov").read_text()
+
+
+def test_plugin_records_the_tests_of_each_line(cairo_tests):
+    result = cairo_tests.runpytest_subprocess(
+        "-p",
+        "cairo_coverage.plugin",
+        "--cairo-cov",
+        "--cairo-cov-contexts",
+        "--cairo-cov-data-file=.cairo_coverage",
+    )
+    assert result.ret == 0
+    data = read_data(str(cairo_tests.path / ".cairo_coverage"))
+    assert data.contexts_of("is_zero.cairo", 4) == ["test_is_zero.py::test_zero"]
+    assert data.contexts_of("is_zero.cairo", 6) == ["test_is_zero.py::test_not_zero"]
@@ -0,0 +1,123 @@
+import gc
+
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.starknet.compiler.compile import compile_starknet_files
+
+from cairo_coverage import program_index
+from cairo_coverage.config import configure
+from cairo_coverage.data import CoverageData
+from cairo_coverage.program_index import ProgramIndexCache, innermost_function
+
+PROGRAM = """
+func add(a: felt, b: felt) -> (res: felt) {
+    return (res=a + b);
+}
+"""
+
+STARKNET_CONTRACT = """
+%lang starknet
+
+@view
+func get(a: felt) -> (res: felt) {
+    return (res=a * 2);
+}
+"""
+
+
+def compile_program(code: str = PROGRAM):
+    return compile_cairo([(code, "program.cairo")], prime=DEFAULT_PRIME, debug_info=True)
+
+
+def test_index_is_built_once_per_program():
+    cache = ProgramIndexCache()
+    index = cache.get(compile_program())
+    assert cache.get(compile_program()) is index
+    assert index.statements["program.cairo"] == {3}
+    assert all(file == "program.cairo" for spans in index.pc_lines.values() for file, _ in spans)
+
+
+def test_same_bytecode_in_other_sources():
+    cache = ProgramIndexCache()
+    first = cache.get(compile_cairo([(PROGRAM, "a.cairo")], prime=DEFAULT_PRIME, debug_info=True))
+    shifted = compile_cairo(
+        [("// A.\n// B.\n// C.\n" + PROGRAM, "b.cairo")], prime=DEFAULT_PRIME, debug_info=True
+    )
+    assert shifted.data == compile_program().data
+    second = cache.get(shifted)
+    assert second is not first
+    assert first.statements == {"a.cairo": {3}}
+    assert second.statements == {"b.cairo": {6}}
+
+
+def test_alternating_programs_are_hashed_once(monkeypatch):
+    keys = []
+    monkeypatch.setattr(
+        program_index, "program_key", lambda program: keys.append(program) or len(keys)
+    )
+    cache = ProgramIndexCache()
+    account, target = compile_program(), compile_program(PROGRAM + "// Target.\n")
+    for _ in range(3):  # Not the last program asked for every other time.
+        cache.get(account)
+        cache.get(target)
+    assert keys == [account, target]
+    del account, keys[:]
+    gc.collect()
+    assert len(cache.keys) == 1  # Dropped with its program.
+
+
+def test_index_cache_is_bounded():
+    cache = ProgramIndexCache(max_size=1)
+    first = compile_program()
+    cache.get(first)
+    cache.get(compile_program(PROGRAM + "func noop() {\n    return ();\n}\n"))
+    assert len(cache.indexes) == 1
+    assert cache.get(first) is not None
+    assert len(cache.indexes) == 1
+
+
+def test_wrapper_is_attributed_to_its_function(tmp_path):
+    source = tmp_path / "contract.cairo"  # The declaration of the function is read in the source.
+    source.write_text(STARKNET_CONTRACT)
+    contract = compile_starknet_files([str(source)], debug_info=True, disable_hint_validation=True)
+    index = ProgramIndexCache().get(contract.program)
+    assert index.functions["__main__.get"].file == str(source)
+    wrapper_pcs = [
+        pc for pc, function in index.pc_functions.items() if function == "__wrappers__.get"
+    ]
+    assert wrapper_pcs
+    assert {index.pc_parents.get(pc) for pc in wrapper_pcs} == {"__main__.get"}
+    assert not any(index.pc_functions[pc] == "__main__.get" for pc in index.pc_parents)
+
+
+def test_innermost_function():
+    bounds = sorted([(1, 20, "outer"), (3, 5, "a"), (8, 12, "b"), (9, 10, "inner"), (30, 31, "c")])
+    assert innermost_function(bounds, 4) == "a"
+    assert innermost_function(bounds, 9) == "inner"
+    assert innermost_function(bounds, 11) == "b"
+    assert innermost_function(bounds, 15) == "outer"
+    assert innermost_function(bounds, 25) is None
+
+
+def test_omitted_files_are_not_indexed():
+    library = "func double(a: felt) -> (res: felt) {\n    return (res=a * 2);\n}\n"
+    program = compile_cairo(
+        [(library, "lib/double.cairo"), (PROGRAM, "program.cairo")],
+        prime=DEFAULT_PRIME,
+        debug_info=True,
+    )
+    cache = ProgramIndexCache()
+    full = cache.get(program)
+    assert set(full.statements) == {"lib/double.cairo", "program.cairo"}
+    configure(omit=["lib/*"])
+    try:
+        index = cache.get(program)
+    finally:
+        configure(omit=[])
+    assert index is not full  # Indexed again for the filter.
+    assert set(index.statements) == {"program.cairo"}
+    assert set(index.functions) == {"__main__.add"}
+    run = CoverageData()
+    index.cover(b"\x01" * len(program.data), run)  # The pcs of the library are masked.
+    assert set(run.covered) == {"program.cairo"}
+    assert set(run.function_covered) == {("program.cairo", "__main__.add")}
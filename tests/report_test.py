@@ -0,0 +1,127 @@
+from io import StringIO
+
+import pytest
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.__main__ import main
+from cairo_coverage.cairo_coverage import (
+    CoverageFile,
+    NOTHING_MEASURED,
+    CoverageThresholdError,
+    Layout,
+    print_sum,
+    wrap_ranges,
+)
+from cairo_coverage.data import CoverageData, write_data
+from cairo_coverage.lines import LineSet
+
+
+def make_files():
+    return [
+        CoverageFile(name="contracts/a.cairo", covered={1, 2}, statements={1, 2}),
+        CoverageFile(
+            name="contracts/" + "very_long_directory/" * 5 + "b.cairo",
+            covered=LineSet(range(0, 2000, 2)),
+            statements=LineSet(range(2000)),
+        ),
+        CoverageFile(name="contracts/c.cairo", covered={1}, statements={1, 2, 3}),
+    ]
+
+
+def render(**options) -> str:
+    stream = StringIO()
+    print_sum(make_files(), stream=stream, **options)
+    return stream.getvalue()
+
+
+def test_wrap_ranges():
+    ranges = [(1, 1), (3, 10), (12, 12), (20, 30)]
+    assert list(wrap_ranges(ranges, 80)) == ["1, 3-10, 12, 20-30"]
+    assert list(wrap_ranges(ranges, 10)) == ["1, 3-10,", "12, 20-30"]
+
+
+def test_rows_fit_the_width():
+    output = render(width=60)
+    assert "\033[" not in output  # Not a terminal, no colors.
+    assert all(len(line) <= 60 for line in output.splitlines())
+    assert "[...]" in output  # The long name is cropped.
+    assert "1999" in output  # The missed lines are wrapped, not cut.
+    layout = Layout.of(make_files(), 60)
+    assert layout.name + layout.covered + layout.missed + layout.lines + 3 == 60
+
+
+@pytest.mark.parametrize(
+    "sort, expected",
+    [("name", ["a", "c", "b"]), ("cover", ["c", "b", "a"]), ("missed", ["b", "c", "a"])],
+)
+def test_sort(sort, expected):
+    rows = [line for line in render(width=200, sort=sort).splitlines() if ".cairo" in line]
+    assert [row.split(".cairo")[0][-1] for row in rows] == expected
+
+
+def test_skip_covered():
+    output = render(width=200, skip_covered=True)
+    assert "a.cairo" not in output
+    assert "1 files skipped, fully covered." in output
+
+
+def test_unknown_sort():
+    with pytest.raises(ValueError):
+        render(sort="size")
+
+
+def make_data() -> CoverageData:
+    data = CoverageData()
+    for file in make_files():
+        data.statements[file.name].update(file.statements)
+        data.covered[file.name].update(file.covered)
+    return data
+
+
+def test_summary_only():
+    cairo_coverage.reset()
+    cairo_coverage.collected_data().update(make_data())
+    summary = cairo_coverage.report_runs(print_summary=False, summary_only=True)
+    assert (summary.nb_covered, summary.nb_statements) == (1003, 2005)
+    assert summary.files["contracts/c.cairo"] == (1, 3)
+    assert not cairo_coverage.collected_data().covered  # Reset like the full report.
+
+
+@pytest.mark.parametrize("summary_only", [False, True])
+def test_thresholds(summary_only):
+    cairo_coverage.reset()
+    cairo_coverage.collected_data().update(make_data())
+    cairo_coverage.configure(fail_under=40, file_fail_under={"contracts/c*": 50, "*/a.*": 100})
+    try:
+        with pytest.raises(CoverageThresholdError) as error:
+            cairo_coverage.report_runs(print_summary=False, summary_only=summary_only)
+    finally:
+        cairo_coverage.configure(fail_under=None, file_fail_under={})
+    assert error.value.failures == [
+        "contracts/c.cairo: coverage of 33.3% is under 50% (contracts/c*)."
+    ]
+
+
+@pytest.mark.parametrize("summary_only", [False, True])
+def test_thresholds_fail_when_nothing_was_measured(summary_only):
+    cairo_coverage.reset()
+    cairo_coverage.configure(fail_under=0)
+    try:
+        with pytest.raises(CoverageThresholdError) as error:
+            cairo_coverage.report_runs(print_summary=False, summary_only=summary_only)
+    finally:
+        cairo_coverage.configure(fail_under=None)
+    assert error.value.failures == [NOTHING_MEASURED]
+
+
+def test_report_command_thresholds(tmp_path, capsys):
+    data_file = str(tmp_path / ".cairo_coverage")
+    write_data(make_data(), data_file)
+    assert main(["report", data_file, "--summary-only", "--fail-under", "50"]) == 0
+    assert "Total cairo coverage: 50.0% (1003/2005 lines)" in capsys.readouterr().out
+    assert main(["report", data_file, "--summary-only", "--fail-under", "60"]) == 2
+    assert main(["report", data_file, "--file-fail-under", "*/c.cairo=50"]) == 2
+    assert "FAIL contracts/c.cairo" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["report", data_file, "--file-fail-under", "contracts/c.cairo"])
+    assert "Expected GLOB=MIN, got 'contracts/c.cairo'." in capsys.readouterr().err
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.cairo.lang.vm.vm_exceptions import VmException
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.__main__ import main
+from cairo_coverage.config import configure
+from cairo_coverage.data import read_data
+from cairo_coverage.program_index import index_cache
+from cairo_coverage.runner import CoverageRunner
+
+PROGRAM = """
+func main() {
+    alloc_locals;
+    local n;
+    %{ ids.n = program_input["n"] %}
+    if (n == 0) {
+        return ();
+    }
+    assert n = 1;
+    return ();
+}
+"""
+
+
+def compile_program():
+    return compile_cairo([(PROGRAM, "main.cairo")], prime=DEFAULT_PRIME, debug_info=True)
+
+
+@pytest.fixture
+def program_file(tmp_path):
+    path = tmp_path / "program.json"
+    program = compile_program()
+    path.write_text(json.dumps(program.Schema().dump(program)))
+    return str(path)
+
+
+def test_batch_shares_the_index(program_file):
+    cairo_coverage.reset()
+    runner = CoverageRunner.load(program_file)
+    assert index_cache.get(runner.program) is runner.index
+    runner.run({"n": 0})
+    assert 8 not in cairo_coverage.collected_data().covered["main.cairo"]
+    results = list(runner.run_batch([{"n": 1}, {"n": 2}]))
+    assert results[0] == (0, None)
+    assert isinstance(results[1][1], VmException)  # The coverage of the failed run is kept.
+    assert runner.runs == 3
+    files = cairo_coverage.report_runs(print_summary=False)
+    assert files[0].missed == set()
+
+
+def test_hit_counts(program_file):
+    cairo_coverage.reset()
+    configure(count_hits=True)
+    try:
+        list(CoverageRunner.load(program_file).run_batch([{"n": 0}, {"n": 0}, {"n": 1}]))
+    finally:
+        configure(count_hits=False)
+    hits = cairo_coverage.collected_data().line_hits["main.cairo"]
+    assert hits[6] == 3
+    assert hits[9] == 1
+    cairo_coverage.reset()
+
+
+def test_program_without_debug_info():
+    program = compile_cairo([(PROGRAM, "main.cairo")], prime=DEFAULT_PRIME, debug_info=False)
+    with pytest.raises(ValueError, match="no debug info"):
+        CoverageRunner(program)
+
+
+def test_run_command(program_file, tmp_path, capsys):
+    inputs = tmp_path / "inputs.jsonl"
+    inputs.write_text('{"n": 0}\n{"n": 2}\n')
+    data_file = str(tmp_path / ".cairo_coverage")
+    assert main(["run", program_file, str(inputs), "-o", data_file]) == 1
+    assert "Input 1 failed" in capsys.readouterr().out
+    assert read_data(data_file).covered["main.cairo"]
+    cairo_coverage.reset()
@@ -0,0 +1,45 @@
+import pytest
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.config import configure
+from cairo_coverage.sampling import estimate
+
+
+def run_loops(program, sample_every: int):
+    cairo_coverage.reset()
+    configure(count_hits=True, sample_every=sample_every)
+    try:
+        with cairo_coverage.covering():
+            for n in range(1, 10):
+                CairoFunctionRunner(program, layout="plain").run("loop", n)
+    finally:
+        configure(count_hits=False, sample_every=1)
+
+
+def test_estimate():
+    hit_estimate = estimate(sampled=4, squares=1 + 9, nb_sampled=2, nb_runs=4)  # Hits 1 and 3.
+    assert hit_estimate.hits == 8
+    assert hit_estimate.error == pytest.approx(4 * 0.5 ** 0.5)
+    assert hit_estimate.low == 4  # At least the hits seen.
+    assert estimate(sampled=4, squares=10, nb_sampled=2, nb_runs=2).error == 0
+
+
+def test_sampled_hits_are_estimated(loop_program):
+    run_loops(loop_program, sample_every=1)
+    assert cairo_coverage.estimated_hits() == {}  # Every run is recorded.
+    total = cairo_coverage.collected_data().line_hits["loop.cairo"][6]
+    run_loops(loop_program, sample_every=3)
+    session = cairo_coverage.collected_data()
+    assert session.runs == {"all": 9, "sampled": 3}
+    assert session.line_hits["loop.cairo"][6] < total
+    hit_estimate = cairo_coverage.estimated_hits()["loop.cairo"][6]
+    assert hit_estimate.error > 0
+    assert hit_estimate.low <= total <= hit_estimate.high
+    cairo_coverage.reset()
+
+
+def test_invalid_sample_every():
+    with pytest.raises(ValueError):
+        configure(sample_every=0)
@@ -0,0 +1,45 @@
+import multiprocessing
+
+import pytest
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.shared import shared_hits
+
+
+@pytest.fixture(autouse=True)
+def coverage():
+    with cairo_coverage.covering():
+        yield
+
+
+def run_loop(program, iterations: int):
+    CairoFunctionRunner(program, layout="plain").run("loop", iterations)
+    assert not cairo_coverage.collected_data().covered  # Nothing to send back to the parent.
+
+
+@pytest.mark.parametrize("count_hits", [False, True])
+def test_forked_workers_share_their_pcs(tmp_path, count_hits, loop_program):
+    cairo_coverage.reset()
+    cairo_coverage.configure(shared_hits=str(tmp_path), count_hits=count_hits, branches=True)
+    try:
+        workers = [
+            multiprocessing.get_context("fork").Process(target=run_loop, args=(loop_program, n))
+            for n in (0, 2)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert [worker.exitcode for worker in workers] == [0, 0]
+        assert cairo_coverage.load_shared() == 1
+        (coverage_file,) = cairo_coverage.report_runs(print_summary=False)
+    finally:
+        cairo_coverage.configure(shared_hits=None, count_hits=False, branches=False)
+        shared_hits(str(tmp_path)).clear()
+    assert coverage_file.covered == coverage_file.statements  # Both ways of the if ran.
+    assert coverage_file.nb_branches_covered == 2
+    assert sorted(coverage_file.branch_hits.values()) == [2, 2]  # n == 0 twice, n != 0 twice.
+    if count_hits:
+        assert coverage_file.hits[3] == 1 + 3  # jnz, run n + 1 times by each worker.
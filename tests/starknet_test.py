@@ -12,6 +12,12 @@ from cairo_coverage import cairo_coverage
 CONTRACT_FILE = os.path.join(os.path.dirname(__file__), "test.cairo")
 
 
+@pytest.fixture(autouse=True)
+def coverage():
+    with cairo_coverage.covering():
+        yield
+
+
 @pytest_asyncio.fixture
 async def starknet() -> Starknet:
     return await Starknet.empty()
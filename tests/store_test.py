@@ -0,0 +1,41 @@
+from cairo_coverage.data import CoverageData
+from cairo_coverage.store import CoverageStore, source_hash
+
+
+def make_data(file: str, covered) -> CoverageData:
+    data = CoverageData()
+    data.statements[file].update({1, 2, 3})
+    data.covered[file].update(covered)
+    data.functions[(file, "__main__.main")] = (file, 1, 4)
+    return data
+
+
+def test_unchanged_files_are_reused(tmp_path):
+    source = tmp_path / "contract.cairo"
+    source.write_text("func main() {\n    ret;\n}\n")
+    store = CoverageStore(str(tmp_path / "store"))
+    assert store.save(make_data(str(source), {1})) == [str(source)]
+    store.save(make_data(str(source), {2}))  # Added to what the first run covered.
+    data = CoverageData()
+    assert store.load(data) == [str(source)]
+    assert data.covered[str(source)] == {1, 2}
+    assert data.functions[(str(source), "__main__.main")][0] == str(source)
+    assert list(store.entries()) == [source_hash(str(source))]
+
+
+def test_changed_files_are_not_reused(tmp_path):
+    source = tmp_path / "contract.cairo"
+    source.write_text("func main() {\n    ret;\n}\n")
+    store = CoverageStore(str(tmp_path / "store"))
+    store.save(make_data(str(source), {1}))
+    source.write_text("func main() {\n    ret;\n}\n\nfunc other() {\n    ret;\n}\n")
+    data = CoverageData()
+    assert store.load(data) == []
+    assert not data.covered
+    assert store.prune() == 1
+    assert not store.entries()
+
+
+def test_files_not_on_disk_are_not_stored(tmp_path):
+    store = CoverageStore(str(tmp_path / "store"))
+    assert store.save(make_data("compiled_from_a_string.cairo", {1})) == []
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+
+from cairo_coverage import cairo_coverage
+from cairo_coverage.config import Collection, configure
+from cairo_coverage.program_index import ProgramIndex
+from cairo_coverage.shared import program_name
+from cairo_coverage.telemetry import program_label
+
+
+@pytest.fixture(autouse=True)
+def timed():
+    cairo_coverage.reset()
+    cairo_coverage.reset_stats()
+    configure(telemetry=True)
+    with cairo_coverage.covering():
+        yield
+    configure(telemetry=False, telemetry_file=None, collection=Collection.WRAP)
+    cairo_coverage.reset()
+    cairo_coverage.reset_stats()
+
+
+def run_loops(program, nb_runs: int):
+    for _ in range(nb_runs):
+        CairoFunctionRunner(program, layout="plain").run("loop", 5)
+
+
+@pytest.mark.parametrize("collection", [Collection.WRAP, Collection.TRACE])
+def test_stats(collection, loop_program):
+    configure(collection=collection)
+    run_loops(loop_program, 2)
+    stats = cairo_coverage.stats()
+    assert list(stats["vms"].values()) == [2]
+    assert list(stats["vms"])[0].startswith("loop.cairo")
+    assert stats["cover_file_calls"] == 2
+    assert stats["steps"] > 0
+    assert stats["pcs_resolved"] > 0
+    assert 0 < stats["base_instruction_s"] <= stats["instruction_s"]
+    assert stats["cover_file_mean_s"] <= stats["cover_file_max_s"]
+    assert stats["accumulator"]["programs"] == 1
+    assert stats["accumulator"]["files"] == 1
+
+
+def test_stats_leave_the_pending_pcs_to_the_report(loop_program):
+    configure(report_jobs=1)
+    try:
+        run_loops(loop_program, 2)
+        stats = cairo_coverage.stats()
+        assert stats["accumulator"]["pending_programs"] == 1
+        assert stats["accumulator"]["covered_lines"] == 0  # Not mapped to lines yet.
+        assert cairo_coverage.current_session.get().pending_pcs
+    finally:
+        configure(report_jobs=0)
+
+
+def test_stats_are_dumped_by_report_runs(tmp_path, loop_program):
+    output = tmp_path / "telemetry.json"
+    configure(telemetry_file=str(output))
+    run_loops(loop_program, 1)
+    cairo_coverage.report_runs(print_summary=False)
+    stats = json.loads(output.read_text())
+    assert stats["cover_file_calls"] == 1
+    assert stats["accumulator"]["covered_lines"] > 0
+
+
+def test_program_label_is_stable(loop_program):
+    index = ProgramIndex.from_program(loop_program)
+    assert program_label(index) == f"loop.cairo (1 files, {program_name(index)[:8]})"